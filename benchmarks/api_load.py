@@ -0,0 +1,109 @@
+"""Load test the artist routes through the sync threadpool and the async path.
+
+Usage: PYTHONPATH=src python benchmarks/api_load.py [--requests N] [--concurrency C]
+
+The async path is the real `bc_agent.api.app`, whose routes await the
+dedicated database executor. The sync path is an app with the same routes
+written as plain `def` functions, which FastAPI runs in its default
+threadpool. Both are driven in-process through httpx's ASGI transport.
+"""
+import argparse
+import asyncio
+import os
+import random
+import statistics
+import sys
+import tempfile
+import time
+
+import httpx
+from fastapi import FastAPI, HTTPException
+
+from bc_agent import artists
+from bc_agent.db import sqlite_db
+from bc_agent.fastjson import FastJSONResponse, as_dicts
+
+ARTISTS = 2000
+
+
+def make_sync_app(db_name):
+    app = FastAPI()
+
+    @app.get("/artists")
+    def list_artists():
+        return FastJSONResponse(as_dicts(artists.list_artists(db_name)))
+
+    @app.get("/artists/{artist_id}")
+    def get_artist(artist_id: int):
+        artist = artists.get_artist(db_name, artist_id)
+        if artist is None:
+            raise HTTPException(status_code=404)
+        return artist
+
+    return app
+
+
+async def run_load(app, paths, total, concurrency):
+    latencies = []
+    slots = asyncio.Semaphore(concurrency)
+    transport = httpx.ASGITransport(app=app)
+    async with httpx.AsyncClient(
+        transport=transport, base_url="http://bench"
+    ) as client:
+
+        async def one(path):
+            async with slots:
+                start = time.perf_counter()
+                response = await client.get(path)
+                latencies.append(time.perf_counter() - start)
+                response.raise_for_status()
+
+        start = time.perf_counter()
+        await asyncio.gather(*(one(random.choice(paths)) for _ in range(total)))
+        elapsed = time.perf_counter() - start
+
+    latencies.sort()
+    return {
+        "p50": statistics.median(latencies) * 1000,
+        "p99": latencies[int(len(latencies) * 0.99) - 1] * 1000,
+        "rps": total / elapsed,
+    }
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[0])
+    parser.add_argument("--requests", type=int, default=2000)
+    parser.add_argument("--concurrency", type=int, default=100)
+    args = parser.parse_args()
+
+    tmp = tempfile.mkdtemp()
+    os.chdir(tmp)  # the api module expects bandcamp.db in the working directory
+    from bc_agent.music_data import DB_NAME
+
+    with sqlite_db(DB_NAME) as conn:
+        conn.executemany(
+            "INSERT INTO artists (id, nickname) VALUES (?, ?)",
+            ((i, f"artist{i}") for i in range(1, ARTISTS + 1)),
+        )
+    from bc_agent.api import app as async_app
+
+    # (paths, share of --requests), listing all artists is a lot slower
+    scenarios = {
+        "get artist": ([f"/artists/{i}" for i in range(1, ARTISTS + 1)], 1),
+        "list artists": (["/artists"], 0.1),
+    }
+    apps = {"sync": make_sync_app(DB_NAME), "async": async_app}
+    print(f"{args.requests} requests, {args.concurrency} concurrent, {ARTISTS} artists")
+    print(f"{'scenario':<14}{'path':<7}{'p50':>10}{'p99':>10}{'req/s':>10}")
+    for scenario, (paths, share) in scenarios.items():
+        total = int(args.requests * share)
+        for name, app in apps.items():
+            stats = asyncio.run(run_load(app, paths, total, args.concurrency))
+            print(
+                f"{scenario:<14}{name:<7}{stats['p50']:>8.1f}ms{stats['p99']:>8.1f}ms"
+                f"{stats['rps']:>10.0f}"
+            )
+
+
+if __name__ == "__main__":
+    sys.exit(main())
@@ -0,0 +1,113 @@
+"""Crawl throughput against a local stub of bandcamp.com.
+
+Usage: PYTHONPATH=src python benchmarks/crawl.py [--concurrency 1 8] [...]
+
+Starts `stub_server.StubServer`, registers its artists in a fresh database
+and runs `update_releases_db()` once per concurrency level, followed by a
+second run in which every artist page answers 304. Reports pages and
+releases per second, the time spent writing to the database and the peak
+memory of the crawl. Each run happens in a child process, so the peak RSS is
+its own and the stub server does not compete with the crawler for the GIL.
+See `stub_server.py --help` for the catalogue and server options.
+"""
+import argparse
+import logging
+import multiprocessing
+import resource
+import sys
+import tempfile
+import time
+from pathlib import Path
+
+from stub_server import add_arguments, from_arguments
+
+from bc_agent import music_data
+from bc_agent.artists import create_artists
+from bc_agent.db import close_connections, sqlite_db
+
+
+def run_crawl(artist_url, db_name, concurrency, verbose, results):
+    """Crawl in a child process and put its measurements on `results`."""
+    if not verbose:
+        logging.getLogger().setLevel(logging.CRITICAL)
+    music_data.ARTIST_URL = artist_url
+    music_data.DB_NAME = db_name
+    start = time.perf_counter()
+    summary = music_data.update_releases_db(
+        concurrency=concurrency, per_host=concurrency, force=True
+    )
+    elapsed = time.perf_counter() - start
+    with sqlite_db(db_name) as conn:
+        releases = conn.execute("SELECT COUNT(*) FROM releases").fetchone()[0]
+    results.put(
+        {
+            "elapsed": elapsed,
+            "releases": releases,
+            "write": summary["metrics"].get("bc_db_write_seconds_sum", 0.0),
+            # ru_maxrss is in KiB on Linux
+            "peak": resource.getrusage(resource.RUSAGE_SELF).ru_maxrss / 1024,
+        }
+    )
+
+
+def crawl(stub, db_name, concurrency, verbose):
+    stub.reset_stats()
+    results = multiprocessing.Queue()
+    child = multiprocessing.Process(
+        target=run_crawl,
+        args=(stub.artist_url, db_name, concurrency, verbose, results),
+    )
+    child.start()
+    result = results.get()
+    child.join()
+    result.update(pages=stub.requests, errors=stub.errors, mb=stub.bytes_sent / 1e6)
+    return result
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[0])
+    add_arguments(parser)
+    parser.add_argument("--concurrency", type=int, nargs="+", default=[1, 8])
+    parser.add_argument("--verbose", action="store_true")
+    args = parser.parse_args()
+
+    expected = args.artists * args.releases
+    print(
+        f"{args.artists} artists x {args.releases} releases x {args.tracks} tracks, "
+        f"latency {args.latency * 1000:.0f}+{args.jitter * 1000:.0f}ms, "
+        f"error rate {args.error_rate:.0%}"
+    )
+    print(
+        f"{'concurrency':>11} {'run':<8}{'seconds':>9}{'pages':>7}{'errors':>7}"
+        f"{'pages/s':>9}{'rel/s':>8}{'MB':>7}{'write s':>9}{'peak MB':>9}"
+    )
+
+    missing = 0
+    with from_arguments(args) as stub, tempfile.TemporaryDirectory() as tmp:
+        for concurrency in args.concurrency:
+            db_name = str(Path(tmp) / f"crawl-{concurrency}.db")
+            create_artists(
+                db_name, [stub.catalogue.nickname(i) for i in range(args.artists)]
+            )
+            # Children must not inherit the connections of this process.
+            close_connections()
+            for run in ("first", "recheck"):
+                result = crawl(stub, db_name, concurrency, args.verbose)
+                new = result["releases"] if run == "first" else 0
+                print(
+                    f"{concurrency:>11} {run:<8}{result['elapsed']:>9.2f}"
+                    f"{result['pages']:>7}{result['errors']:>7}"
+                    f"{result['pages'] / result['elapsed']:>9.1f}"
+                    f"{new / result['elapsed']:>8.1f}{result['mb']:>7.1f}"
+                    f"{result['write']:>9.3f}{result['peak']:>9.1f}"
+                )
+            # Releases that still failed after the retries.
+            missing += expected - result["releases"]
+
+    if missing:
+        print(f"{missing} releases missing after all runs", file=sys.stderr)
+    return 0
+
+
+if __name__ == "__main__":
+    sys.exit(main())
@@ -0,0 +1,110 @@
+"""Export a large generated catalogue in every format.
+
+Usage: PYTHONPATH=src python benchmarks/export.py [--releases 100000] [--tracks 20]
+
+Builds a database of `--releases` releases with `--tracks` tracks each (2M
+tracks by default) in a temporary directory, then times full exports of the
+tables in each format and incremental exports of the newest 1% of releases.
+Output goes to /dev/null, so the numbers are read and encode throughput.
+The Python memory of one full export is traced at the end.
+Parquet is skipped when pyarrow is not installed.
+"""
+import argparse
+import os
+import tempfile
+import time
+import tracemalloc
+from datetime import datetime, timedelta
+
+from bc_agent import fastjson  # noqa: F401, keeps its import out of the timings
+from bc_agent.db import close_connections, sqlite_db
+from bc_agent.export import FORMATS, export
+
+START = datetime(2010, 1, 1)
+
+
+def build(db_name, releases, tracks, artists=5000):
+    with sqlite_db(db_name) as conn:
+        conn.executemany(
+            "INSERT INTO artists (id, nickname, last_checked) VALUES (?, ?, ?)",
+            ((i, f"artist{i}", START) for i in range(1, artists + 1)),
+        )
+        conn.executemany(
+            "INSERT INTO releases (id, artist_id, title, release_date, link) VALUES (?, ?, ?, ?, ?)",
+            (
+                (
+                    i,
+                    i % artists + 1,
+                    f"Release {i}",
+                    START + timedelta(hours=i),
+                    f"https://artist{i % artists + 1}.bandcamp.com/album/release-{i}",
+                )
+                for i in range(1, releases + 1)
+            ),
+        )
+        conn.executemany(
+            "INSERT INTO tracks (release_id, number, title, duration, link) VALUES (?, ?, ?, ?, ?)",
+            (
+                (
+                    i,
+                    n,
+                    f"Track {n} of release {i}",
+                    f"{n % 7 + 2}:{n * 7 % 60:02d}",
+                    f"https://artist{i % artists + 1}.bandcamp.com/track/t-{i}-{n}",
+                )
+                for i in range(1, releases + 1)
+                for n in range(1, tracks + 1)
+            ),
+        )
+
+
+def run(db_name, table, fmt, **since):
+    try:
+        with open(os.devnull, "wb") as out:
+            started = time.perf_counter()
+            rows = export(db_name, table, fmt, out, **since)
+            elapsed = time.perf_counter() - started
+    except RuntimeError as e:
+        print(f"{table:9} {fmt:8} skipped: {e}")
+        return
+    label = f"since {since}" if since else "full"
+    print(
+        f"{table:9} {fmt:8} {label:36} {rows:>9} rows {elapsed:7.2f}s "
+        f"{rows / elapsed:>10,.0f} rows/s"
+    )
+
+
+def main():
+    parser = argparse.ArgumentParser()
+    parser.add_argument("--releases", type=int, default=100_000)
+    parser.add_argument("--tracks", type=int, default=20)
+    args = parser.parse_args()
+
+    with tempfile.TemporaryDirectory() as tmp:
+        db_name = os.path.join(tmp, "bandcamp.db")
+        started = time.perf_counter()
+        build(db_name, args.releases, args.tracks)
+        size = os.path.getsize(db_name) / 2**20
+        print(f"built in {time.perf_counter() - started:.1f}s, {size:.0f} MiB\n")
+
+        for table in ("artists", "releases", "tracks"):
+            for fmt in FORMATS:
+                run(db_name, table, fmt)
+        since_id = args.releases - args.releases // 100
+        since = START + timedelta(hours=since_id + 1)
+        for table in ("releases", "tracks"):
+            run(db_name, table, "ndjson", since_id=since_id)
+            run(db_name, table, "ndjson", since=since)
+
+        # SQLite's page cache is not allocated through Python, see PRAGMAS.
+        tracemalloc.start()
+        with open(os.devnull, "wb") as out:
+            export(db_name, "tracks", "csv", out)
+        peak = tracemalloc.get_traced_memory()[1] / 2**20
+        tracemalloc.stop()
+        print(f"\npeak Python memory of the tracks export: {peak:.1f} MiB")
+        close_connections()
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,56 @@
+"""Compare the release page extraction engines on the saved fixtures.
+
+Usage: PYTHONPATH=src python benchmarks/extract_engines.py [--repeat N]
+
+Fails if the engines do not produce identical releases.
+"""
+import argparse
+import sys
+import timeit
+from pathlib import Path
+
+from bc_agent.parsing import ENGINES, parse_release_page
+
+FIXTURES = Path(__file__).parent.parent / "tests" / "fixtures" / "release_pages"
+RELEASE_URL = "https://artist.bandcamp.com/album/release"
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[0])
+    parser.add_argument("--repeat", type=int, default=20)
+    args = parser.parse_args()
+
+    pages = {path.stem: path.read_bytes() for path in sorted(FIXTURES.glob("*.html"))}
+    print(
+        f"{'fixture':<14}{'kB':>7}{'tracks':>8}" + "".join(f"{e:>12}" for e in ENGINES)
+    )
+
+    identical = True
+    for name, content in pages.items():
+        releases = {e: parse_release_page(content, RELEASE_URL, e) for e in ENGINES}
+        if len({r.json() for r in releases.values()}) != 1:
+            identical = False
+            print(f"{name}: engines disagree", file=sys.stderr)
+
+        timings = {
+            engine: min(
+                timeit.repeat(
+                    lambda: parse_release_page(content, RELEASE_URL, engine),
+                    number=args.repeat,
+                    repeat=3,
+                )
+            )
+            / args.repeat
+            for engine in ENGINES
+        }
+        tracks = len(releases[ENGINES[0]].tracks)
+        print(
+            f"{name:<14}{len(content) / 1024:>7.1f}{tracks:>8}"
+            + "".join(f"{timings[e] * 1000:>10.2f}ms" for e in ENGINES)
+        )
+
+    return 0 if identical else 1
+
+
+if __name__ == "__main__":
+    sys.exit(main())
@@ -0,0 +1,132 @@
+"""Encode large responses through pydantic and through the fast JSON path.
+
+Usage: PYTHONPATH=src python benchmarks/response_encoding.py [--rows 10000 100000]
+
+The pydantic path is what a route with a `response_model` used to do: build
+a model per database row, let FastAPI validate and `jsonable_encoder` them
+against the response model and render a `JSONResponse`. The fast path builds
+`NamedTuple` records and renders a `FastJSONResponse`, with orjson and with
+the standard library fallback. Rows are generated in memory, so the time of
+the query is left out.
+"""
+import argparse
+import asyncio
+import statistics
+import sys
+import time
+from datetime import datetime, timedelta
+from typing import List
+
+from fastapi.responses import JSONResponse
+from fastapi.routing import serialize_response
+from fastapi.utils import create_response_field
+
+from bc_agent import fastjson
+from bc_agent.db import as_datetime
+from bc_agent.fastjson import FastJSONResponse, as_dicts
+from bc_agent.model import Artist, ArtistRow, ReleaseDenorm, ReleaseRow
+
+START = datetime(2023, 1, 1)
+
+
+def artist_rows(n):
+    # (nickname, id, last_checked) as returned by sqlite3
+    return [
+        (f"artist{i}", i, str(START + timedelta(minutes=i)) if i % 3 else None)
+        for i in range(n)
+    ]
+
+
+def release_rows(n):
+    # (title, nickname, link, release_date) as returned by sqlite3
+    return [
+        (
+            f"Release {i}",
+            f"artist{i % 500}",
+            f"https://artist{i % 500}.bandcamp.com/album/release-{i}",
+            str(START + timedelta(hours=i)),
+        )
+        for i in range(n)
+    ]
+
+
+def pydantic_artists(rows):
+    return [Artist(nickname=r[0], id=r[1], last_checked=r[2]) for r in rows]
+
+
+def pydantic_releases(rows):
+    return [
+        ReleaseDenorm(title=r[0], artist=r[1], link=r[2], release_date=r[3])
+        for r in rows
+    ]
+
+
+def fast_artists(rows):
+    return [ArtistRow(r[0], r[1], as_datetime(r[2])) for r in rows]
+
+
+def fast_releases(rows):
+    return [ReleaseRow(*r[:3], as_datetime(r[3])) for r in rows]
+
+
+def pydantic_path(build, model):
+    field = create_response_field(name="Response", type_=List[model])
+
+    def encode(rows):
+        content = asyncio.run(
+            serialize_response(field=field, response_content=build(rows))
+        )
+        return JSONResponse(content).body
+
+    return encode
+
+
+def fast_path(build):
+    def encode(rows):
+        return FastJSONResponse(as_dicts(build(rows))).body
+
+    return encode
+
+
+def measure(encode, rows, repeat):
+    timings = []
+    for _ in range(repeat):
+        start = time.perf_counter()
+        body = encode(rows)
+        timings.append(time.perf_counter() - start)
+    return statistics.median(timings), len(body)
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[0])
+    parser.add_argument("--rows", type=int, nargs="+", default=[10_000, 100_000])
+    parser.add_argument("--repeat", type=int, default=5)
+    args = parser.parse_args()
+
+    orjson = fastjson.orjson
+    kinds = {
+        "artists": (artist_rows, Artist, pydantic_artists, fast_artists),
+        "releases": (release_rows, ReleaseDenorm, pydantic_releases, fast_releases),
+    }
+    print(f"{'kind':<10}{'rows':>8} {'path':<13}{'ms':>9}{'rows/s':>11}{'MB':>7}")
+    for kind, (make_rows, model, slow_build, fast_build) in kinds.items():
+        slow, fast = pydantic_path(slow_build, model), fast_path(fast_build)
+        # (name, encode, module used by fastjson.dumps)
+        paths = [("pydantic", slow, orjson), ("fast json", fast, None)]
+        if orjson is not None:
+            paths.insert(1, ("fast orjson", fast, orjson))
+        for n in args.rows:
+            rows = make_rows(n)
+            for name, encode, encoder in paths:
+                fastjson.orjson = encoder
+                seconds, size = measure(encode, rows, args.repeat)
+                print(
+                    f"{kind:<10}{n:>8} {name:<13}{seconds * 1000:>9.1f}"
+                    f"{n / seconds:>11.0f}{size / 1e6:>7.1f}"
+                )
+    fastjson.orjson = orjson
+    return 0
+
+
+if __name__ == "__main__":
+    sys.exit(main())
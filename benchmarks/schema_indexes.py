@@ -0,0 +1,129 @@
+"""Query plans and timings of the hot queries before and after the indexes.
+
+Usage: PYTHONPATH=src python benchmarks/schema_indexes.py [--tracks N]
+
+Builds a synthetic database at schema version 1 (no indexes), runs the hot
+queries, applies the remaining migrations and runs them again.
+"""
+import argparse
+import random
+import tempfile
+import time
+from datetime import datetime, timedelta
+from pathlib import Path
+
+from bc_agent import db
+
+TRACKS_PER_RELEASE = 10
+RELEASES_PER_ARTIST = 20
+
+QUERIES = {
+    "releases by date": (
+        """
+        SELECT r.title, a.nickname, r.link, r.release_date
+        FROM releases r INNER JOIN artists a ON r.artist_id = a.id
+        WHERE r.release_date >= ? ORDER BY r.release_date DESC
+        """,
+        lambda n: ((datetime(2023, 1, 1) - timedelta(days=7)),),
+    ),
+    "artist by nickname": (
+        "SELECT id FROM artists WHERE nickname = ?",
+        lambda n: (f"artist{random.randrange(n['artists'])}",),
+    ),
+    "releases of artist": (
+        "SELECT link, release_date FROM releases WHERE artist_id = ?",
+        lambda n: (random.randrange(n["artists"]) + 1,),
+    ),
+    "tracks of release": (
+        "SELECT number, title, duration FROM tracks WHERE release_id = ? ORDER BY number",
+        lambda n: (random.randrange(n["releases"]) + 1,),
+    ),
+}
+
+
+def populate(conn, tracks):
+    releases = tracks // TRACKS_PER_RELEASE
+    artists = max(releases // RELEASES_PER_ARTIST, 1)
+    start = datetime(2010, 1, 1)
+    conn.executemany(
+        "INSERT INTO artists (id, nickname) VALUES (?, ?)",
+        ((i + 1, f"artist{i}") for i in range(artists)),
+    )
+    conn.executemany(
+        "INSERT INTO releases (id, artist_id, title, release_date, link) VALUES (?, ?, ?, ?, ?)",
+        (
+            (
+                i + 1,
+                random.randrange(artists) + 1,
+                f"Release {i}",
+                start + timedelta(minutes=random.randrange(13 * 365 * 24 * 60)),
+                f"https://artist.bandcamp.com/album/release-{i}",
+            )
+            for i in range(releases)
+        ),
+    )
+    conn.executemany(
+        "INSERT INTO tracks (release_id, number, title, duration, link) VALUES (?, ?, ?, ?, ?)",
+        (
+            (
+                i // TRACKS_PER_RELEASE + 1,
+                i % TRACKS_PER_RELEASE + 1,
+                f"Track {i}",
+                "04:40",
+                "",
+            )
+            for i in range(releases * TRACKS_PER_RELEASE)
+        ),
+    )
+    conn.commit()
+    return {"artists": artists, "releases": releases}
+
+
+def report(conn, sizes, repeat):
+    for name, (sql, make_params) in QUERIES.items():
+        params = make_params(sizes)
+        plan = "; ".join(
+            row[-1] for row in conn.execute(f"EXPLAIN QUERY PLAN {sql}", params)
+        )
+        start = time.perf_counter()
+        for _ in range(repeat):
+            conn.execute(sql, make_params(sizes)).fetchall()
+        elapsed = (time.perf_counter() - start) / repeat
+        print(f"  {name:<20}{elapsed * 1000:>10.3f}ms  {plan}")
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[0])
+    parser.add_argument("--tracks", type=int, default=1_000_000)
+    parser.add_argument("--repeat", type=int, default=20)
+    args = parser.parse_args()
+    random.seed(0)
+
+    with tempfile.TemporaryDirectory() as tmp:
+        db_name = str(Path(tmp) / "bench.db")
+        conn = db._connect(db_name)
+        conn.execute("PRAGMA journal_mode = WAL")
+        db.MIGRATIONS[0](conn.cursor())
+        conn.execute("PRAGMA user_version = 1")
+
+        start = time.perf_counter()
+        sizes = populate(conn, args.tracks)
+        print(
+            f"{args.tracks} tracks, {sizes['releases']} releases, "
+            f"{sizes['artists']} artists in {time.perf_counter() - start:.1f}s"
+        )
+
+        print("before:")
+        report(conn, sizes, args.repeat)
+
+        start = time.perf_counter()
+        db.migrate(conn)
+        print(f"migration took {time.perf_counter() - start:.1f}s")
+
+        print("after:")
+        report(conn, sizes, args.repeat)
+        conn.close()
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,176 @@
+"""Read release and artist stats from the stats tables and by aggregating tracks.
+
+Usage: PYTHONPATH=src python benchmarks/stats.py [--releases 100000] [--tracks 20]
+
+Builds the catalogue of benchmarks/export.py, times the one-time backfills
+the migrations run on it and then compares reading the stats of random
+artists and releases, and of the whole catalogue, with the aggregate queries
+they replace. Finally it times writing batches of new releases and the
+share of the incremental update of the stats.
+"""
+import argparse
+import os
+import random
+import statistics
+import tempfile
+import time
+from datetime import datetime
+from unittest.mock import patch
+
+from export import build
+
+from bc_agent import writer
+from bc_agent.db import close_connections, parse_duration, sqlite_db
+from bc_agent.model import ReleaseDenorm, Track
+from bc_agent.stats import (
+    get_artist_stats,
+    get_catalogue_stats,
+    get_release_stats,
+    rebuild_stats,
+)
+from bc_agent.writer import CrawlResult, write_results
+
+ARTISTS = 5000
+AGGREGATES = {
+    "catalogue": """
+        SELECT COUNT(DISTINCT t.release_id), COUNT(*), SUM(t.duration_seconds),
+               AVG(t.duration_seconds)
+        FROM tracks t
+        """,
+    "artist": """
+        SELECT COUNT(DISTINCT r.id), COUNT(t.id), SUM(t.duration_seconds),
+               AVG(t.duration_seconds), MIN(r.release_date), MAX(r.release_date)
+        FROM releases r LEFT JOIN tracks t ON t.release_id = r.id
+        WHERE r.artist_id = ?
+        """,
+    "release": """
+        SELECT COUNT(*), SUM(duration_seconds), AVG(duration_seconds)
+        FROM tracks WHERE release_id = ?
+        """,
+}
+
+
+def timed(label, func):
+    started = time.perf_counter()
+    func()
+    print(f"{label:44} {time.perf_counter() - started:8.2f}s")
+
+
+def per_call(func, ids, repeat):
+    samples = []
+    for _ in range(repeat):
+        started = time.perf_counter()
+        for i in ids:
+            func(i)
+        samples.append((time.perf_counter() - started) / len(ids))
+    return min(samples) * 1e6
+
+
+def backfill_durations(db_name):
+    with sqlite_db(db_name) as conn:
+        conn.create_function("parse_duration", 1, parse_duration, deterministic=True)
+        conn.execute("UPDATE tracks SET duration_seconds = parse_duration(duration)")
+
+
+def new_results(start, releases=200, tracks=20):
+    return [
+        CrawlResult(
+            i % ARTISTS + 1,
+            [
+                ReleaseDenorm(
+                    title=f"New {i}",
+                    artist="artist",
+                    link=f"https://new.bandcamp.com/album/{i}",
+                    release_date=datetime(2023, 1, 1),
+                    tracks=[
+                        Track(
+                            number=n,
+                            title=f"Track {n}",
+                            duration="3:20",
+                            duration_seconds=200,
+                            link=f"https://new.bandcamp.com/track/{i}-{n}",
+                        )
+                        for n in range(1, tracks + 1)
+                    ],
+                )
+            ],
+            datetime(2023, 1, 1),
+        )
+        for i in range(start, start + releases)
+    ]
+
+
+def write_batches(db_name, start, batches):
+    """Return the median time of writing a batch and of adding it to the stats."""
+    writes, updates = [], []
+    add_stats = writer.add_stats
+
+    def timed_add_stats(cursor, first_id):
+        started = time.perf_counter()
+        add_stats(cursor, first_id)
+        updates.append(time.perf_counter() - started)
+
+    with patch.object(writer, "add_stats", timed_add_stats):
+        for b in range(batches):
+            results = new_results(start + b * 200)
+            with sqlite_db(db_name) as conn:
+                started = time.perf_counter()
+                write_results(conn, results)
+                writes.append(time.perf_counter() - started)
+    return statistics.median(writes) * 1000, statistics.median(updates) * 1000
+
+
+def main():
+    parser = argparse.ArgumentParser()
+    parser.add_argument("--releases", type=int, default=100_000)
+    parser.add_argument("--tracks", type=int, default=20)
+    parser.add_argument("--repeat", type=int, default=3)
+    args = parser.parse_args()
+
+    with tempfile.TemporaryDirectory() as tmp:
+        db_name = os.path.join(tmp, "bandcamp.db")
+        build(db_name, args.releases, args.tracks, ARTISTS)
+        timed("backfill duration_seconds", lambda: backfill_durations(db_name))
+        timed("backfill stats", lambda: rebuild_stats(db_name))
+        print()
+
+        random.seed(1)
+        artist_ids = random.sample(range(1, ARTISTS + 1), 200)
+        release_ids = random.sample(range(1, args.releases + 1), 1000)
+        with sqlite_db(db_name) as conn:
+            readers = {
+                "catalogue": (
+                    lambda _: get_catalogue_stats(db_name),
+                    lambda _: conn.execute(AGGREGATES["catalogue"]).fetchone(),
+                    [None],
+                ),
+                "artist": (
+                    lambda i: get_artist_stats(db_name, i),
+                    lambda i: conn.execute(AGGREGATES["artist"], (i,)).fetchone(),
+                    artist_ids,
+                ),
+                "release": (
+                    lambda i: get_release_stats(db_name, i),
+                    lambda i: conn.execute(AGGREGATES["release"], (i,)).fetchone(),
+                    release_ids,
+                ),
+            }
+            for name, (stats, aggregate, ids) in readers.items():
+                print(
+                    f"{name:9} stats table {per_call(stats, ids, args.repeat):10.1f}us"
+                    f"   aggregate {per_call(aggregate, ids, args.repeat):10.1f}us"
+                )
+        print()
+
+        # The first writes store the feeds of the artists, leave them out.
+        write_batches(db_name, 0, 30)
+        write, update = write_batches(db_name, 10_000, 20)
+        print(
+            f"write 200 releases x 20 tracks: {write:.1f}ms, "
+            f"of which {update:.1f}ms updating the stats"
+        )
+        close_connections()
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,305 @@
+"""Local stand-in for bandcamp.com serving synthetic artist and release pages.
+
+Artist pages are served at `/<nickname>` and list their releases in an
+`ol.music-grid`, release pages at `/<nickname>/album/<release>` carry the
+elements read by `bc_agent.parsing`. Point `music_data.ARTIST_URL` at
+`StubServer.artist_url` to crawl it.
+
+Usage: PYTHONPATH=src python benchmarks/stub_server.py [--port 8080] [...]
+"""
+import argparse
+import random
+import threading
+import time
+from dataclasses import dataclass
+from datetime import datetime, timedelta
+from html import escape
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+from typing import Dict, Optional
+
+ARTIST_PAGE = """<!DOCTYPE html>
+<html lang="en">
+<head><meta charset="utf-8"><title>Music | {name}</title></head>
+<body>
+<div id="pgBd">
+<h1>{name}</h1>
+<ol class="music-grid" id="music-grid">
+{items}
+</ol>
+</div>
+{padding}
+</body>
+</html>
+"""
+
+ARTIST_ITEM = """<li class="music-grid-item"><a href="/album/{slug}">
+<div class="art"><img src="https://f4.bcbits.com/img/{slug}.jpg" alt=""></div>
+<p class="title">{title}</p></a></li>"""
+
+RELEASE_PAGE = """<!DOCTYPE html>
+<html lang="en">
+<head><meta charset="utf-8"><title>{title} | {name}</title></head>
+<body>
+<div id="name-section">
+<h2 class="trackTitle">
+    {title}
+</h2>
+<h3 style="margin:0px;">by <span><a href="/">{name}</a></span></h3>
+</div>
+<table class="track_list track_table" id="track_table">
+<tbody>
+{rows}
+</tbody>
+</table>
+<div class="tralbumData tralbum-credits">
+released {released}
+</div>
+{padding}
+</body>
+</html>
+"""
+
+TRACK_ROW = """<tr class="track_row_view linked" rel="tracknum={number}">
+<td class="track-number-col"><div class="track_number secondaryText">{number}.</div></td>
+<td class="title-col"><div class="title">
+<a href="/track/{slug}"><span class="track-title">{title}</span></a>
+<span class="time secondaryText">{duration}</span>
+</div></td>
+<td class="info-col"><div class="info_link"><a href="/track/{slug}"></a></div></td>
+</tr>"""
+
+# The newest synthetic release, older ones go back from here.
+NEWEST = datetime(2023, 3, 10)
+
+
+@dataclass
+class Catalogue:
+    """Shape of the synthetic catalogue, identical for identical arguments."""
+
+    artists: int = 50
+    releases: int = 20
+    tracks: int = 10
+    # Filler added to every page, real pages carry about 100 kB of markup.
+    padding: int = 0
+
+    def nickname(self, artist: int) -> str:
+        return f"artist{artist}"
+
+    def release_date(self, artist: int, release: int) -> datetime:
+        return NEWEST - timedelta(days=(artist * 7 + release * 31) % 3650)
+
+    def artist_page(self, artist: int) -> str:
+        items = "\n".join(
+            ARTIST_ITEM.format(slug=f"release-{r}", title=f"Release {r}")
+            for r in range(self.releases)
+        )
+        return ARTIST_PAGE.format(
+            name=f"Artist {artist}", items=items, padding=self._padding()
+        )
+
+    def release_page(self, artist: int, release: int) -> str:
+        rows = "\n".join(
+            TRACK_ROW.format(
+                number=t,
+                slug=f"track-{release}-{t}",
+                title=escape(f"Track {t} & more"),
+                duration=f"0{t % 10}:{t * 7 % 60:02d}",
+            )
+            for t in range(1, self.tracks + 1)
+        )
+        return RELEASE_PAGE.format(
+            name=f"Artist {artist}",
+            title=f"Release {release}",
+            rows=rows,
+            released=self.release_date(artist, release).strftime("%B %d, %Y"),
+            padding=self._padding(),
+        )
+
+    def _padding(self) -> str:
+        return f"<!-- {'x' * self.padding} -->" if self.padding else ""
+
+
+class _Handler(BaseHTTPRequestHandler):
+    protocol_version = "HTTP/1.1"
+    # Headers and body are written separately, with Nagle's algorithm every
+    # keep-alive response would wait for the client's delayed ACK.
+    disable_nagle_algorithm = True
+    server: "_Server"
+
+    def do_GET(self):
+        stub = self.server.stub
+        stub._sleep()
+        if stub._fail():
+            return self._send(stub.error_status, b"injected error")
+
+        parts = self.path.strip("/").split("/")
+        artist = _artist_index(parts[0], stub.catalogue)
+        if artist is None:
+            return self._send(404, b"not found")
+
+        if len(parts) == 1:
+            etag = f'"{parts[0]}-{stub.catalogue.releases}"'
+            if self.headers.get("If-None-Match") == etag:
+                return self._send(304, b"", {"ETag": etag})
+            page = stub.catalogue.artist_page(artist)
+            return self._send(200, page.encode(), {"ETag": etag})
+
+        if len(parts) == 3 and parts[1] == "album" and parts[2].startswith("release-"):
+            release = int(parts[2][len("release-") :])
+            if release < stub.catalogue.releases:
+                page = stub.catalogue.release_page(artist, release)
+                return self._send(200, page.encode())
+        self._send(404, b"not found")
+
+    def _send(self, status: int, body: bytes, headers: Optional[Dict] = None):
+        self.send_response(status)
+        for name, value in (headers or {}).items():
+            self.send_header(name, value)
+        if status != 304:
+            self.send_header("Content-Type", "text/html; charset=utf-8")
+            self.send_header("Content-Length", str(len(body)))
+        self.end_headers()
+        if status != 304:
+            self.wfile.write(body)
+        self.server.stub._count(status, len(body))
+
+    def log_message(self, format, *args):
+        pass
+
+
+def _artist_index(nickname: str, catalogue: Catalogue) -> Optional[int]:
+    if not nickname.startswith("artist"):
+        return None
+    try:
+        artist = int(nickname[len("artist") :])
+    except ValueError:
+        return None
+    return artist if artist < catalogue.artists else None
+
+
+class _Server(ThreadingHTTPServer):
+    daemon_threads = True
+    stub: "StubServer"
+
+
+class StubServer:
+    """Serve a `Catalogue` from a background thread.
+
+    Every request is delayed by `latency` seconds plus up to `jitter` seconds
+    and answered with `error_status` with probability `error_rate`.
+    """
+
+    def __init__(
+        self,
+        catalogue: Catalogue,
+        latency: float = 0.0,
+        jitter: float = 0.0,
+        error_rate: float = 0.0,
+        error_status: int = 503,
+        port: int = 0,
+        seed: int = 0,
+    ):
+        self.catalogue = catalogue
+        self.latency = latency
+        self.jitter = jitter
+        self.error_rate = error_rate
+        self.error_status = error_status
+        self.requests = 0
+        self.errors = 0
+        self.bytes_sent = 0
+        self._random = random.Random(seed)
+        self._lock = threading.Lock()
+        self._server = _Server(("127.0.0.1", port), _Handler)
+        self._server.stub = self
+        self._thread = threading.Thread(
+            target=self._server.serve_forever, name="stub-server", daemon=True
+        )
+
+    @property
+    def url(self) -> str:
+        host, port = self._server.server_address[:2]
+        return f"http://{host}:{port}"
+
+    @property
+    def artist_url(self) -> str:
+        """Template for `music_data.ARTIST_URL`."""
+        return self.url + "/{nickname}"
+
+    def start(self) -> "StubServer":
+        self._thread.start()
+        return self
+
+    def stop(self):
+        self._server.shutdown()
+        self._server.server_close()
+
+    def reset_stats(self):
+        with self._lock:
+            self.requests = self.errors = self.bytes_sent = 0
+
+    def __enter__(self):
+        return self.start()
+
+    def __exit__(self, *exc_info):
+        self.stop()
+
+    def _sleep(self):
+        with self._lock:
+            delay = self.latency + self._random.uniform(0, self.jitter)
+        if delay > 0:
+            time.sleep(delay)
+
+    def _fail(self) -> bool:
+        with self._lock:
+            return self._random.random() < self.error_rate
+
+    def _count(self, status: int, size: int):
+        with self._lock:
+            self.requests += 1
+            self.bytes_sent += size
+            if status == self.error_status:
+                self.errors += 1
+
+
+def add_arguments(parser: argparse.ArgumentParser):
+    """Add the catalogue and server options shared with the benchmarks."""
+    parser.add_argument("--artists", type=int, default=50)
+    parser.add_argument("--releases", type=int, default=20, help="per artist")
+    parser.add_argument("--tracks", type=int, default=10, help="per release")
+    parser.add_argument("--padding", type=int, default=0, help="bytes per page")
+    parser.add_argument("--latency", type=float, default=0.02, help="seconds")
+    parser.add_argument("--jitter", type=float, default=0.01, help="seconds")
+    parser.add_argument("--error-rate", type=float, default=0.0)
+    parser.add_argument("--error-status", type=int, default=503)
+    parser.add_argument("--seed", type=int, default=0)
+
+
+def from_arguments(args: argparse.Namespace, port: int = 0) -> StubServer:
+    catalogue = Catalogue(args.artists, args.releases, args.tracks, args.padding)
+    return StubServer(
+        catalogue,
+        latency=args.latency,
+        jitter=args.jitter,
+        error_rate=args.error_rate,
+        error_status=args.error_status,
+        port=port,
+        seed=args.seed,
+    )
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[0])
+    add_arguments(parser)
+    parser.add_argument("--port", type=int, default=8080)
+    args = parser.parse_args()
+    with from_arguments(args, args.port) as stub:
+        print(f"Serving {args.artists} artists at {stub.artist_url}")
+        try:
+            while True:
+                time.sleep(3600)
+        except KeyboardInterrupt:
+            pass
+
+
+if __name__ == "__main__":
+    main()
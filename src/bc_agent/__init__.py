@@ -1,2 +1 @@
 """Get new releases from bandcamp and display them in a website."""
-print("hello bc_agent")
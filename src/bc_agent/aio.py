@@ -0,0 +1,55 @@
+"""Run blocking database work from async code."""
+import asyncio
+import functools
+from concurrent.futures import ThreadPoolExecutor
+from typing import Callable, Optional, TypeVar
+
+DB_WORKERS = 4
+# Calls waiting for a worker before new callers have to wait for a slot.
+DB_QUEUE_SIZE = 64
+
+T = TypeVar("T")
+
+
+class DBExecutor:
+    """Dedicated thread pool for SQLite calls with a bounded queue.
+
+    Database work does not compete with other blocking calls for the default
+    threadpool, and each worker thread keeps its pooled connection. At most
+    `workers + queue_size` calls are submitted at a time, further callers
+    wait on the event loop instead of piling up in the pool's queue.
+    """
+
+    def __init__(self, workers: int = DB_WORKERS, queue_size: int = DB_QUEUE_SIZE):
+        self.workers = workers
+        self.queue_size = queue_size
+        self._pool: Optional[ThreadPoolExecutor] = None
+        self._slots: Optional[asyncio.Semaphore] = None
+        self._loop: Optional[asyncio.AbstractEventLoop] = None
+
+    def start(self):
+        if self._pool is None:
+            self._pool = ThreadPoolExecutor(
+                max_workers=self.workers, thread_name_prefix="bc-db"
+            )
+
+    def shutdown(self):
+        if self._pool is not None:
+            self._pool.shutdown(wait=True)
+            self._pool = None
+
+    def _get_slots(self) -> asyncio.Semaphore:
+        # Semaphores belong to the event loop they are first used in.
+        loop = asyncio.get_running_loop()
+        if self._slots is None or self._loop is not loop:
+            self._slots = asyncio.Semaphore(self.workers + self.queue_size)
+            self._loop = loop
+        return self._slots
+
+    async def run(self, func: Callable[..., T], *args, **kwargs) -> T:
+        """Call `func(*args, **kwargs)` on a database thread and await it."""
+        self.start()
+        async with self._get_slots():
+            return await asyncio.get_running_loop().run_in_executor(
+                self._pool, functools.partial(func, *args, **kwargs)
+            )
@@ -20,51 +20,75 @@ Write the following routes:
 Every API route should return a response to the user.
 '''
 
-import sys
+import json
+import logging
 from datetime import datetime, timedelta
+from email.utils import parsedate_to_datetime
+from html import escape
 from pathlib import Path
-from typing import List, Optional
+from typing import AsyncIterator, Dict, List, Optional, Tuple
 
-from fastapi import FastAPI, HTTPException, Response, status
+from fastapi import FastAPI, HTTPException, Query, Request, Response, status
+from fastapi.responses import StreamingResponse
 
-from .db import sqlite_db
-from .model import Artist
-from .music_data import DB_NAME, get_releases_by_date
+from . import artists, export, metrics, search, stats
+from .aio import DBExecutor
+from .cache import check_releases_generation, release_cache
+from .db import change_counter, close_connections, get_meta, init_db, sqlite_db
+from .fastjson import FastJSONResponse, as_dicts
+from .feed import Feed, get_feed
+from .model import (
+    Artist,
+    ArtistBulk,
+    ArtistBulkDelete,
+    ArtistStats,
+    BulkResult,
+    CatalogueStats,
+    ReleasePage,
+    ReleaseRow,
+    ReleaseStats,
+    SearchPage,
+)
+from .music_data import (
+    DB_NAME,
+    LAST_UPDATE,
+    PAGE_SIZE,
+    decode_cursor,
+    encode_cursor,
+    get_releases_page,
+)
 
 app = FastAPI()
 
-if not Path(DB_NAME).exists():
-    sys.exit(f"{Path(DB_NAME).absolute()} does not exist.")
-print(f"DB: {Path(DB_NAME).absolute()}")
 
+# All database access of the routes goes through this executor.
+db_executor = DBExecutor()
 
-@app.get("/releases")
-@app.get("/releases/{date}")
-def get_releases(date: Optional[str] = None) -> Response:
-    """
-    Retrieve a list of releases based on a given date (if provided) using data from a specified SQLite database.
 
-    Args:
-        date (str): A string format of a date (YYYYMMDD) for which to retrieve releases. Defaults to None.
-    Returns:
-        Response: A Response object with a list of releases in HTML table format.
+@app.on_event("startup")
+async def open_db():
+    """Check for the database and migrate it before the first request.
+
+    Done on startup rather than on import, so that importing the app (e.g. in
+    tests) has no side effects. A missing database fails the startup.
     """
-    if not date:
-        last_thursday = datetime.today() - timedelta(
-            days=datetime.today().weekday() + 3
-        )
-        date = last_thursday.strftime("%Y%m%d")
+    logging.basicConfig(level=logging.INFO)
+    path = Path(DB_NAME).absolute()
+    if not path.exists():
+        raise RuntimeError(f"{path} does not exist.")
+    print(f"DB: {path}")
+    db_executor.start()
+    await db_executor.run(init_db, DB_NAME)
 
-    releases = get_releases_by_date(date, DB_NAME)
 
-    release_table = "\n".join(
-        [
-            f"<tr><td>{release.release_date}</td><td>{release.artist}</td><td>{release.title}</td><td><a href='{release.link}'>{release.link}</a></td></tr>"
-            for release in releases
-        ]
-    )
+@app.on_event("shutdown")
+def close_db():
+    """Stop the database threads, which closes their connections."""
+    db_executor.shutdown()
+    close_connections()
 
-    table_html = f"""
+
+RELEASES_HEAD = """
 <html>
     <head>
         <title>Releases since {date}</title>
@@ -83,66 +107,378 @@ def get_releases(date: Optional[str] = None) -> Response:
                     </tr>
                 </thead>
                 <tbody>
-                    {release_table}
+"""
+
+RELEASES_TAIL = """
                 </tbody>
             </table>
         </div>
     </body>
 </html>
+"""
+
+
+def _release_row(release: ReleaseRow) -> str:
+    link = escape(release.link)
+    return (
+        f"<tr><td>{release.release_date}</td><td>{escape(release.artist)}</td>"
+        f"<td>{escape(release.title)}</td><td><a href='{link}'>{link}</a></td></tr>\n"
+    )
+
+
+async def _release_table(date: str) -> AsyncIterator[str]:
+    yield RELEASES_HEAD.format(date=escape(date))
+    after = None
+    while True:
+        releases, after = await db_executor.run(get_releases_page, date, DB_NAME, after)
+        yield "".join(_release_row(release) for release in releases)
+        if after is None:
+            break
+    yield RELEASES_TAIL
+
+
+@app.get("/releases")
+@app.get("/releases/{date}")
+async def get_releases(date: Optional[str] = None) -> Response:
+    """
+    Retrieve a list of releases based on a given date (if provided) using data from a specified SQLite database.
+
+    The HTML table is streamed one page of releases at a time, so memory use
+    does not grow with the number of releases.
+
+    Args:
+        date (str): A string format of a date (YYYYMMDD) for which to retrieve releases. Defaults to None.
+    Returns:
+        Response: A Response object with a list of releases in HTML table format.
     """
+    date = _resolve_date(date)
+    return StreamingResponse(_release_table(date), media_type="text/html")
+
+
+@app.get("/api/releases", response_model=ReleasePage)
+async def list_releases(
+    request: Request,
+    since: Optional[str] = None,
+    cursor: Optional[str] = None,
+    limit: int = Query(100, ge=1, le=PAGE_SIZE),
+    tracks: bool = False,
+):
+    """
+    List the releases since a date (YYYYMMDD, defaults to last Thursday) as JSON.
+
+    With `tracks=true` every release comes with its tracks, read with one
+    query per page.
+
+    Follow `next_cursor` to get the next page. Responses carry an ETag that
+    only changes when releases or artists change, so polling clients sending
+    `If-None-Match` get an empty 304 until there is something new.
+
+    The releases are encoded straight from the database rows, `ReleasePage`
+    only documents the response.
+    """
+    date = _resolve_date(since)
+    counter = await db_executor.run(_change_counter, DB_NAME)
+    etag = f'"{counter}-{date}{"-tracks" if tracks else ""}"'
+    if _etag_matches(request.headers.get("if-none-match"), etag):
+        return Response(
+            status_code=status.HTTP_304_NOT_MODIFIED, headers={"ETag": etag}
+        )
+
+    try:
+        after = decode_cursor(cursor) if cursor else None
+    except ValueError as e:
+        raise HTTPException(status_code=status.HTTP_400_BAD_REQUEST, detail=str(e))
+    if after is None:
+        # First pages may come from the cache, which must not be older
+        # than the counter of the ETag.
+        check_releases_generation(DB_NAME, counter)
+    releases, next_key = await db_executor.run(
+        get_releases_page, date, DB_NAME, after, limit, tracks
+    )
+
+    items = as_dicts(releases)
+    if tracks:
+        for item in items:
+            item["tracks"] = as_dicts(item["tracks"])
+    return FastJSONResponse(
+        {
+            "releases": items,
+            "next_cursor": encode_cursor(next_key) if next_key else None,
+        },
+        headers={"ETag": etag, "Cache-Control": "no-cache"},
+    )
+
+
+def _change_counter(db_name: str) -> int:
+    with sqlite_db(db_name) as conn:
+        return change_counter(conn)
+
+
+def _resolve_date(date: Optional[str]) -> str:
+    """Default to last Thursday and validate the YYYYMMDD format."""
+    if not date:
+        last_thursday = datetime.today() - timedelta(
+            days=datetime.today().weekday() + 3
+        )
+        date = last_thursday.strftime("%Y%m%d")
+    try:
+        datetime.strptime(date, "%Y%m%d")
+    except ValueError:
+        raise HTTPException(
+            status_code=status.HTTP_422_UNPROCESSABLE_ENTITY,
+            detail="Date must be in format YYYYMMDD",
+        )
+    return date
+
+
+def _etag_matches(if_none_match: Optional[str], etag: str) -> bool:
+    if not if_none_match:
+        return False
+    candidates = {tag.strip().removeprefix("W/") for tag in if_none_match.split(",")}
+    return "*" in candidates or etag in candidates
 
-    return Response(content=table_html, media_type="text/html")
+
+def _export_chunk(
+    encoder, table, after, since_id, since
+) -> Tuple[bytes, Optional[int]]:
+    rows, after = export.read_chunk(DB_NAME, table, after, since_id, since)
+    return encoder.encode(rows), after
+
+
+async def _export_stream(
+    encoder, table, after, since_id, since
+) -> AsyncIterator[bytes]:
+    yield encoder.start()
+    while after is not None:
+        chunk, after = await db_executor.run(
+            _export_chunk, encoder, table, after, since_id, since
+        )
+        yield chunk
+    yield encoder.finish()
+
+
+@app.get("/export/{table}")
+async def export_table(
+    table: str,
+    fmt: str = Query(export.NDJSON, alias="format"),
+    since_id: Optional[int] = Query(None, ge=0),
+    since: Optional[str] = None,
+) -> Response:
+    """
+    Stream a whole table (artists, releases or tracks) for analytics.
+
+    `format` is ndjson, csv or parquet. The rows are read and sent in chunks,
+    so exports of any size run in constant memory. `since_id` only exports
+    the releases after that release id and their tracks, `since` (YYYYMMDD)
+    the releases of that date or later and their tracks, or the artists
+    checked since then.
+    """
+    if table not in export.TABLES:
+        raise HTTPException(
+            status_code=status.HTTP_404_NOT_FOUND, detail="Table not found"
+        )
+    since_date = datetime.strptime(_resolve_date(since), "%Y%m%d") if since else None
+    try:
+        encoder = export.get_encoder(fmt, table)
+        after = await db_executor.run(
+            export.export_start, DB_NAME, table, since_id, since_date
+        )
+    except ValueError as e:
+        raise HTTPException(
+            status_code=status.HTTP_422_UNPROCESSABLE_ENTITY, detail=str(e)
+        )
+    except RuntimeError as e:
+        raise HTTPException(status_code=status.HTTP_501_NOT_IMPLEMENTED, detail=str(e))
+    return StreamingResponse(
+        _export_stream(encoder, table, after, since_id, since_date),
+        media_type=export.MEDIA_TYPES[fmt],
+        headers={"Content-Disposition": f'attachment; filename="{table}.{fmt}"'},
+    )
+
+
+def _get_feed(db_name: str, artist_id: Optional[int] = None) -> Optional[Feed]:
+    with sqlite_db(db_name) as conn:
+        return get_feed(conn, artist_id)
+
+
+def _not_modified_since(if_modified_since: Optional[str], last_modified: str) -> bool:
+    if not if_modified_since:
+        return False
+    try:
+        return parsedate_to_datetime(if_modified_since) >= parsedate_to_datetime(
+            last_modified
+        )
+    except (TypeError, ValueError):
+        return False
+
+
+def _feed_response(request: Request, feed: Feed) -> Response:
+    headers = {"ETag": feed.etag, "Last-Modified": feed.last_modified}
+    if_none_match = request.headers.get("if-none-match")
+    # If-Modified-Since only counts when there is no If-None-Match.
+    if _etag_matches(if_none_match, feed.etag) or (
+        not if_none_match
+        and _not_modified_since(
+            request.headers.get("if-modified-since"), feed.last_modified
+        )
+    ):
+        return Response(status_code=status.HTTP_304_NOT_MODIFIED, headers=headers)
+    return Response(
+        content=feed.body, media_type="application/rss+xml", headers=headers
+    )
+
+
+@app.get("/feed.xml")
+async def releases_feed(request: Request) -> Response:
+    """RSS feed of the newest releases of all artists."""
+    return _feed_response(request, await db_executor.run(_get_feed, DB_NAME))
+
+
+@app.get("/artists/{artist_id}/feed.xml")
+async def artist_feed(request: Request, artist_id: int) -> Response:
+    """RSS feed of the newest releases of one artist."""
+    feed = await db_executor.run(_get_feed, DB_NAME, artist_id)
+    if feed is None:
+        raise HTTPException(
+            status_code=status.HTTP_404_NOT_FOUND, detail="Artist not found"
+        )
+    return _feed_response(request, feed)
 
 
 @app.get("/artists", response_model=List[Artist])
-def list_artists() -> List[Artist]:
+async def list_artists() -> Response:
     """List all registered artists."""
-    with sqlite_db(DB_NAME) as conn:
-        print(Path(DB_NAME).absolute())
-        cursor = conn.cursor()
-        cursor.execute("SELECT id, nickname, last_checked FROM artists")
-        rows = cursor.fetchall()
-        return [Artist(id=row[0], nickname=row[1], last_checked=row[2]) for row in rows]
+    rows = await db_executor.run(artists.list_artists, DB_NAME)
+    return FastJSONResponse(as_dicts(rows))
+
+
+@app.post("/artists/bulk", response_model=List[BulkResult])
+async def create_artists(bulk: ArtistBulk) -> List[BulkResult]:
+    """
+    Add many artists in one transaction.
+
+    Invalid nicknames are skipped instead of failing the whole request, the
+    result of every nickname is reported in the order they were given.
+    """
+    return await db_executor.run(artists.create_artists, DB_NAME, bulk.nicknames)
+
+
+@app.delete("/artists/bulk", response_model=List[BulkResult])
+async def delete_artists(bulk: ArtistBulkDelete) -> List[BulkResult]:
+    """Delete many artists by id and/or nickname in one transaction."""
+    return await db_executor.run(
+        artists.delete_artists, DB_NAME, bulk.ids, bulk.nicknames
+    )
 
 
 @app.get("/artists/{artist_id}", response_model=Artist)
-def get_artist(artist_id: int) -> Artist:
+async def get_artist(artist_id: int) -> Artist:
     """Get artist info from DB."""
-    with sqlite_db(DB_NAME) as conn:
-        cursor = conn.cursor()
-        cursor.execute(
-            "SELECT id, nickname, last_checked FROM artists WHERE id = ?", (artist_id,)
+    artist = await db_executor.run(artists.get_artist, DB_NAME, artist_id)
+    if artist is None:
+        raise HTTPException(
+            status_code=status.HTTP_404_NOT_FOUND, detail="Artist not found"
         )
-        row = cursor.fetchone()
-        if not row:
-            raise HTTPException(
-                status_code=status.HTTP_404_NOT_FOUND, detail="Artist not found"
-            )
-        return Artist(id=row[0], nickname=row[1], last_checked=row[2])
+    return artist
 
 
 @app.post("/artists", response_model=Artist)
-def create_artist(artist: Artist) -> Artist:
+async def create_artist(artist: Artist) -> Artist:
     """Add new artist to the DB."""
-    with sqlite_db(DB_NAME) as conn:
-        cursor = conn.cursor()
-        cursor.execute("INSERT INTO artists (nickname) VALUES (?)", (artist.nickname,))
-        artist_id = cursor.lastrowid
-        conn.commit()
-        return Artist(id=artist_id, nickname=artist.nickname, last_checked=None)
+    if not artists.valid_nickname(artist.nickname):
+        raise HTTPException(
+            status_code=status.HTTP_422_UNPROCESSABLE_ENTITY,
+            detail="Nickname may only contain letters, digits, '_' and '-'",
+        )
+    created = await db_executor.run(artists.create_artist, DB_NAME, artist.nickname)
+    if created is None:
+        raise HTTPException(
+            status_code=status.HTTP_409_CONFLICT, detail="Artist already exists"
+        )
+    return created
 
 
 @app.delete("/artists/{artist_id}", status_code=status.HTTP_204_NO_CONTENT)
-def delete_artist(artist_id: int):
+async def delete_artist(artist_id: int):
     """Delete artist from the DB."""
-    with sqlite_db(DB_NAME) as conn:
-        cursor = conn.cursor()
-        cursor.execute("DELETE FROM artists WHERE id = ?", (artist_id,))
-        if cursor.rowcount == 0:
-            raise HTTPException(
-                status_code=status.HTTP_404_NOT_FOUND, detail="Artist not found"
-            )
-        conn.commit()
+    if not await db_executor.run(artists.delete_artist, DB_NAME, artist_id):
+        raise HTTPException(
+            status_code=status.HTTP_404_NOT_FOUND, detail="Artist not found"
+        )
+
+
+@app.get("/search", response_model=SearchPage)
+async def search_catalogue(
+    q: str,
+    kind: Optional[List[str]] = Query(None),
+    limit: int = Query(search.SEARCH_LIMIT, ge=1, le=100),
+    offset: int = Query(0, ge=0),
+) -> SearchPage:
+    """
+    Search artists, releases and tracks, best matches first.
+
+    All words of `q` have to match, as prefixes of words in the nickname or
+    title. `kind` (artist, release or track, can be repeated) restricts the
+    results. Follow `next_offset` to get the next page.
+    """
+    try:
+        hits, next_offset = await db_executor.run(
+            search.search, DB_NAME, q, kind, limit, offset
+        )
+    except ValueError as e:
+        raise HTTPException(
+            status_code=status.HTTP_422_UNPROCESSABLE_ENTITY, detail=str(e)
+        )
+    return SearchPage(hits=hits, next_offset=next_offset)
+
+
+def _last_update(db_name: str) -> Optional[str]:
+    with sqlite_db(db_name) as conn:
+        return get_meta(conn, LAST_UPDATE)
+
+
+@app.get("/metrics")
+async def get_metrics() -> Response:
+    """Crawl metrics of this process and of the last update, for Prometheus."""
+    body = metrics.render()
+    last_update = await db_executor.run(_last_update, DB_NAME)
+    if last_update:
+        body += metrics.render_summary(json.loads(last_update))
+    return Response(content=body, media_type="text/plain; version=0.0.4")
+
+
+@app.get("/stats", response_model=CatalogueStats)
+async def catalogue_stats() -> CatalogueStats:
+    """Number of releases and tracks and their total and average runtime."""
+    return await db_executor.run(stats.get_catalogue_stats, DB_NAME)
+
+
+@app.get("/stats/artists/{artist_id}", response_model=ArtistStats)
+async def artist_stats(artist_id: int) -> ArtistStats:
+    """Releases, tracks and runtime of an artist."""
+    result = await db_executor.run(stats.get_artist_stats, DB_NAME, artist_id)
+    if result is None:
+        raise HTTPException(
+            status_code=status.HTTP_404_NOT_FOUND, detail="Artist not found"
+        )
+    return result
+
+
+@app.get("/stats/releases/{release_id}", response_model=ReleaseStats)
+async def release_stats(release_id: int) -> ReleaseStats:
+    """Tracks and runtime of a release."""
+    result = await db_executor.run(stats.get_release_stats, DB_NAME, release_id)
+    if result is None:
+        raise HTTPException(
+            status_code=status.HTTP_404_NOT_FOUND, detail="Release not found"
+        )
+    return result
+
+
+@app.get("/cache/stats")
+async def cache_stats() -> Dict[str, Optional[int]]:
+    """Hit, miss and eviction counters of the release cache."""
+    return release_cache.stats()
 
 
 if __name__ == "__main__":
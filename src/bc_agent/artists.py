@@ -0,0 +1,186 @@
+"""Artist related database operations shared by the API and the CLI."""
+import re
+from typing import Dict, Iterable, List, Optional
+
+from .cache import invalidate_releases
+from .db import IN_CHUNK, as_datetime, sqlite_db
+from .feed import drop_feeds
+from .model import Artist, ArtistRow, BulkResult
+from .stats import remove_stats
+
+# Nicknames are the subdomain of the artist page on bandcamp.com.
+NICKNAME_PATTERN = re.compile(r"^[A-Za-z0-9_-]+$")
+
+# Statuses of the items of bulk operations.
+CREATED = "created"
+EXISTS = "exists"
+INVALID = "invalid"
+DELETED = "deleted"
+NOT_FOUND = "not_found"
+
+
+def valid_nickname(nickname: str) -> bool:
+    """Check that `nickname` only has letters, digits, underscores and dashes."""
+    return bool(NICKNAME_PATTERN.match(nickname))
+
+
+def list_artists(db_name: str) -> List[ArtistRow]:
+    """List all registered artists, as records rather than validated models."""
+    with sqlite_db(db_name) as conn:
+        cursor = conn.cursor()
+        cursor.execute("SELECT nickname, id, last_checked FROM artists")
+        rows = cursor.fetchall()
+    return [
+        ArtistRow(nickname, artist_id, as_datetime(last_checked))
+        for nickname, artist_id, last_checked in rows
+    ]
+
+
+def get_artist(db_name: str, artist_id: int) -> Optional[Artist]:
+    """Get an artist by id, None if there is no such artist."""
+    with sqlite_db(db_name) as conn:
+        cursor = conn.cursor()
+        cursor.execute(
+            "SELECT id, nickname, last_checked FROM artists WHERE id = ?", (artist_id,)
+        )
+        row = cursor.fetchone()
+        if not row:
+            return None
+        return Artist(id=row[0], nickname=row[1], last_checked=row[2])
+
+
+def create_artist(db_name: str, nickname: str) -> Optional[Artist]:
+    """Add a new artist, None if the nickname is already registered."""
+    with sqlite_db(db_name) as conn:
+        cursor = conn.cursor()
+        cursor.execute(
+            "INSERT INTO artists (nickname) VALUES (?) ON CONFLICT (nickname) DO NOTHING",
+            (nickname,),
+        )
+        if cursor.rowcount == 0:
+            return None
+        artist_id = cursor.lastrowid
+        conn.commit()
+    invalidate_releases()
+    return Artist(id=artist_id, nickname=nickname, last_checked=None)
+
+
+def delete_artist(db_name: str, artist_id: int) -> bool:
+    """Delete an artist and its releases, False if there is no such artist."""
+    with sqlite_db(db_name) as conn:
+        cursor = conn.cursor()
+        cursor.execute("DELETE FROM artists WHERE id = ?", (artist_id,))
+        if cursor.rowcount == 0:
+            return False
+        _delete_releases(cursor, [artist_id])
+        drop_feeds(cursor, [artist_id])
+        conn.commit()
+    invalidate_releases()
+    return True
+
+
+def _delete_releases(cursor, artist_ids: Iterable[int]):
+    """Delete the releases and tracks of deleted artists with their stats.
+
+    Release links are unique, so releases left behind would keep those of an
+    artist that is added again from being stored. The triggers of the search
+    index drop their rows as well.
+    """
+    artist_ids = list(artist_ids)
+    remove_stats(cursor, artist_ids)
+    params = [(artist_id,) for artist_id in artist_ids]
+    cursor.executemany(
+        "DELETE FROM tracks WHERE release_id IN (SELECT id FROM releases WHERE artist_id = ?)",
+        params,
+    )
+    cursor.executemany("DELETE FROM releases WHERE artist_id = ?", params)
+
+
+def _find(cursor, column: str, values: List) -> Dict:
+    """Map the `column` values that exist in artists to their (id, nickname)."""
+    found = {}
+    for start in range(0, len(values), IN_CHUNK):
+        chunk = values[start : start + IN_CHUNK]
+        cursor.execute(
+            f"SELECT {column}, id, nickname FROM artists "
+            f"WHERE {column} IN ({','.join('?' * len(chunk))})",
+            chunk,
+        )
+        found.update((row[0], (row[1], row[2])) for row in cursor.fetchall())
+    return found
+
+
+def create_artists(db_name: str, nicknames: Iterable[str]) -> List[BulkResult]:
+    """Add many artists in one transaction.
+
+    Returns one result per given nickname, in order: `created`, `exists` (also
+    for repetitions within `nicknames`) or `invalid`.
+    """
+    nicknames = list(nicknames)
+    valid = list(dict.fromkeys(n for n in nicknames if valid_nickname(n)))
+    with sqlite_db(db_name) as conn:
+        cursor = conn.cursor()
+        cursor.execute("BEGIN IMMEDIATE")
+        existing = _find(cursor, "nickname", valid)
+        cursor.executemany(
+            "INSERT INTO artists (nickname) VALUES (?) ON CONFLICT (nickname) DO NOTHING",
+            [(nickname,) for nickname in valid if nickname not in existing],
+        )
+        ids = _find(cursor, "nickname", valid)
+        conn.commit()
+
+    results, created = [], set()
+    for nickname in nicknames:
+        if nickname not in ids:
+            results.append(BulkResult(status=INVALID, nickname=nickname))
+            continue
+        if nickname in existing or nickname in created:
+            status = EXISTS
+        else:
+            status = CREATED
+            created.add(nickname)
+        results.append(
+            BulkResult(status=status, nickname=nickname, id=ids[nickname][0])
+        )
+    if created:
+        invalidate_releases()
+    return results
+
+
+def delete_artists(
+    db_name: str, ids: Iterable[int] = (), nicknames: Iterable[str] = ()
+) -> List[BulkResult]:
+    """Delete many artists and their releases in one transaction.
+
+    Returns one result per given id and then per given nickname: `deleted` or
+    `not_found` (also for artists given more than once).
+    """
+    ids, nicknames = list(ids), list(nicknames)
+    with sqlite_db(db_name) as conn:
+        cursor = conn.cursor()
+        cursor.execute("BEGIN IMMEDIATE")
+        by_id = _find(cursor, "id", list(dict.fromkeys(ids)))
+        by_nickname = _find(cursor, "nickname", list(dict.fromkeys(nicknames)))
+        doomed = {artist_id for artist_id, _ in by_id.values()}
+        doomed.update(artist_id for artist_id, _ in by_nickname.values())
+        cursor.executemany(
+            "DELETE FROM artists WHERE id = ?", [(artist_id,) for artist_id in doomed]
+        )
+        if doomed:
+            _delete_releases(cursor, doomed)
+            drop_feeds(cursor, doomed)
+        conn.commit()
+
+    results, deleted = [], set()
+    for key, found in [(i, by_id) for i in ids] + [(n, by_nickname) for n in nicknames]:
+        if key in found and found[key][0] not in deleted:
+            artist_id, nickname = found[key]
+            deleted.add(artist_id)
+            results.append(BulkResult(status=DELETED, nickname=nickname, id=artist_id))
+        elif isinstance(key, int):
+            results.append(BulkResult(status=NOT_FOUND, id=key))
+        else:
+            results.append(BulkResult(status=NOT_FOUND, nickname=key))
+    if deleted:
+        invalidate_releases()
+    return results
@@ -0,0 +1,137 @@
+"""Where the artist commands of the CLI are carried out.
+
+`LocalBackend` runs them in-process against the database, through the
+connection `sqlite_db` keeps for the thread, and needs no running API.
+`HTTPBackend` sends them to the API, reusing one session and its
+keep-alive connection for all requests. Both return the JSON shapes of the
+API, so the commands do not care which one they talk to.
+
+The modules a backend needs are imported when it is created, to keep the
+startup of the CLI fast.
+
+Since the CLI runs from cron, requests to the API time out after `TIMEOUT`
+and any failure to reach it is reported as a `BackendError`.
+"""
+from typing import Dict, Iterable, List
+
+from .db import DB_NAME
+
+LOCAL = "local"
+HTTP = "http"
+BACKENDS = (LOCAL, HTTP)
+# (connect, read) timeout of the requests to the API, in seconds.
+TIMEOUT = (5.0, 30.0)
+
+
+class BackendError(Exception):
+    """An operation was rejected, e.g. because the artist already exists, or
+    the API could not be reached."""
+
+
+class _Backend:
+    def close(self):
+        pass
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, *exc_info):
+        self.close()
+
+
+class LocalBackend(_Backend):
+    """Operate on the database directly."""
+
+    def __init__(self, db_name: str = DB_NAME):
+        from . import artists
+
+        self.db_name = db_name
+        self._artists = artists
+
+    def list_artists(self) -> List[Dict]:
+        return [row._asdict() for row in self._artists.list_artists(self.db_name)]
+
+    def create_artist(self, nickname: str) -> Dict:
+        if not self._artists.valid_nickname(nickname):
+            raise BackendError("Nickname may only contain letters, digits, '_' and '-'")
+        artist = self._artists.create_artist(self.db_name, nickname)
+        if artist is None:
+            raise BackendError("Artist already exists")
+        return artist.dict()
+
+    def delete_artist(self, artist_id: int) -> bool:
+        return self._artists.delete_artist(self.db_name, artist_id)
+
+    def create_artists(self, nicknames: Iterable[str]) -> List[Dict]:
+        results = self._artists.create_artists(self.db_name, nicknames)
+        return [result.dict() for result in results]
+
+    def delete_artists(
+        self, ids: Iterable[int] = (), nicknames: Iterable[str] = ()
+    ) -> List[Dict]:
+        results = self._artists.delete_artists(self.db_name, ids, nicknames)
+        return [result.dict() for result in results]
+
+
+class HTTPBackend(_Backend):
+    """Operate through the API at `base_url`."""
+
+    def __init__(self, base_url: str, session=None, timeout=TIMEOUT):
+        import requests
+
+        self.base_url = base_url.rstrip("/")
+        self.session = session if session is not None else requests.Session()
+        self.timeout = timeout
+        self._request_error = requests.RequestException
+
+    def _request(self, method: str, path: str, missing_ok: bool = False, **kwargs):
+        """Send a request to the API and return the response.
+
+        Returns None for a 404 if `missing_ok`, any other error status raises.
+        """
+        url = self.base_url + path
+        try:
+            response = self.session.request(method, url, timeout=self.timeout, **kwargs)
+        except self._request_error as e:
+            raise BackendError(f"Could not reach {url}: {e}")
+        if response.status_code == 404 and missing_ok:
+            return None
+        if response.status_code >= 400:
+            try:
+                detail = response.json()["detail"]
+            except (ValueError, KeyError, TypeError):
+                detail = response.text
+            raise BackendError(f"{response.status_code}: {detail}")
+        return response
+
+    def list_artists(self) -> List[Dict]:
+        return self._request("GET", "/artists").json()
+
+    def create_artist(self, nickname: str) -> Dict:
+        return self._request("POST", "/artists", json={"nickname": nickname}).json()
+
+    def delete_artist(self, artist_id: int) -> bool:
+        response = self._request("DELETE", f"/artists/{artist_id}", missing_ok=True)
+        return response is not None
+
+    def create_artists(self, nicknames: Iterable[str]) -> List[Dict]:
+        body = {"nicknames": list(nicknames)}
+        return self._request("POST", "/artists/bulk", json=body).json()
+
+    def delete_artists(
+        self, ids: Iterable[int] = (), nicknames: Iterable[str] = ()
+    ) -> List[Dict]:
+        body = {"ids": list(ids), "nicknames": list(nicknames)}
+        return self._request("DELETE", "/artists/bulk", json=body).json()
+
+    def close(self):
+        self.session.close()
+
+
+def get_backend(name: str, api_url: str):
+    """Create the backend called `name`, one of `BACKENDS`."""
+    if name == HTTP:
+        return HTTPBackend(api_url)
+    if name == LOCAL:
+        return LocalBackend()
+    raise ValueError(f"Unknown backend {name!r}, use one of {BACKENDS}")
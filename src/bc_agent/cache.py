@@ -0,0 +1,133 @@
+"""In-process cache of release query results."""
+import os
+import threading
+import time
+from collections import OrderedDict
+from typing import Any, Dict, Hashable, Optional, Tuple
+
+from .db import change_counter, sqlite_db
+
+RELEASE_CACHE_SIZE = 256
+# Upper bound of the releases plus tracks held by the release cache, pages
+# are weighed by their rows since they hold from one to thousands of them.
+RELEASE_CACHE_WEIGHT = 50_000
+# How often to look for writes by other processes (e.g. `cli update`).
+RECHECK_INTERVAL = 1.0
+
+
+class LRUCache:
+    """Thread-safe mapping that evicts the least recently used entry.
+
+    Entries are evicted once there are more than `maxsize` of them or their
+    weights add up to more than `maxweight`. An entry heavier than
+    `maxweight` on its own is not stored at all.
+    """
+
+    def __init__(self, maxsize: int, maxweight: Optional[int] = None):
+        self.maxsize = maxsize
+        self.maxweight = maxweight
+        self.weight = 0
+        self.hits = 0
+        self.misses = 0
+        self.evictions = 0
+        self.invalidations = 0
+        # key -> (value, weight)
+        self._data: "OrderedDict[Hashable, Tuple[Any, int]]" = OrderedDict()
+        self._lock = threading.Lock()
+
+    def __len__(self):
+        return len(self._data)
+
+    def get(self, key: Hashable, default=None):
+        with self._lock:
+            try:
+                value, _ = self._data[key]
+            except KeyError:
+                self.misses += 1
+                return default
+            self._data.move_to_end(key)
+            self.hits += 1
+            return value
+
+    def put(
+        self,
+        key: Hashable,
+        value,
+        generation: Optional[int] = None,
+        weight: int = 1,
+    ):
+        """Store `value`, unless the cache was cleared since `generation`.
+
+        Pass the `invalidations` count read before computing `value` to avoid
+        caching a result that an invalidation raced with.
+        """
+        with self._lock:
+            if generation is not None and generation != self.invalidations:
+                return
+            if self.maxweight is not None and weight > self.maxweight:
+                return
+            if key in self._data:
+                self.weight -= self._data[key][1]
+            self._data[key] = (value, weight)
+            self._data.move_to_end(key)
+            self.weight += weight
+            while len(self._data) > self.maxsize or (
+                self.maxweight is not None and self.weight > self.maxweight
+            ):
+                _, (_, evicted) = self._data.popitem(last=False)
+                self.weight -= evicted
+                self.evictions += 1
+
+    def clear(self):
+        with self._lock:
+            self._data.clear()
+            self.weight = 0
+            self.invalidations += 1
+
+    def stats(self) -> Dict[str, Optional[int]]:
+        with self._lock:
+            return {
+                "size": len(self._data),
+                "maxsize": self.maxsize,
+                "weight": self.weight,
+                "maxweight": self.maxweight,
+                "hits": self.hits,
+                "misses": self.misses,
+                "evictions": self.evictions,
+                "invalidations": self.invalidations,
+            }
+
+
+release_cache = LRUCache(RELEASE_CACHE_SIZE, RELEASE_CACHE_WEIGHT)
+
+# database path -> (change counter, time it was read)
+_generations: Dict[str, Tuple[int, float]] = {}
+_generations_lock = threading.Lock()
+
+
+def invalidate_releases():
+    """Drop all cached release pages, call after committing release changes."""
+    release_cache.clear()
+
+
+def check_releases_generation(db_name: str, counter: Optional[int] = None):
+    """Invalidate the cache if another process changed the releases.
+
+    Writes from this process invalidate the cache directly, this catches the
+    ones from other processes by comparing the database's change counter at
+    most once per `RECHECK_INTERVAL`. Callers that just read the counter pass
+    it as `counter` to have it compared right away, so that what they read
+    next from the cache is no older than it.
+    """
+    path = os.path.abspath(db_name)
+    now = time.monotonic()
+    with _generations_lock:
+        generation = _generations.get(path)
+        if counter is None:
+            if generation is not None and now - generation[1] < RECHECK_INTERVAL:
+                return
+            with sqlite_db(db_name) as conn:
+                counter = change_counter(conn)
+        _generations[path] = (counter, now)
+    if generation is not None and generation[0] != counter:
+        invalidate_releases()
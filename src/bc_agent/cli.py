@@ -1,100 +1,383 @@
-"""Command line interface to interact with the database."""
-from typing import List
+"""Command line interface to interact with the database.
+
+The CLI is run from cron and shell pipelines, so it starts fast: only the
+modules needed to declare the commands are imported up front. Commands
+import the HTTP client, the crawler, pydantic models and tabulate when they
+run. `tests/test_startup.py` holds the import time to a budget.
+"""
+import json
+import logging
+from collections import Counter
+from itertools import islice
+from typing import TYPE_CHECKING, Callable, Iterable, Iterator, List
 import click
-import requests
 from datetime import datetime, timedelta
 
-from tabulate import tabulate
-from bc_agent.model import ReleaseDenorm
-from bc_agent.music_data import DB_NAME, get_releases_by_date, update_releases_db
+from bc_agent.backends import BACKENDS, LOCAL, BackendError, get_backend
+from bc_agent.crawl import DEFAULT_CONCURRENCY, DEFAULT_PER_HOST
+from bc_agent.db import DB_NAME
+from bc_agent.export import EXPORT_CHUNK, FORMATS, NDJSON, TABLES
+from bc_agent.jobs import (
+    DEFAULT_BATCH_SIZE,
+    DEFAULT_LEASE_SECONDS,
+    DEFAULT_POLL_SECONDS,
+)
+from bc_agent.limits import BULK_LIMIT
+from bc_agent.search import KINDS, SEARCH_LIMIT
+
+if TYPE_CHECKING:
+    from bc_agent.profiling import Timing
 
 BASE_URL = "http://localhost:8000"
 
+
 @click.group()
 def cli():
     """Just the CLI."""
-    pass
+    logging.basicConfig(level=logging.INFO)
 
 
 @cli.group()
-def artist():
+@click.option(
+    "--backend",
+    type=click.Choice(BACKENDS),
+    default=LOCAL,
+    show_default=True,
+    envvar="BC_BACKEND",
+    help="Change the database directly, or through the API at --api-url.",
+)
+@click.option(
+    "--api-url",
+    default=BASE_URL,
+    show_default=True,
+    envvar="BC_API_URL",
+    help="Base URL of the API used by the http backend.",
+)
+@click.pass_context
+def artist(ctx, backend, api_url):
     """Group for artist related commands."""
-    pass
+    ctx.obj = (backend, api_url)
 
 
-def add_artist(name):
+def open_backend(ctx: click.Context):
+    """Create the backend chosen for the `artist` group, closed with `ctx`."""
+    return ctx.with_resource(get_backend(*ctx.obj))
+
+
+def add_artist(backend, name):
     """
-    Add a new artist with the given name by sending a POST request to the API.
+    Add a new artist with the given name through the backend.
 
     :param name: The name of the artist to add.
     """
-    artist = {"nickname": name}
-    response = requests.post(f"{BASE_URL}/artists", json=artist)
-    if response.ok:
-        click.echo("Artist added successfully!")
+    try:
+        backend.create_artist(name)
+    except BackendError as e:
+        click.echo(f"Error adding artist: {e}")
     else:
-        click.echo(f"Error adding artist: {response.text}")
+        click.echo("Artist added successfully!")
 
 
-@click.command()
+@artist.command()
 @click.option("--name", prompt=True, help="The name of the artist to add.")
-def add(name):
+@click.pass_context
+def add(ctx, name):
     """
-    Add a new artist with the given name by sending a POST request to the API.
+    Add a new artist with the given name.
 
     Example usage: `python app.py add --name 'The Beatles'`
 
     :param name: The name of the artist to add.
     """
-    add_artist(name)
+    add_artist(open_backend(ctx), name)
 
 
 @artist.command()
 @click.option("--name")
-def delete(name):
+@click.pass_context
+def delete(ctx, name):
     """Delete an artist from the database."""
-    if not name:
-        # List all artists and prompt the user to select one
-        response = requests.get(f"{BASE_URL}/artists")
-        response.raise_for_status()
-        artists = response.json()
-        choices = "\n".join(
-            f"{artist['id']}: {artist['nickname']}" for artist in artists
-        )
-        artist_id = click.prompt(f"Select artist to delete:\n{choices}", type=int)
+    backend = open_backend(ctx)
+    try:
+        if name:
+            [result] = backend.delete_artists(nicknames=[name])
+            artist_id, deleted = result["id"], result["status"] == "deleted"
+        else:
+            # List all artists and prompt the user to select one
+            artists = backend.list_artists()
+            choices = "\n".join(
+                f"{artist['id']}: {artist['nickname']}" for artist in artists
+            )
+            artist_id = click.prompt(f"Select artist to delete:\n{choices}", type=int)
 
-        # Get the nickname of the selected artist
-        name = next(
-            artist["nickname"] for artist in artists if artist["id"] == artist_id
-        )
+            # Get the nickname of the selected artist
+            name = next(
+                (artist["nickname"] for artist in artists if artist["id"] == artist_id),
+                None,
+            )
+            deleted = backend.delete_artist(artist_id)
+    except BackendError as e:
+        raise click.ClickException(f"Error deleting artist: {e}")
 
-    # Delete the artist with the matching ID
-    response = requests.delete(f"{BASE_URL}/artists/{artist_id}")
-    response.raise_for_status()
-    if response.status_code == 200 or response.status_code == 204:
+    if deleted:
         click.echo(f"Artist '{name}' (id: {artist_id}) deleted successfully!")
-    elif response.status_code == 404:
-        click.echo("Artist not found.")
     else:
-        click.echo(f"Error deleting artist: {response.text}")
+        click.echo("Artist not found.")
+
+
+def read_nicknames(lines: Iterable[str]) -> Iterator[str]:
+    """Yield the nicknames of a file, one per line, skipping blanks and `#` comments."""
+    for line in lines:
+        nickname = line.split("#", 1)[0].strip()
+        if nickname:
+            yield nickname
+
+
+def batches(items: Iterable, size: int) -> Iterator[list]:
+    """Split `items` into lists of at most `size` items without reading ahead."""
+    items = iter(items)
+    while batch := list(islice(items, size)):
+        yield batch
+
+
+def run_batches(
+    operation: Callable[[list], List[dict]], batches: Iterable[list]
+) -> Counter:
+    """Apply a bulk operation to each batch, echo failed items, count statuses."""
+    statuses: Counter = Counter()
+    for batch in batches:
+        try:
+            results = operation(batch)
+        except BackendError as e:
+            raise click.ClickException(f"Bulk request failed: {e}")
+        for result in results:
+            statuses[result["status"]] += 1
+            if result["status"] in ("invalid", "not_found"):
+                name = result["nickname"] or result["id"]
+                click.echo(f"{name}: {result['status']}", err=True)
+    return statuses
+
+
+def echo_statuses(statuses: Counter):
+    click.echo(", ".join(f"{count} {status}" for status, count in statuses.items()))
+
+
+@artist.command("import")
+@click.argument("file", type=click.File("r"), default="-")
+@click.option(
+    "--batch-size",
+    default=500,
+    show_default=True,
+    type=click.IntRange(min=1, max=BULK_LIMIT),
+    help="Number of nicknames added per transaction (and request).",
+)
+@click.pass_context
+def import_artists(ctx, file, batch_size):
+    """
+    Add the artists listed in FILE (one nickname per line, default stdin).
+
+    Example usage: `cat artists.txt | python cli.py artist import`
+    """
+    backend = open_backend(ctx)
+    statuses = run_batches(
+        backend.create_artists, batches(read_nicknames(file), batch_size)
+    )
+    echo_statuses(statuses)
+
+
+@artist.command("bulk-delete")
+@click.argument("file", type=click.File("r"), default="-")
+@click.option(
+    "--batch-size",
+    default=500,
+    show_default=True,
+    type=click.IntRange(min=1, max=BULK_LIMIT),
+    help="Number of nicknames deleted per transaction (and request).",
+)
+@click.pass_context
+def bulk_delete(ctx, file, batch_size):
+    """Delete the artists listed in FILE (one nickname per line, default stdin)."""
+    backend = open_backend(ctx)
+    statuses = run_batches(
+        lambda batch: backend.delete_artists(nicknames=batch),
+        batches(read_nicknames(file), batch_size),
+    )
+    echo_statuses(statuses)
 
 
 @artist.command()
-def list_artists():
+@click.pass_context
+def list_artists(ctx):
     """List all artists in the database."""
-    response = requests.get("http://localhost:8000/artists")
-    if response.status_code == 200:
-        for artist in response.json():
-            click.echo(
-                f"{artist['id']} - {artist['nickname']} ({artist['last_checked']})"
-            )
-    else:
-        click.echo(f"Error getting artists: {response.text}")
+    try:
+        artists = open_backend(ctx).list_artists()
+    except BackendError as e:
+        raise click.ClickException(f"Error listing artists: {e}")
+    for artist in artists:
+        click.echo(f"{artist['id']} - {artist['nickname']} ({artist['last_checked']})")
 
 
 @cli.command()
-def update():
-    update_releases_db()
+@click.option(
+    "--concurrency",
+    default=DEFAULT_CONCURRENCY,
+    show_default=True,
+    type=click.IntRange(min=1),
+    help="Maximum number of pages downloaded in parallel.",
+)
+@click.option(
+    "--per-host",
+    default=DEFAULT_PER_HOST,
+    show_default=True,
+    type=click.IntRange(min=1),
+    help="Maximum number of parallel downloads from the same artist page.",
+)
+@click.option(
+    "--force",
+    is_flag=True,
+    help="Check all artists, not only the ones due according to their release history.",
+)
+@click.option(
+    "--summary",
+    type=click.File("w"),
+    help="Write a JSON summary of the run with its metrics to this file ('-' for stdout).",
+)
+@click.option(
+    "--profile",
+    type=click.Path(dir_okay=False, writable=True),
+    help="Check the artists one by one under cProfile, dump the stats to this "
+    "file and print where the time of each artist went.",
+)
+def update(concurrency, per_host, force, summary, profile):
+    """Fetch new releases of the artists due for a check into the database."""
+    from bc_agent.music_data import update_releases_db
+    from bc_agent.profiling import profile_update
+
+    if profile:
+        if concurrency > 1:
+            click.echo("--profile checks one artist at a time", err=True)
+        print_profile(*profile_update(profile, force=force), profile)
+        return
+    result = update_releases_db(concurrency=concurrency, per_host=per_host, force=force)
+    if summary:
+        json.dump(result, summary, indent=2)
+        summary.write("\n")
+
+
+@cli.command()
+@click.option(
+    "--concurrency",
+    default=DEFAULT_CONCURRENCY,
+    show_default=True,
+    type=click.IntRange(min=1),
+    help="Maximum number of pages downloaded in parallel.",
+)
+@click.option(
+    "--per-host",
+    default=DEFAULT_PER_HOST,
+    show_default=True,
+    type=click.IntRange(min=1),
+    help="Maximum number of parallel downloads from the same artist page.",
+)
+@click.option(
+    "--batch-size",
+    default=DEFAULT_BATCH_SIZE,
+    show_default=True,
+    type=click.IntRange(min=1),
+    help="Number of artists claimed at once.",
+)
+@click.option(
+    "--lease",
+    default=DEFAULT_LEASE_SECONDS,
+    show_default=True,
+    type=click.FloatRange(min=1),
+    help="Seconds after which the artists of a worker that stopped renewing "
+    "its lease are handed to other workers.",
+)
+@click.option("--worker-id", help="Name of this worker, defaults to host:pid.")
+@click.option(
+    "--force",
+    is_flag=True,
+    help="Queue all artists when starting a cycle, not only the ones due.",
+)
+@click.option(
+    "--follow",
+    is_flag=True,
+    help="Keep starting new cycles instead of exiting when the queue is empty.",
+)
+@click.option(
+    "--poll",
+    default=DEFAULT_POLL_SECONDS,
+    show_default=True,
+    type=click.FloatRange(min=0),
+    help="Seconds to wait for due artists with --follow.",
+)
+@click.option(
+    "--summary",
+    type=click.File("w"),
+    help="Write a JSON summary of the run with its metrics to this file ('-' for stdout).",
+)
+def worker(
+    concurrency, per_host, batch_size, lease, worker_id, force, follow, poll, summary
+):
+    """Check artists from the job queue shared with other workers.
+
+    Run any number of workers, on one or several machines, against the same
+    database: each artist is checked by one of them per cycle.
+    """
+    from bc_agent.jobs import run_worker
+
+    result = run_worker(
+        worker=worker_id,
+        batch_size=batch_size,
+        lease=lease,
+        concurrency=concurrency,
+        per_host=per_host,
+        force=force,
+        follow=follow,
+        poll=poll,
+    )
+    if summary:
+        json.dump(result, summary, indent=2)
+        summary.write("\n")
+
+
+def print_profile(artists: List["Timing"], pages: List["Timing"], output: str, top=10):
+    """Print the time of each artist, the slowest pages and the hot functions."""
+    import pstats
+
+    from tabulate import tabulate
+
+    def name(timing: "Timing") -> str:
+        return timing.name if timing.ok else f"{timing.name} (failed)"
+
+    artists = sorted(artists, key=lambda timing: timing.wall, reverse=True)
+    click.echo(
+        tabulate(
+            [
+                [name(t), t.wall, t.network, t.parse, t.db, t.other, t.pages, t.tracks]
+                for t in artists
+            ],
+            headers=["artist", "wall s", "network s", "parse s", "db s", "other s"]
+            + ["pages", "tracks"],
+            floatfmt=".3f",
+        )
+    )
+
+    pages = sorted(pages, key=lambda timing: timing.wall, reverse=True)[:top]
+    click.echo(f"\nSlowest {len(pages)} release pages:")
+    click.echo(
+        tabulate(
+            [[name(t), t.wall, t.network, t.parse, t.tracks] for t in pages],
+            headers=["release", "wall s", "network s", "parse s", "tracks"],
+            floatfmt=".3f",
+        )
+    )
+
+    click.echo(f"\nHottest {top} functions:")
+    pstats.Stats(output).sort_stats(pstats.SortKey.TIME).print_stats(top)
+    click.echo(f"Profile written to {output}, open it with e.g. `python -m pstats`")
+
 
 @cli.command()
 @click.option(
@@ -104,7 +387,8 @@ def update():
     ),
     help="Date in format YYYYMMDD",
 )
-def new(date):
+@click.option("--tracks", is_flag=True, help="List the tracks below each release.")
+def new(date, tracks):
     """Return new releases based on the given date.
 
     It takes one argument `date`, which is the date of the new releases to be
@@ -114,25 +398,121 @@ def new(date):
     `unmap` function that returns a list of attributes for each release and uses
     it to create a table with the specific fields found. The table is formatted,
     and the headers and values are printed using the `tabulate` function.
+    With `--tracks`, every release is followed by a row per track.
     """
-    releases = get_releases_by_date(date, DB_NAME)
+    from tabulate import tabulate
+
+    from bc_agent.model import ReleaseDenorm
+    from bc_agent.music_data import get_releases_by_date
+
+    releases = get_releases_by_date(date, DB_NAME, tracks=tracks)
     required_fields = [
         field
         for field in ReleaseDenorm.__fields__.keys()
         if ReleaseDenorm.__fields__[field].required
     ]
 
-    def unmap(release: ReleaseDenorm, fields: List[str]):
+    def unmap(release, fields: List[str]):
         return [getattr(release, field) for field in fields]
 
     use_fields = ["release_date"] + required_fields
+    if not tracks:
+        rows = [unmap(release, use_fields) for release in releases]
+        print(tabulate(rows, headers=use_fields))
+        return
+
+    rows = []
+    for release in releases:
+        rows.append(unmap(release, use_fields) + [""])
+        rows.extend(
+            ["", f"{track.number}. {track.title}", "", track.link, track.duration]
+            for track in release.tracks
+        )
+    print(tabulate(rows, headers=use_fields + ["duration"]))
 
-    print(
+
+@cli.command("search")
+@click.argument("query", nargs=-1, required=True)
+@click.option(
+    "--kind",
+    type=click.Choice(KINDS),
+    multiple=True,
+    help="Only show these kinds of results, can be repeated.",
+)
+@click.option(
+    "--limit", default=SEARCH_LIMIT, show_default=True, type=click.IntRange(1)
+)
+@click.option("--page", default=1, show_default=True, type=click.IntRange(1))
+def search_command(query, kind, limit, page):
+    """Search artists, releases and tracks in the database, best matches first."""
+    from tabulate import tabulate
+
+    from bc_agent.search import search
+
+    try:
+        hits, next_offset = search(
+            DB_NAME, " ".join(query), list(kind), limit, (page - 1) * limit
+        )
+    except ValueError as e:
+        raise click.BadParameter(str(e), param_hint="QUERY")
+    click.echo(
         tabulate(
-            [unmap(release, use_fields) for release in releases],
-            headers=use_fields,
+            [[hit.kind, hit.title, hit.artist, hit.link or ""] for hit in hits],
+            headers=["kind", "title", "artist", "link"],
         )
     )
+    if next_offset is not None:
+        click.echo(f"\nMore results with --page {page + 1}")
+
+
+@cli.command()
+def rebuild_search():
+    """Rebuild the search index of the database from scratch."""
+    from bc_agent.search import rebuild_search_index
+
+    rebuild_search_index(DB_NAME)
+    click.echo("Search index rebuilt.")
+
+
+@cli.command("export")
+@click.argument("table", type=click.Choice(list(TABLES)))
+@click.option(
+    "--format", "fmt", type=click.Choice(FORMATS), default=NDJSON, show_default=True
+)
+@click.option(
+    "-o",
+    "--output",
+    type=click.File("wb"),
+    default="-",
+    help="File to write to, stdout by default.",
+)
+@click.option(
+    "--since-id",
+    type=click.IntRange(0),
+    help="Only export the releases after this release id, and their tracks.",
+)
+@click.option(
+    "--since",
+    type=click.DateTime(["%Y%m%d"]),
+    help="Only export the releases of this date (YYYYMMDD) or later and their "
+    "tracks, or the artists checked since then.",
+)
+@click.option(
+    "--chunk-size",
+    default=EXPORT_CHUNK,
+    show_default=True,
+    type=click.IntRange(1),
+    help="Rows read and written at a time.",
+)
+def export_command(table, fmt, output, since_id, since, chunk_size):
+    """Export a table of the database for analytics, in constant memory."""
+    from bc_agent.export import export
+
+    try:
+        rows = export(DB_NAME, table, fmt, output, since_id, since, chunk_size)
+    except (ValueError, RuntimeError) as e:
+        raise click.UsageError(str(e))
+    click.echo(f"Exported {rows} {table}.", err=True)
 
 
 if __name__ == "__main__":
@@ -0,0 +1,44 @@
+"""Concurrency primitives for crawling bandcamp."""
+import threading
+from contextlib import contextmanager
+from typing import Dict
+from urllib.parse import urlsplit
+
+DEFAULT_CONCURRENCY = 1
+DEFAULT_PER_HOST = 2
+
+
+class HostLimiter:
+    """Bound the number of in-flight requests globally and per host.
+
+    Every artist lives on its own subdomain, so the per-host limit keeps us
+    from hammering a single artist page with all of its release downloads at
+    once while the global limit caps the total number of open requests.
+    """
+
+    def __init__(self, max_total: int, max_per_host: int = DEFAULT_PER_HOST):
+        if max_total < 1 or max_per_host < 1:
+            raise ValueError("Limits must be positive integers")
+        self.max_total = max_total
+        self.max_per_host = max_per_host
+        self._total = threading.BoundedSemaphore(max_total)
+        self._hosts: Dict[str, threading.BoundedSemaphore] = {}
+        self._lock = threading.Lock()
+
+    def _host_semaphore(self, host: str) -> threading.BoundedSemaphore:
+        with self._lock:
+            semaphore = self._hosts.get(host)
+            if semaphore is None:
+                semaphore = threading.BoundedSemaphore(self.max_per_host)
+                self._hosts[host] = semaphore
+            return semaphore
+
+    @contextmanager
+    def slot(self, url: str):
+        """Block until a request to `url` may be issued."""
+        host_semaphore = self._host_semaphore(urlsplit(url).netloc)
+        # Acquire the host slot first so that waiting on a busy host does not
+        # hold on to one of the global slots.
+        with host_semaphore:
+            with self._total:
+                yield
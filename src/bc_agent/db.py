@@ -1,26 +1,60 @@
-"""Database related stuff."""
+"""Database related stuff.
+
+Connections are opened once per thread and database file and then reused.
+The schema is created and migrated the first time a database is used in a
+process, not on every `sqlite_db` call.
+"""
+import os
 import sqlite3
+import threading
+import weakref
 from contextlib import contextmanager
+from datetime import datetime
+from typing import Callable, Dict, List, Optional, Union
 
+DB_NAME = "bandcamp.db"
+# Applied to every new connection.
+PRAGMAS = {
+    "synchronous": "NORMAL",
+    "mmap_size": 256 * 1024 * 1024,
+    "cache_size": -64 * 1024,  # negative values are KiB
+    "temp_store": "MEMORY",
+    "busy_timeout": 5000,
+}
+# SQLite limits the number of host parameters of a statement, so long `IN`
+# lists are split into chunks of this size.
+IN_CHUNK = 500
 
-@contextmanager
-def sqlite_db(db_name):
-    """Connect to SQLITE DB and create Schema if not exists."""
-    if not db_name.endswith(".db"):
-        raise ValueError("Not a SQLite database")
 
-    conn = sqlite3.connect(db_name)
-    cursor = conn.cursor()
+class _Connection(sqlite3.Connection):
+    """Connection that can be weakly referenced and knows if it was closed."""
 
+    closed = False
+
+    def close(self):
+        super().close()
+        self.closed = True
+
+
+def _create_schema(cursor):
     cursor.execute(
         """
         CREATE TABLE IF NOT EXISTS artists (
             id INTEGER PRIMARY KEY AUTOINCREMENT,
             nickname TEXT,
-            last_checked TIMESTAMP
+            last_checked TIMESTAMP,
+            etag TEXT,
+            last_modified TEXT,
+            grid_hash TEXT
         )
     """
     )
+    # Databases created before the conditional GETs lack the validators.
+    _add_missing_columns(
+        cursor,
+        "artists",
+        {"etag": "TEXT", "last_modified": "TEXT", "grid_hash": "TEXT"},
+    )
 
     cursor.execute(
         """
@@ -49,11 +83,469 @@ def sqlite_db(db_name):
     """
     )
 
+
+def _add_indexes(cursor):
+    cursor.execute(
+        "CREATE INDEX IF NOT EXISTS releases_release_date ON releases (release_date)"
+    )
+    cursor.execute(
+        "CREATE INDEX IF NOT EXISTS releases_artist_id ON releases (artist_id)"
+    )
+    cursor.execute(
+        "CREATE INDEX IF NOT EXISTS tracks_release_id ON tracks (release_id, number)"
+    )
+
+    # The unique indexes would fail on duplicates inserted before they existed,
+    # keep the oldest row of each and move its children over.
+    cursor.execute(
+        """
+        CREATE TEMP TABLE duplicate_artists AS
+        SELECT a.id, k.keep FROM artists a JOIN (
+            SELECT nickname, MIN(id) AS keep FROM artists
+            WHERE nickname IS NOT NULL GROUP BY nickname HAVING COUNT(*) > 1
+        ) k USING (nickname)
+        WHERE a.id != k.keep
+        """
+    )
+    cursor.execute(
+        """
+        UPDATE releases SET artist_id = (
+            SELECT keep FROM duplicate_artists WHERE id = releases.artist_id
+        )
+        WHERE artist_id IN (SELECT id FROM duplicate_artists)
+        """
+    )
+    cursor.execute("DELETE FROM artists WHERE id IN (SELECT id FROM duplicate_artists)")
+    cursor.execute(
+        """
+        CREATE TEMP TABLE duplicate_releases AS
+        SELECT r.id FROM releases r JOIN (
+            SELECT link, MIN(id) AS keep FROM releases
+            WHERE link IS NOT NULL GROUP BY link HAVING COUNT(*) > 1
+        ) k USING (link)
+        WHERE r.id != k.keep
+        """
+    )
+    cursor.execute(
+        "DELETE FROM tracks WHERE release_id IN (SELECT id FROM duplicate_releases)"
+    )
+    cursor.execute(
+        "DELETE FROM releases WHERE id IN (SELECT id FROM duplicate_releases)"
+    )
+    cursor.execute("DROP TABLE duplicate_artists")
+    cursor.execute("DROP TABLE duplicate_releases")
+
+    cursor.execute(
+        "CREATE UNIQUE INDEX IF NOT EXISTS artists_nickname ON artists (nickname)"
+    )
+    cursor.execute("CREATE UNIQUE INDEX IF NOT EXISTS releases_link ON releases (link)")
+
+
+def _add_change_counter(cursor):
+    # Bumped by every write that changes what the release listings show, so
+    # readers can tell whether anything changed without looking at the data.
+    cursor.execute(
+        """
+        CREATE TABLE IF NOT EXISTS meta (
+            key TEXT PRIMARY KEY,
+            value
+        )
+        """
+    )
+    cursor.execute(
+        "INSERT OR IGNORE INTO meta (key, value) VALUES ('change_counter', 0)"
+    )
+    bump = "UPDATE meta SET value = value + 1 WHERE key = 'change_counter';"
+    for name, event in [
+        ("releases_insert", "AFTER INSERT ON releases"),
+        ("releases_update", "AFTER UPDATE ON releases"),
+        ("releases_delete", "AFTER DELETE ON releases"),
+        ("artists_rename", "AFTER UPDATE OF nickname ON artists"),
+        ("artists_delete", "AFTER DELETE ON artists"),
+    ]:
+        cursor.execute(
+            f"CREATE TRIGGER IF NOT EXISTS {name}_changes {event} BEGIN {bump} END"
+        )
+
+
+def _add_feeds(cursor):
+    # Pre-rendered RSS feeds, see feed.py. `items` holds the rendered entries
+    # so new releases can be merged in without rendering the old ones again.
+    cursor.execute(
+        """
+        CREATE TABLE IF NOT EXISTS feeds (
+            name TEXT PRIMARY KEY,
+            items TEXT NOT NULL,
+            body TEXT NOT NULL,
+            etag TEXT NOT NULL,
+            last_modified TEXT NOT NULL
+        )
+        """
+    )
+
+
+# Full-text indexes over the text columns of the tables, see search.py.
+# Deletes and updates reach them through triggers. New releases and tracks are
+# indexed by `search.index_releases` instead: every row fired trigger flushes
+# the index, which makes bulk inserts about ten times slower than one
+# INSERT ... SELECT. The indexes keep their own copy of the text, so removing
+# a row that was never indexed is harmless.
+SEARCH_INDEXES = {
+    "artists_fts": ("artists", "nickname"),
+    "releases_fts": ("releases", "title"),
+    "tracks_fts": ("tracks", "title"),
+}
+
+
+def _add_search(cursor):
+    for index, (table, column) in SEARCH_INDEXES.items():
+        cursor.execute(
+            f"""
+            CREATE VIRTUAL TABLE IF NOT EXISTS {index} USING fts5 (
+                {column},
+                tokenize='unicode61 remove_diacritics 2',
+                prefix='2 3'
+            )
+            """
+        )
+        insert = f"INSERT INTO {index} (rowid, {column}) VALUES (new.id, new.{column});"
+        delete = f"DELETE FROM {index} WHERE rowid = old.id;"
+        triggers = [
+            ("delete", f"AFTER DELETE ON {table}", delete),
+            ("update", f"AFTER UPDATE OF {column} ON {table}", delete + insert),
+        ]
+        if table == "artists":
+            triggers.append(("insert", f"AFTER INSERT ON {table}", insert))
+        for name, event, body in triggers:
+            cursor.execute(
+                f"CREATE TRIGGER IF NOT EXISTS {index}_{name} {event} BEGIN {body} END"
+            )
+        cursor.execute(
+            f"INSERT INTO {index} (rowid, {column}) SELECT id, {column} FROM {table}"
+        )
+
+
+def _add_crawl_jobs(cursor):
+    # Queue of the artists to check in the current crawl cycle, see jobs.py.
+    # There is one row per artist, reset when a new cycle starts. Lease times
+    # are unix timestamps.
+    cursor.execute(
+        """
+        CREATE TABLE IF NOT EXISTS crawl_jobs (
+            artist_id INTEGER PRIMARY KEY,
+            cycle INTEGER NOT NULL,
+            worker TEXT,
+            lease_until REAL,
+            attempts INTEGER NOT NULL DEFAULT 0,
+            done_at REAL,
+            FOREIGN KEY (artist_id) REFERENCES artists(id)
+        )
+        """
+    )
+    cursor.execute(
+        "CREATE INDEX IF NOT EXISTS crawl_jobs_open ON crawl_jobs (done_at, lease_until)"
+    )
+    cursor.execute(
+        """
+        CREATE TRIGGER IF NOT EXISTS artists_delete_jobs AFTER DELETE ON artists
+        BEGIN DELETE FROM crawl_jobs WHERE artist_id = old.id; END
+        """
+    )
+
+
+def _add_duration_seconds(cursor):
+    # Durations as shown by bandcamp ("04:40") in seconds, for aggregates.
+    _add_missing_columns(cursor, "tracks", {"duration_seconds": "INTEGER"})
+    cursor.connection.create_function(
+        "parse_duration", 1, parse_duration, deterministic=True
+    )
+    cursor.execute(
+        "UPDATE tracks SET duration_seconds = parse_duration(duration) "
+        "WHERE duration_seconds IS NULL"
+    )
+
+
+def _add_stats(cursor):
+    # Per release, per artist and catalogue wide counts and runtimes, see
+    # stats.py. `write_results` adds new releases to them, `timed_tracks`
+    # counts the tracks with a known duration for the average track length.
+    cursor.execute(
+        """
+        CREATE TABLE IF NOT EXISTS release_stats (
+            release_id INTEGER PRIMARY KEY,
+            artist_id INTEGER,
+            tracks INTEGER NOT NULL,
+            timed_tracks INTEGER NOT NULL,
+            duration_seconds INTEGER NOT NULL,
+            FOREIGN KEY (release_id) REFERENCES releases(id)
+        )
+        """
+    )
+    cursor.execute(
+        """
+        CREATE TABLE IF NOT EXISTS artist_stats (
+            artist_id INTEGER PRIMARY KEY,
+            releases INTEGER NOT NULL,
+            tracks INTEGER NOT NULL,
+            timed_tracks INTEGER NOT NULL,
+            duration_seconds INTEGER NOT NULL,
+            first_release TIMESTAMP,
+            last_release TIMESTAMP,
+            FOREIGN KEY (artist_id) REFERENCES artists(id)
+        )
+        """
+    )
+    cursor.execute(
+        """
+        CREATE TABLE IF NOT EXISTS catalogue_stats (
+            id INTEGER PRIMARY KEY CHECK (id = 1),
+            releases INTEGER NOT NULL,
+            tracks INTEGER NOT NULL,
+            timed_tracks INTEGER NOT NULL,
+            duration_seconds INTEGER NOT NULL
+        )
+        """
+    )
+    cursor.execute(
+        """
+        CREATE TRIGGER IF NOT EXISTS artists_delete_stats AFTER DELETE ON artists
+        BEGIN DELETE FROM artist_stats WHERE artist_id = old.id; END
+        """
+    )
+    cursor.execute(
+        """
+        INSERT OR REPLACE INTO release_stats
+        SELECT r.id, r.artist_id, COUNT(t.id), COUNT(t.duration_seconds),
+               COALESCE(SUM(t.duration_seconds), 0)
+        FROM releases r LEFT JOIN tracks t ON t.release_id = r.id
+        GROUP BY r.id
+        """
+    )
+    cursor.execute(
+        """
+        INSERT OR REPLACE INTO artist_stats
+        SELECT s.artist_id, COUNT(*), SUM(s.tracks), SUM(s.timed_tracks),
+               SUM(s.duration_seconds), MIN(r.release_date), MAX(r.release_date)
+        FROM release_stats s
+        JOIN releases r ON r.id = s.release_id
+        JOIN artists a ON a.id = s.artist_id
+        GROUP BY s.artist_id
+        """
+    )
+    cursor.execute(
+        """
+        INSERT OR REPLACE INTO catalogue_stats
+        SELECT 1, COUNT(*), COALESCE(SUM(tracks), 0), COALESCE(SUM(timed_tracks), 0),
+               COALESCE(SUM(duration_seconds), 0)
+        FROM release_stats
+        """
+    )
+
+
+def _drop_orphaned_releases(cursor):
+    # Artists used to be deleted without their releases, whose links then kept
+    # the releases of an artist added again from being stored.
+    cursor.execute(
+        """
+        CREATE TEMP TABLE orphaned_releases AS
+        SELECT id FROM releases WHERE artist_id NOT IN (SELECT id FROM artists)
+        """
+    )
+    cursor.execute(
+        "DELETE FROM tracks WHERE release_id IN (SELECT id FROM orphaned_releases)"
+    )
+    cursor.execute(
+        "DELETE FROM release_stats WHERE release_id IN (SELECT id FROM orphaned_releases)"
+    )
+    cursor.execute(
+        "DELETE FROM releases WHERE id IN (SELECT id FROM orphaned_releases)"
+    )
+    cursor.execute("DROP TABLE orphaned_releases")
+    cursor.execute(
+        """
+        INSERT OR REPLACE INTO catalogue_stats
+        SELECT 1, COUNT(*), COALESCE(SUM(tracks), 0), COALESCE(SUM(timed_tracks), 0),
+               COALESCE(SUM(duration_seconds), 0)
+        FROM release_stats
+        """
+    )
+
+
+# Schema migrations, MIGRATIONS[n] upgrades a database from version n to n + 1.
+# The version is kept in `PRAGMA user_version`, so never reorder or remove
+# entries, only append new ones.
+MIGRATIONS: List[Callable[[sqlite3.Cursor], None]] = [
+    _create_schema,
+    _add_indexes,
+    _add_change_counter,
+    _add_feeds,
+    _add_search,
+    _add_crawl_jobs,
+    _add_duration_seconds,
+    _add_stats,
+    _drop_orphaned_releases,
+]
+
+_initialized = set()
+_init_lock = threading.Lock()
+_local = threading.local()
+_connections: "weakref.WeakSet[_Connection]" = weakref.WeakSet()
+
+
+def _add_missing_columns(cursor, table, columns):
+    """Add `columns` (name -> type) to `table` if it was created without them."""
+    cursor.execute(f"PRAGMA table_info({table})")
+    existing = {row[1] for row in cursor.fetchall()}
+    for name, column_type in columns.items():
+        if name not in existing:
+            cursor.execute(f"ALTER TABLE {table} ADD COLUMN {name} {column_type}")
+
+
+def schema_version(conn) -> int:
+    """Return the migration version of the database."""
+    return conn.execute("PRAGMA user_version").fetchone()[0]
+
+
+def migrate(conn):
+    """Apply all pending migrations, each one in its own transaction."""
+    cursor = conn.cursor()
+    for version in range(schema_version(conn), len(MIGRATIONS)):
+        try:
+            cursor.execute("BEGIN IMMEDIATE")
+            # Another process may have migrated while we waited for the lock.
+            if schema_version(conn) > version:
+                conn.rollback()
+                continue
+            MIGRATIONS[version](cursor)
+            cursor.execute(f"PRAGMA user_version = {version + 1}")
+            conn.commit()
+        except Exception:
+            conn.rollback()
+            raise
+
+
+def change_counter(conn) -> int:
+    """Return a number that grows with every change to releases or artists."""
+    return conn.execute(
+        "SELECT value FROM meta WHERE key = 'change_counter'"
+    ).fetchone()[0]
+
+
+def get_meta(conn, key: str, default=None):
+    """Return the value stored under `key` in the meta table."""
+    row = conn.execute("SELECT value FROM meta WHERE key = ?", (key,)).fetchone()
+    return default if row is None else row[0]
+
+
+def set_meta(conn, key: str, value):
+    """Store `value` under `key` in the meta table."""
+    conn.execute(
+        """
+        INSERT INTO meta (key, value) VALUES (?, ?)
+        ON CONFLICT (key) DO UPDATE SET value = excluded.value
+        """,
+        (key, value),
+    )
+
+
+def as_datetime(value: Union[str, datetime, None]) -> Optional[datetime]:
+    """Parse a TIMESTAMP column, which sqlite3 returns as an ISO string."""
+    if value is None or isinstance(value, datetime):
+        return value
+    return datetime.fromisoformat(value)
+
+
+def parse_duration(value: Optional[str]) -> Optional[int]:
+    """Parse a track duration like "04:40" or "1:02:03" into seconds.
+
+    Returns None for missing or malformed durations.
+    """
+    parts = value.strip().split(":") if value else []
+    if not 2 <= len(parts) <= 3:
+        return None
+    seconds = 0
+    for part in parts:
+        if not (part.isascii() and part.isdigit()):
+            return None
+        seconds = seconds * 60 + int(part)
+    return seconds
+
+
+def _connect(db_name: str) -> _Connection:
+    conn = sqlite3.connect(db_name, factory=_Connection)
+    for pragma, value in PRAGMAS.items():
+        conn.execute(f"PRAGMA {pragma} = {value}")
+    _connections.add(conn)
+    return conn
+
+
+def init_db(db_name: str):
+    """Create and migrate the schema of `db_name`, once per process."""
+    path = os.path.abspath(db_name)
+    if path in _initialized:
+        return
+    with _init_lock:
+        if path in _initialized:
+            return
+        conn = _connect(db_name)
+        try:
+            # WAL is persistent, lets readers run concurrently with the writer.
+            conn.execute("PRAGMA journal_mode = WAL")
+            migrate(conn)
+        finally:
+            conn.close()
+        _initialized.add(path)
+
+
+def get_connection(db_name: str) -> sqlite3.Connection:
+    """Return the connection of the calling thread to `db_name`.
+
+    The connection is opened on first use and kept for the lifetime of the
+    thread, so the FastAPI threadpool and crawl workers each reuse their own.
+    """
+    init_db(db_name)
+    connections: Dict[str, sqlite3.Connection] = getattr(_local, "connections", None)
+    if connections is None:
+        connections = _local.connections = {}
+    path = os.path.abspath(db_name)
+    conn = connections.get(path)
+    if conn is None or conn.closed:
+        conn = connections[path] = _connect(db_name)
+    return conn
+
+
+def close_connections():
+    """Close all pooled connections of all threads and forget the schemas.
+
+    Closed connections are replaced transparently on their next use.
+    """
+    with _init_lock:
+        for conn in list(_connections):
+            try:
+                conn.close()
+            except sqlite3.ProgrammingError:
+                # Connections of other threads can not be closed from here,
+                # they are closed once their thread exits.
+                pass
+        _connections.clear()
+        _initialized.clear()
+    _local.__dict__.pop("connections", None)
+
+
+@contextmanager
+def sqlite_db(db_name):
+    """Connect to SQLITE DB and create Schema if not exists.
+
+    Yields the pooled connection of the current thread, commits when the block
+    succeeds and rolls back if it raises.
+    """
+    if not db_name.endswith(".db"):
+        raise ValueError("Not a SQLite database")
+
+    conn = get_connection(db_name)
     try:
         yield conn
         conn.commit()
     except Exception:
         conn.rollback()
         raise
-    finally:
-        conn.close()
@@ -0,0 +1,286 @@
+"""Export the catalogue tables for analytics as NDJSON, CSV or Parquet.
+
+Tables are read in chunks of `EXPORT_CHUNK` rows, addressed by keyset on
+their ids, and every chunk is encoded and written before the next one is
+read. Memory use does not grow with the table, and each chunk is a short
+read of its own instead of one transaction that would keep the crawler's
+writes from being checkpointed for the whole export.
+
+Exports can be incremental. `since_id` exports the releases with a greater
+id and their tracks: ids are handed out in insertion order, so the largest
+release id of one export is where the next one starts. `since` exports the
+releases of that date or later and their tracks, or the artists checked
+since then. Timestamps are written as stored, except in Parquet files, which
+have a timestamp type. Parquet needs pyarrow, see the `parquet` extra.
+
+Only what the CLI needs to declare its options is imported up front, the
+encoders import their libraries when they are created.
+"""
+import csv
+import io
+from datetime import datetime
+from typing import BinaryIO, Dict, List, Optional, Tuple
+
+from .db import as_datetime, sqlite_db
+
+EXPORT_CHUNK = 10_000
+
+NDJSON = "ndjson"
+CSV = "csv"
+PARQUET = "parquet"
+FORMATS = (NDJSON, CSV, PARQUET)
+MEDIA_TYPES = {
+    NDJSON: "application/x-ndjson",
+    CSV: "text/csv; charset=utf-8",
+    PARQUET: "application/vnd.apache.parquet",
+}
+
+# The exported columns of each table as (name, type), the id comes first.
+TABLES: Dict[str, Tuple[Tuple[str, str], ...]] = {
+    "artists": (("id", "int"), ("nickname", "text"), ("last_checked", "timestamp")),
+    "releases": (
+        ("id", "int"),
+        ("artist_id", "int"),
+        ("title", "text"),
+        ("release_date", "timestamp"),
+        ("link", "text"),
+    ),
+    "tracks": (
+        ("id", "int"),
+        ("release_id", "int"),
+        ("number", "int"),
+        ("title", "text"),
+        ("duration", "text"),
+        ("link", "text"),
+        ("duration_seconds", "int"),
+    ),
+}
+
+
+def _columns(table: str) -> Tuple[Tuple[str, str], ...]:
+    try:
+        return TABLES[table]
+    except KeyError:
+        raise ValueError(f"Unknown table {table!r}, use one of {tuple(TABLES)}")
+
+
+def _selection(
+    table: str, since_id: Optional[int], since: Optional[datetime]
+) -> Tuple[str, str, list]:
+    """Return the FROM clause, the conditions and the parameters of an export.
+
+    The exported table is aliased `x`.
+    """
+    _columns(table)
+    source, conditions, params = f"{table} x", [], []
+    if since_id is not None:
+        if table == "artists":
+            raise ValueError("Artists can not be exported since a release id")
+        conditions.append("x.id > ?" if table == "releases" else "x.release_id > ?")
+        params.append(since_id)
+    if since is not None:
+        if table == "artists":
+            conditions.append("x.last_checked >= ?")
+        elif table == "releases":
+            conditions.append("x.release_date >= ?")
+        else:
+            source += " JOIN releases r ON r.id = x.release_id"
+            conditions.append("r.release_date >= ?")
+        params.append(since)
+    return source, " AND ".join(conditions) or "1", params
+
+
+def export_start(
+    db_name: str,
+    table: str,
+    since_id: Optional[int] = None,
+    since: Optional[datetime] = None,
+) -> Optional[int]:
+    """Return the key to read the first chunk with, None if nothing matches.
+
+    Incremental exports start at the first matching id, which the indexes on
+    `release_id` and `release_date` find without scanning the older rows.
+    """
+    source, where, params = _selection(table, since_id, since)
+    # MIN(x.id) would walk the table from its first row until one matches,
+    # the unary + keeps SQLite from doing that so it filters by index.
+    first_id = "+x.id" if params else "x.id"
+    with sqlite_db(db_name) as conn:
+        first = conn.execute(
+            f"SELECT MIN({first_id}) FROM {source} WHERE {where}", params
+        ).fetchone()[0]
+    return None if first is None else first - 1
+
+
+def read_chunk(
+    db_name: str,
+    table: str,
+    after: int,
+    since_id: Optional[int] = None,
+    since: Optional[datetime] = None,
+    size: int = EXPORT_CHUNK,
+) -> Tuple[List[tuple], Optional[int]]:
+    """Return the next rows with an id greater than `after`, and the next key.
+
+    The next key is None after the last chunk.
+    """
+    source, where, params = _selection(table, since_id, since)
+    columns = ", ".join(f"x.{name}" for name, _ in TABLES[table])
+    with sqlite_db(db_name) as conn:
+        rows = conn.execute(
+            f"""
+            SELECT {columns} FROM {source}
+            WHERE x.id > ? AND {where}
+            ORDER BY x.id LIMIT ?
+            """,
+            [after, *params, size],
+        ).fetchall()
+    return rows, rows[-1][0] if len(rows) == size else None
+
+
+class _Encoder:
+    """Turns chunks of rows into the bytes of an export file."""
+
+    def __init__(self, table: str):
+        self.columns = _columns(table)
+        self.names = [name for name, _ in self.columns]
+
+    def start(self) -> bytes:
+        return b""
+
+    def encode(self, rows: List[tuple]) -> bytes:
+        raise NotImplementedError
+
+    def finish(self) -> bytes:
+        return b""
+
+
+class NDJSONEncoder(_Encoder):
+    """One JSON object per line."""
+
+    def __init__(self, table: str):
+        from .fastjson import dumps
+
+        super().__init__(table)
+        self._dumps = dumps
+
+    def encode(self, rows: List[tuple]) -> bytes:
+        names, dumps = self.names, self._dumps
+        return b"".join(dumps(dict(zip(names, row))) + b"\n" for row in rows)
+
+
+class CSVEncoder(_Encoder):
+    """CSV with a header row, NULL is written as an empty field."""
+
+    def start(self) -> bytes:
+        return self.encode([self.names])
+
+    def encode(self, rows: List[tuple]) -> bytes:
+        buffer = io.StringIO()
+        csv.writer(buffer).writerows(rows)
+        return buffer.getvalue().encode()
+
+
+class _Sink(io.RawIOBase):
+    """File that hands out what was written to it, for streaming Parquet."""
+
+    def __init__(self):
+        self._parts: List[bytes] = []
+        self._position = 0
+
+    def writable(self) -> bool:
+        return True
+
+    def write(self, data) -> int:
+        self._parts.append(bytes(data))
+        self._position += len(data)
+        return len(data)
+
+    def tell(self) -> int:
+        return self._position
+
+    def drain(self) -> bytes:
+        data = b"".join(self._parts)
+        self._parts.clear()
+        return data
+
+
+class ParquetEncoder(_Encoder):
+    """Parquet file with a row group per chunk."""
+
+    def __init__(self, table: str):
+        try:
+            import pyarrow
+            import pyarrow.parquet
+        except ImportError:
+            raise RuntimeError("Parquet exports need pyarrow, install it first")
+
+        super().__init__(table)
+        types = {
+            "int": pyarrow.int64(),
+            "text": pyarrow.string(),
+            "timestamp": pyarrow.timestamp("us"),
+        }
+        self._pyarrow = pyarrow
+        self._schema = pyarrow.schema(
+            [(name, types[column_type]) for name, column_type in self.columns]
+        )
+        self._sink = _Sink()
+        self._writer = pyarrow.parquet.ParquetWriter(self._sink, self._schema)
+
+    def start(self) -> bytes:
+        return self._sink.drain()
+
+    def encode(self, rows: List[tuple]) -> bytes:
+        if not rows:
+            return b""
+        arrays = []
+        for (_, column_type), field, values in zip(
+            self.columns, self._schema, zip(*rows)
+        ):
+            if column_type == "timestamp":
+                values = [as_datetime(value) for value in values]
+            arrays.append(self._pyarrow.array(values, type=field.type))
+        table = self._pyarrow.Table.from_arrays(arrays, schema=self._schema)
+        self._writer.write_table(table)
+        return self._sink.drain()
+
+    def finish(self) -> bytes:
+        self._writer.close()
+        return self._sink.drain()
+
+
+ENCODERS = {NDJSON: NDJSONEncoder, CSV: CSVEncoder, PARQUET: ParquetEncoder}
+
+
+def get_encoder(fmt: str, table: str) -> _Encoder:
+    """Create the encoder of `fmt`, one of `FORMATS`, for `table`.
+
+    Raises ValueError for unknown formats or tables and RuntimeError when
+    the library needed for the format is missing.
+    """
+    if fmt not in ENCODERS:
+        raise ValueError(f"Unknown format {fmt!r}, use one of {FORMATS}")
+    return ENCODERS[fmt](table)
+
+
+def export(
+    db_name: str,
+    table: str,
+    fmt: str,
+    out: BinaryIO,
+    since_id: Optional[int] = None,
+    since: Optional[datetime] = None,
+    size: int = EXPORT_CHUNK,
+) -> int:
+    """Write `table` to `out` in chunks of `size` rows, returns the row count."""
+    encoder = get_encoder(fmt, table)
+    after = export_start(db_name, table, since_id, since)
+    out.write(encoder.start())
+    exported = 0
+    while after is not None:
+        rows, after = read_chunk(db_name, table, after, since_id, since, size)
+        out.write(encoder.encode(rows))
+        exported += len(rows)
+    out.write(encoder.finish())
+    return exported
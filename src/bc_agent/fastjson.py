@@ -0,0 +1,52 @@
+"""JSON responses of trusted records, without a second round of validation.
+
+Routes returning pydantic models have FastAPI validate them against the
+`response_model` again and run them through `jsonable_encoder` before
+`json.dumps`. For records read from our own database (the `NamedTuple`s in
+`model`) that work is wasted: `FastJSONResponse` encodes them straight to
+bytes, with orjson if it is installed and the standard library otherwise.
+Both produce the same JSON as the pydantic path, datetimes included.
+"""
+import json
+from datetime import date, datetime
+from typing import Any, Iterable, List, NamedTuple
+
+from fastapi.responses import Response
+
+try:
+    import orjson
+except ImportError:  # pragma: no cover - depends on the environment
+    orjson = None
+
+
+def _default(value: Any) -> Any:
+    if isinstance(value, (date, datetime)):
+        return value.isoformat()
+    raise TypeError(f"Object of type {type(value).__name__} is not JSON serializable")
+
+
+def dumps(value: Any) -> bytes:
+    """Encode dicts, lists, scalars and datetimes as compact JSON."""
+    if orjson is not None:
+        return orjson.dumps(value)
+    return json.dumps(
+        value, default=_default, ensure_ascii=False, separators=(",", ":")
+    ).encode()
+
+
+def as_dicts(records: Iterable[NamedTuple]) -> List[dict]:
+    """Turn records into dicts with their fields in declaration order."""
+    return [record._asdict() for record in records]
+
+
+class FastJSONResponse(Response):
+    """Response encoding its content with `dumps`.
+
+    The content is used as is, routes returning it skip the `response_model`
+    validation, which is then only used for the OpenAPI schema.
+    """
+
+    media_type = "application/json"
+
+    def render(self, content: Any) -> bytes:
+        return dumps(content)
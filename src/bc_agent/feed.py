@@ -0,0 +1,212 @@
+"""Pre-rendered RSS feeds of new releases.
+
+There is one feed of all releases and one per artist, each with the newest
+`FEED_SIZE` releases. Feeds are stored in the `feeds` table together with
+their rendered items. When releases are written, their items are merged into
+the stored ones and only the channel around them is rendered again, so
+serving a feed is a single lookup. Feeds that are not stored yet (e.g. in
+databases crawled before feeds existed) are built from the releases on first
+access.
+"""
+import hashlib
+import json
+from datetime import datetime, timezone
+from email.utils import format_datetime
+from typing import Dict, Iterable, List, NamedTuple, Optional, Sequence, Tuple
+from xml.sax.saxutils import escape
+
+from .db import as_datetime
+
+FEED_SIZE = 50
+ALL = "all"
+
+# (release_date, release id, rendered item), sorted newest first.
+Item = Tuple[str, int, str]
+
+CHANNEL = """<?xml version="1.0" encoding="UTF-8"?>
+<rss version="2.0">
+<channel>
+<title>{title}</title>
+<link>{link}</link>
+<description>{title}</description>
+<lastBuildDate>{built}</lastBuildDate>
+{items}</channel>
+</rss>
+"""
+
+
+class Feed(NamedTuple):
+    """A rendered feed and the validators to serve it with."""
+
+    body: str
+    etag: str
+    last_modified: str
+
+
+def feed_name(artist_id: Optional[int] = None) -> str:
+    """Return the name of the feed of an artist, or of all releases."""
+    return ALL if artist_id is None else f"artist/{artist_id}"
+
+
+def _http_date(value: datetime) -> str:
+    if value.tzinfo is None:
+        value = value.replace(tzinfo=timezone.utc)
+    return format_datetime(value.astimezone(timezone.utc), usegmt=True)
+
+
+def _item(release_id, nickname, title, release_date, link) -> Item:
+    release_date = as_datetime(release_date)
+    pub_date = f"<pubDate>{_http_date(release_date)}</pubDate>" if release_date else ""
+    xml = (
+        f"<item><title>{escape(f'{nickname} - {title}')}</title>"
+        f"<link>{escape(link)}</link>"
+        f'<guid isPermaLink="true">{escape(link)}</guid>{pub_date}</item>\n'
+    )
+    # Same format as the timestamps stored by sqlite3, so keys compare equal.
+    return (release_date.isoformat(" ") if release_date else "", release_id, xml)
+
+
+def _merge(new: Iterable[Item], old: Iterable[Item]) -> List[Item]:
+    items = {item[1]: item for item in old}
+    items.update((item[1], item) for item in new)
+    return sorted(items.values(), reverse=True)[:FEED_SIZE]
+
+
+def _store(cursor, name: str, title: str, link: str, items: Sequence[Item]) -> Feed:
+    now = datetime.now(timezone.utc)
+    body = CHANNEL.format(
+        title=escape(title),
+        link=escape(link),
+        built=_http_date(now),
+        items="".join(item[2] for item in items),
+    )
+    feed = Feed(
+        body=body,
+        etag=f'"{hashlib.sha256(body.encode()).hexdigest()[:16]}"',
+        last_modified=_http_date(now),
+    )
+    cursor.execute(
+        """
+        INSERT INTO feeds (name, items, body, etag, last_modified)
+        VALUES (?, ?, ?, ?, ?)
+        ON CONFLICT (name) DO UPDATE SET
+            items = excluded.items,
+            body = excluded.body,
+            etag = excluded.etag,
+            last_modified = excluded.last_modified
+        """,
+        (name, json.dumps(items), *feed),
+    )
+    return feed
+
+
+def _channel(nickname: Optional[str]) -> Tuple[str, str]:
+    """Return the title and link of the feed of `nickname`, or of all artists."""
+    if nickname is None:
+        return "New releases", "https://bandcamp.com"
+    return f"New releases by {nickname}", f"https://{nickname}.bandcamp.com"
+
+
+def _stored_items(cursor, name: str) -> Optional[List[Item]]:
+    cursor.execute("SELECT items FROM feeds WHERE name = ?", (name,))
+    row = cursor.fetchone()
+    return None if row is None else [tuple(item) for item in json.loads(row[0])]
+
+
+def _query_items(cursor, artist_id: Optional[int] = None) -> List[Item]:
+    query = """
+        SELECT r.id, a.nickname, r.title, r.release_date, r.link
+        FROM releases r INNER JOIN artists a ON r.artist_id = a.id
+    """
+    params: list = []
+    if artist_id is not None:
+        query += " WHERE r.artist_id = ?"
+        params.append(artist_id)
+    query += " ORDER BY r.release_date DESC, r.id DESC LIMIT ?"
+    params.append(FEED_SIZE)
+    cursor.execute(query, params)
+    return [_item(*row) for row in cursor.fetchall()]
+
+
+def _nicknames(cursor, artist_ids: Iterable[int]) -> Dict[int, str]:
+    artist_ids = list(artist_ids)
+    cursor.execute(
+        f"SELECT id, nickname FROM artists WHERE id IN ({','.join('?' * len(artist_ids))})",
+        artist_ids,
+    )
+    return dict(cursor.fetchall())
+
+
+def add_releases(cursor, release_rows: Sequence[tuple]):
+    """Merge newly inserted releases into the stored feeds.
+
+    `release_rows` are `(id, artist_id, title, release_date, link)` tuples of
+    releases inserted in the current transaction. Feeds that are not stored
+    yet are built from the database, which includes the new releases already.
+    """
+    if not release_rows:
+        return
+    nicknames = _nicknames(cursor, {row[1] for row in release_rows})
+    by_artist: Dict[int, List[Item]] = {}
+    for release_id, artist_id, title, release_date, link in release_rows:
+        if artist_id in nicknames:
+            item = _item(release_id, nicknames[artist_id], title, release_date, link)
+            by_artist.setdefault(artist_id, []).append(item)
+
+    feeds = [(None, [item for items in by_artist.values() for item in items])]
+    feeds.extend(by_artist.items())
+    for artist_id, new_items in feeds:
+        name = feed_name(artist_id)
+        old_items = _stored_items(cursor, name)
+        if old_items is None:
+            items = _query_items(cursor, artist_id)
+        else:
+            items = _merge(new_items, old_items)
+            if items == old_items:
+                continue
+        _store(cursor, name, *_channel(nicknames.get(artist_id)), items)
+
+
+def drop_feeds(cursor, artist_ids: Iterable[int]):
+    """Forget the feeds that show releases of the given (deleted) artists.
+
+    They are built again from the remaining releases when requested next.
+    """
+    names = [ALL] + [feed_name(artist_id) for artist_id in artist_ids]
+    cursor.execute(
+        f"DELETE FROM feeds WHERE name IN ({','.join('?' * len(names))})", names
+    )
+
+
+def get_feed(conn, artist_id: Optional[int] = None) -> Optional[Feed]:
+    """Return the stored feed of an artist (or all artists), None if unknown."""
+    name = feed_name(artist_id)
+    query = "SELECT body, etag, last_modified FROM feeds WHERE name = ?"
+    row = conn.execute(query, (name,)).fetchone()
+    if row is not None:
+        return Feed(*row)
+
+    nickname = None
+    if artist_id is not None:
+        nickname = _nicknames(conn.cursor(), [artist_id]).get(artist_id)
+        if nickname is None:
+            return None
+
+    cursor = conn.cursor()
+    # Hold the write lock while building, so that releases written meanwhile
+    # are not lost when the feed is stored.
+    cursor.execute("BEGIN IMMEDIATE")
+    try:
+        cursor.execute(query, (name,))
+        row = cursor.fetchone()
+        if row is not None:
+            feed = Feed(*row)
+        else:
+            feed = _store(
+                cursor, name, *_channel(nickname), _query_items(cursor, artist_id)
+            )
+        conn.commit()
+    except Exception:
+        conn.rollback()
+        raise
+    return feed
@@ -0,0 +1,155 @@
+"""Shared HTTP layer for all scraping."""
+import logging
+import random
+import threading
+import time
+from datetime import datetime, timezone
+from email.utils import parsedate_to_datetime
+from typing import Dict, Optional
+
+import requests
+from requests.adapters import HTTPAdapter
+
+from .crawl import DEFAULT_CONCURRENCY, HostLimiter
+
+CONNECT_TIMEOUT = 5.0
+READ_TIMEOUT = 20.0
+MAX_RETRIES = 3
+BACKOFF_FACTOR = 0.5
+MAX_BACKOFF = 60.0
+SLOW_REQUEST = 5.0
+RETRY_STATUSES = frozenset({429, 500, 502, 503, 504})
+USER_AGENT = "bc_agent/0.1"
+
+
+def parse_retry_after(value: Optional[str]) -> Optional[float]:
+    """Return the number of seconds requested by a `Retry-After` header.
+
+    The header is either a number of seconds or an HTTP date.
+    """
+    if not value:
+        return None
+    value = value.strip()
+    if value.isdigit():
+        return float(value)
+    try:
+        retry_at = parsedate_to_datetime(value)
+    except (TypeError, ValueError):
+        return None
+    if retry_at.tzinfo is None:
+        retry_at = retry_at.replace(tzinfo=timezone.utc)
+    return max(0.0, (retry_at - datetime.now(timezone.utc)).total_seconds())
+
+
+class Fetcher:
+    """Keep-alive HTTP client with timeouts and retries.
+
+    One `Fetcher` is shared by all threads of a crawl, its connection pool is
+    sized to the crawl concurrency so that parallel downloads reuse
+    connections instead of doing a new TCP and TLS handshake per page.
+    Connection errors, timeouts and the statuses in `RETRY_STATUSES` are
+    retried with exponential backoff, honouring `Retry-After` when the server
+    sends one.
+    """
+
+    def __init__(
+        self,
+        pool_size: int = DEFAULT_CONCURRENCY,
+        limiter: Optional[HostLimiter] = None,
+        connect_timeout: float = CONNECT_TIMEOUT,
+        read_timeout: float = READ_TIMEOUT,
+        max_retries: int = MAX_RETRIES,
+        backoff_factor: float = BACKOFF_FACTOR,
+        max_backoff: float = MAX_BACKOFF,
+        slow_request: float = SLOW_REQUEST,
+    ):
+        self.limiter = limiter
+        self.timeout = (connect_timeout, read_timeout)
+        self.max_retries = max_retries
+        self.backoff_factor = backoff_factor
+        self.max_backoff = max_backoff
+        self.slow_request = slow_request
+
+        adapter = HTTPAdapter(
+            pool_connections=max(pool_size, 1),
+            pool_maxsize=max(pool_size, 1),
+            max_retries=0,
+        )
+        self.session = requests.Session()
+        self.session.headers["User-Agent"] = USER_AGENT
+        self.session.mount("https://", adapter)
+        self.session.mount("http://", adapter)
+
+    def close(self):
+        """Close all pooled connections."""
+        self.session.close()
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, *exc_info):
+        self.close()
+
+    def _backoff(self, attempt: int, response: Optional[requests.Response]) -> float:
+        if response is not None:
+            retry_after = parse_retry_after(response.headers.get("Retry-After"))
+            if retry_after is not None:
+                return min(retry_after, self.max_backoff)
+        delay = self.backoff_factor * (2**attempt)
+        return min(delay + random.uniform(0, delay / 2), self.max_backoff)
+
+    def _request(self, url: str, headers: Optional[Dict[str, str]]):
+        if self.limiter is None:
+            return self.session.get(url, headers=headers, timeout=self.timeout)
+        with self.limiter.slot(url):
+            return self.session.get(url, headers=headers, timeout=self.timeout)
+
+    def get(
+        self, url: str, headers: Optional[Dict[str, str]] = None
+    ) -> requests.Response:
+        """Download `url` and raise for HTTP errors that survive all retries."""
+        attempt = 0
+        while True:
+            start = time.perf_counter()
+            response = None
+            try:
+                response = self._request(url, headers)
+            except (requests.ConnectionError, requests.Timeout) as e:
+                error: Optional[Exception] = e
+            else:
+                error = None
+            latency = time.perf_counter() - start
+
+            status = response.status_code if response is not None else None
+            log = logging.warning if latency >= self.slow_request else logging.debug
+            log(f"GET {url} -> {status or error} in {latency:.3f}s")
+
+            retryable = error is not None or status in RETRY_STATUSES
+            if not retryable or attempt >= self.max_retries:
+                if error is not None:
+                    raise error
+                response.raise_for_status()
+                return response
+
+            delay = self._backoff(attempt, response)
+            logging.info(
+                f"Retrying {url} in {delay:.1f}s "
+                f"(attempt {attempt + 1}/{self.max_retries}): {status or error}"
+            )
+            if response is not None:
+                response.close()
+            time.sleep(delay)
+            attempt += 1
+
+
+_default_fetcher: Optional[Fetcher] = None
+_default_lock = threading.Lock()
+
+
+def get_fetcher() -> Fetcher:
+    """Return the process wide fetcher used when no other one is given."""
+    global _default_fetcher
+    with _default_lock:
+        if _default_fetcher is None:
+            _default_fetcher = Fetcher()
+        return _default_fetcher
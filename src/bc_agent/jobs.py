@@ -0,0 +1,297 @@
+"""Share the crawl between workers through a job queue in the database.
+
+A crawl cycle queues one job per artist that is due (see `scheduler`) in the
+`crawl_jobs` table. Workers claim batches of jobs by taking a lease on them,
+renew the lease while they check the artists and mark the jobs done when
+their results are written. A job whose lease runs out, because its worker
+crashed or lost the database, is claimed by the next worker, up to
+`MAX_ATTEMPTS` times. A new cycle starts once every job of the current one
+is done, so no artist is checked twice per cycle.
+
+Leases are compared against the clocks of the workers, which have to be
+roughly in sync when they run on different machines.
+"""
+import logging
+import os
+import socket
+import threading
+import time
+from contextlib import contextmanager
+from datetime import datetime
+from typing import Any, Dict, Iterable, List, NamedTuple, Optional, Tuple
+
+from . import metrics
+from .crawl import DEFAULT_CONCURRENCY, DEFAULT_PER_HOST
+from .db import IN_CHUNK, get_meta, set_meta, sqlite_db
+
+# Key of the number of the current crawl cycle in the meta table.
+CRAWL_CYCLE = "crawl_cycle"
+DEFAULT_BATCH_SIZE = 10
+DEFAULT_LEASE_SECONDS = 300.0
+# How long a worker waits for due artists when there is nothing to do.
+DEFAULT_POLL_SECONDS = 60.0
+# Jobs are given up after this many claims, so that an artist that crashes
+# its workers does not keep the cycle from finishing.
+MAX_ATTEMPTS = 3
+
+# Jobs that keep a cycle running, given the current time. A job on its last
+# attempt stays open while that attempt holds a valid lease.
+_OPEN = f"done_at IS NULL AND (attempts < {MAX_ATTEMPTS} OR lease_until >= ?)"
+
+
+class Job(NamedTuple):
+    """An artist claimed by a worker."""
+
+    artist_id: int
+    nickname: str
+
+
+def default_worker_id() -> str:
+    """Identify this process among the workers sharing a database."""
+    return f"{socket.gethostname()}:{os.getpid()}"
+
+
+def _in(column: str, values: List) -> str:
+    return f"{column} IN ({','.join('?' * len(values))})"
+
+
+def open_jobs(db_name: str) -> int:
+    """Return the number of jobs of the current cycle that are not done yet."""
+    with sqlite_db(db_name) as conn:
+        cursor = conn.execute(
+            f"SELECT COUNT(*) FROM crawl_jobs WHERE {_OPEN}", (time.time(),)
+        )
+        return cursor.fetchone()[0]
+
+
+def start_cycle(db_name: str, nicknames: Iterable[str]) -> int:
+    """Queue a job for each of the artists, unless a cycle is still running.
+
+    Returns the number of jobs queued, 0 if the current cycle has open jobs.
+    """
+    nicknames = list(nicknames)
+    with sqlite_db(db_name) as conn:
+        cursor = conn.cursor()
+        cursor.execute("BEGIN IMMEDIATE")
+        try:
+            cursor.execute(
+                f"SELECT 1 FROM crawl_jobs WHERE {_OPEN} LIMIT 1", (time.time(),)
+            )
+            if cursor.fetchone() is not None:
+                conn.rollback()
+                return 0
+            cycle = get_meta(conn, CRAWL_CYCLE, 0) + 1
+            set_meta(conn, CRAWL_CYCLE, cycle)
+            queued = 0
+            for start in range(0, len(nicknames), IN_CHUNK):
+                chunk = nicknames[start : start + IN_CHUNK]
+                cursor.execute(
+                    f"""
+                    INSERT INTO crawl_jobs (artist_id, cycle)
+                    SELECT id, ? FROM artists WHERE {_in("nickname", chunk)}
+                    ON CONFLICT (artist_id) DO UPDATE SET
+                        cycle = excluded.cycle,
+                        worker = NULL,
+                        lease_until = NULL,
+                        attempts = 0,
+                        done_at = NULL
+                    """,
+                    [cycle, *chunk],
+                )
+                queued += cursor.rowcount
+            conn.commit()
+        except Exception:
+            conn.rollback()
+            raise
+    logging.info(f"Started crawl cycle {cycle} with {queued} artists")
+    return queued
+
+
+def claim(
+    db_name: str,
+    worker: str,
+    batch_size: int = DEFAULT_BATCH_SIZE,
+    lease: float = DEFAULT_LEASE_SECONDS,
+) -> List[Job]:
+    """Lease up to `batch_size` open jobs that nobody holds a valid lease on."""
+    now = time.time()
+    with sqlite_db(db_name) as conn:
+        cursor = conn.cursor()
+        cursor.execute("BEGIN IMMEDIATE")
+        try:
+            cursor.execute(
+                f"""
+                UPDATE crawl_jobs
+                SET worker = ?, lease_until = ?, attempts = attempts + 1
+                WHERE artist_id IN (
+                    SELECT artist_id FROM crawl_jobs
+                    WHERE done_at IS NULL AND attempts < {MAX_ATTEMPTS}
+                        AND (lease_until IS NULL OR lease_until < ?)
+                    ORDER BY artist_id LIMIT ?
+                )
+                RETURNING artist_id
+                """,
+                (worker, now + lease, now, batch_size),
+            )
+            ids = [row[0] for row in cursor.fetchall()]
+            jobs = []
+            if ids:
+                cursor.execute(
+                    f"SELECT id, nickname FROM artists WHERE {_in('id', ids)}"
+                    " ORDER BY id",
+                    ids,
+                )
+                jobs = [Job(*row) for row in cursor.fetchall()]
+            conn.commit()
+        except Exception:
+            conn.rollback()
+            raise
+    return jobs
+
+
+def _update_leases(db_name: str, worker: str, artist_ids: List[int], sql: str, *params):
+    with sqlite_db(db_name) as conn:
+        cursor = conn.execute(
+            f"""
+            UPDATE crawl_jobs SET {sql}
+            WHERE worker = ? AND done_at IS NULL AND {_in("artist_id", artist_ids)}
+            """,
+            [*params, worker, *artist_ids],
+        )
+        return cursor.rowcount
+
+
+def renew(
+    db_name: str,
+    worker: str,
+    artist_ids: List[int],
+    lease: float = DEFAULT_LEASE_SECONDS,
+) -> int:
+    """Extend the leases of `worker`, returns how many it still holds."""
+    return _update_leases(
+        db_name, worker, artist_ids, "lease_until = ?", time.time() + lease
+    )
+
+
+def complete(db_name: str, worker: str, artist_ids: List[int]) -> int:
+    """Mark the jobs done, returns how many `worker` still held."""
+    return _update_leases(
+        db_name, worker, artist_ids, "done_at = ?, lease_until = NULL", time.time()
+    )
+
+
+def release(db_name: str, worker: str, artist_ids: List[int]) -> int:
+    """Give up the leases, so that other workers can claim the jobs right away."""
+    return _update_leases(
+        db_name, worker, artist_ids, "worker = NULL, lease_until = NULL"
+    )
+
+
+@contextmanager
+def keep_leases(db_name: str, worker: str, artist_ids: List[int], lease: float):
+    """Renew the leases in a background thread for the duration of the block."""
+    stopped = threading.Event()
+
+    def run():
+        while not stopped.wait(lease / 3):
+            held = renew(db_name, worker, artist_ids, lease)
+            if held < len(artist_ids):
+                logging.warning(
+                    f"Lost the lease of {len(artist_ids) - held} of "
+                    f"{len(artist_ids)} artists to another worker"
+                )
+
+    thread = threading.Thread(target=run, name="bc-lease", daemon=True)
+    thread.start()
+    try:
+        yield
+    finally:
+        stopped.set()
+        thread.join()
+
+
+def _work(db_name, worker, jobs, lease, concurrency, per_host) -> Tuple[int, int]:
+    """Check the claimed artists, returns the failed checks and new releases."""
+    from . import music_data
+    from .writer import ReleaseWriter
+
+    ids = [job.artist_id for job in jobs]
+    try:
+        with keep_leases(db_name, worker, ids, lease):
+            # Closing the writer stores the results before the jobs are done.
+            with ReleaseWriter(db_name) as writer:
+                failed = music_data.update_artists(
+                    [job.nickname for job in jobs], concurrency, per_host, writer
+                )
+    except BaseException:
+        release(db_name, worker, ids)
+        raise
+    # Artists whose results were not stored are left to the next claim.
+    unstored = [i for i in ids if i in writer.failed_artists]
+    if unstored:
+        release(db_name, worker, unstored)
+    complete(db_name, worker, [i for i in ids if i not in writer.failed_artists])
+    return failed + len(unstored), writer.written
+
+
+def run_worker(
+    worker: Optional[str] = None,
+    batch_size: int = DEFAULT_BATCH_SIZE,
+    lease: float = DEFAULT_LEASE_SECONDS,
+    concurrency: int = DEFAULT_CONCURRENCY,
+    per_host: int = DEFAULT_PER_HOST,
+    force: bool = False,
+    follow: bool = False,
+    poll: float = DEFAULT_POLL_SECONDS,
+) -> Dict[str, Any]:
+    """Check artists from the job queue until there are none left.
+
+    Joins the running cycle or starts one with the due artists (all of them
+    with `force`). With `follow` the worker keeps starting cycles and waits
+    `poll` seconds whenever nothing is due, otherwise it returns once it can
+    not claim any more jobs. Returns a summary like `update_releases_db`.
+    """
+    # The crawler is imported by workers only, the CLI just needs the defaults.
+    from . import music_data
+
+    worker = worker or default_worker_id()
+    db_name = music_data.DB_NAME
+    started_at = datetime.now()
+    before = metrics.snapshot()
+    checked = failed = written = 0
+    joined = False
+    while True:
+        jobs = claim(db_name, worker, batch_size, lease)
+        if jobs:
+            joined = True
+            batch_failed, batch_written = _work(
+                db_name, worker, jobs, lease, concurrency, per_host
+            )
+            checked += len(jobs)
+            failed += batch_failed
+            written += batch_written
+            continue
+        if (follow or not joined) and not open_jobs(db_name):
+            joined = True
+            if start_cycle(db_name, music_data.artists_to_check(force)):
+                continue
+        if not follow:
+            break
+        time.sleep(poll)
+
+    finished_at = datetime.now()
+    summary = {
+        "worker": worker,
+        "started_at": started_at.isoformat(),
+        "finished_at": finished_at.isoformat(),
+        "duration_seconds": (finished_at - started_at).total_seconds(),
+        "artists": checked,
+        "failed_artists": failed,
+        "new_releases": written,
+        "metrics": metrics.difference(before, metrics.snapshot()),
+    }
+    logging.info(
+        f"Worker {worker} checked {checked} artists ({failed} failed) and found "
+        f"{written} new releases in {summary['duration_seconds']:.1f}s"
+    )
+    return summary
@@ -0,0 +1,8 @@
+"""Limits shared by the API models and the CLI.
+
+They live apart from `model`, so that the CLI can validate its options
+without importing pydantic.
+"""
+
+# Maximum number of items of one bulk request.
+BULK_LIMIT = 1000
@@ -0,0 +1,201 @@
+"""Counters and timing histograms of the crawl pipeline.
+
+The metrics live in the process that crawls and are rendered in the
+Prometheus text format by `render`. `snapshot` flattens them into a dict,
+`update_releases_db` uses the difference of two snapshots to summarize a run.
+Crawls usually run in the CLI rather than the API process, so the API also
+renders the totals of the last stored summary with `render_summary`.
+"""
+import threading
+import time
+from contextlib import contextmanager
+from datetime import datetime
+from typing import Dict, Iterator, List, Sequence, Tuple
+
+# Upper bounds of the histogram buckets in seconds, +Inf is implied.
+DEFAULT_BUCKETS = (0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1.0, 2.5, 5.0, 10.0)
+
+LabelValues = Tuple[str, ...]
+
+_metrics: List["_Metric"] = []
+
+
+class _Metric:
+    type = ""
+
+    def __init__(self, name: str, documentation: str, labelnames: Sequence[str] = ()):
+        self.name = name
+        self.documentation = documentation
+        self.labelnames = tuple(labelnames)
+        self._lock = threading.Lock()
+        _metrics.append(self)
+
+    def _key(self, labels: Dict[str, object]) -> LabelValues:
+        if set(labels) != set(self.labelnames):
+            raise ValueError(
+                f"{self.name} takes labels {self.labelnames}, got {tuple(labels)}"
+            )
+        return tuple(str(labels[name]) for name in self.labelnames)
+
+    def _labels(self, values: LabelValues, **extra) -> str:
+        pairs = list(zip(self.labelnames, values)) + list(extra.items())
+        if not pairs:
+            return ""
+        return "{" + ",".join(f'{k}="{_escape(v)}"' for k, v in pairs) + "}"
+
+    def samples(self) -> Iterator[Tuple[str, float]]:
+        raise NotImplementedError
+
+    def render(self) -> str:
+        lines = [
+            f"# HELP {self.name} {self.documentation}",
+            f"# TYPE {self.name} {self.type}",
+        ]
+        lines.extend(f"{name} {_format(value)}" for name, value in self.samples())
+        return "\n".join(lines) + "\n"
+
+
+class Counter(_Metric):
+    """A value that only goes up, e.g. the number of bytes downloaded."""
+
+    type = "counter"
+
+    def __init__(self, name: str, documentation: str, labelnames: Sequence[str] = ()):
+        super().__init__(name, documentation, labelnames)
+        self._values: Dict[LabelValues, float] = {}
+
+    def inc(self, amount: float = 1, **labels):
+        key = self._key(labels)
+        with self._lock:
+            self._values[key] = self._values.get(key, 0) + amount
+
+    def samples(self):
+        with self._lock:
+            values = sorted(self._values.items())
+        for key, value in values:
+            yield self.name + self._labels(key), value
+
+
+class Histogram(_Metric):
+    """Distribution of observed values, e.g. the latency of downloads."""
+
+    type = "histogram"
+
+    def __init__(
+        self,
+        name: str,
+        documentation: str,
+        labelnames: Sequence[str] = (),
+        buckets: Sequence[float] = DEFAULT_BUCKETS,
+    ):
+        super().__init__(name, documentation, labelnames)
+        self.buckets = tuple(sorted(buckets))
+        # label values -> (count per bucket with +Inf last, sum)
+        self._values: Dict[LabelValues, Tuple[List[int], float]] = {}
+
+    def observe(self, value: float, **labels):
+        key = self._key(labels)
+        with self._lock:
+            counts, total = self._values.get(key, ([0] * (len(self.buckets) + 1), 0))
+            for i, bound in enumerate(self.buckets):
+                if value <= bound:
+                    counts[i] += 1
+                    break
+            else:
+                counts[-1] += 1
+            self._values[key] = (counts, total + value)
+
+    @contextmanager
+    def time(self, **labels):
+        """Observe the duration of the block, also when it raises."""
+        start = time.perf_counter()
+        try:
+            yield
+        finally:
+            self.observe(time.perf_counter() - start, **labels)
+
+    def samples(self):
+        with self._lock:
+            values = sorted((k, (list(c), s)) for k, (c, s) in self._values.items())
+        for key, (counts, total) in values:
+            cumulative = 0
+            for bound, count in zip(self.buckets + (float("inf"),), counts):
+                cumulative += count
+                le = "+Inf" if bound == float("inf") else _format(bound)
+                yield f"{self.name}_bucket" + self._labels(key, le=le), cumulative
+            yield f"{self.name}_sum" + self._labels(key), total
+            yield f"{self.name}_count" + self._labels(key), cumulative
+
+
+def _escape(value: str) -> str:
+    return value.replace("\\", "\\\\").replace('"', '\\"').replace("\n", "\\n")
+
+
+def _format(value: float) -> str:
+    return str(int(value)) if float(value).is_integer() else repr(float(value))
+
+
+FETCH_SECONDS = Histogram(
+    "bc_fetch_seconds", "Time to download a page, including retries.", ["page"]
+)
+FETCH_BYTES = Counter("bc_fetch_bytes_total", "Bytes of pages downloaded.", ["page"])
+FETCH_RESPONSES = Counter(
+    "bc_fetch_responses_total", "Pages downloaded by HTTP status.", ["page", "status"]
+)
+PARSE_SECONDS = Histogram("bc_parse_seconds", "Time to parse a page.", ["page"])
+WRITE_SECONDS = Histogram(
+    "bc_db_write_seconds", "Time to store a batch of crawl results."
+)
+ROWS_WRITTEN = Counter("bc_rows_written_total", "Rows written by table.", ["table"])
+ARTISTS_CHECKED = Counter(
+    "bc_artists_checked_total",
+    "Artist pages checked by outcome (not_modified, unchanged, changed).",
+    ["outcome"],
+)
+ERRORS = Counter(
+    "bc_errors_total", "Failures by pipeline stage (fetch, parse, write).", ["stage"]
+)
+
+
+def render() -> str:
+    """Return all metrics in the Prometheus text exposition format."""
+    return "".join(metric.render() for metric in _metrics)
+
+
+def render_summary(summary: Dict) -> str:
+    """Render the totals of an update run summary as gauges."""
+    finished_at = datetime.fromisoformat(summary["finished_at"]).timestamp()
+    gauges = [
+        ("timestamp_seconds", "When the last update finished.", finished_at),
+        ("duration_seconds", "Duration of the last update.", None),
+        ("artists", "Artists checked by the last update.", None),
+        ("failed_artists", "Artists whose check failed in the last update.", None),
+        ("new_releases", "Releases found by the last update.", None),
+    ]
+    lines = []
+    for key, documentation, value in gauges:
+        name = f"bc_last_update_{key}"
+        value = summary[key] if value is None else value
+        lines.append(f"# HELP {name} {documentation}")
+        lines.append(f"# TYPE {name} gauge")
+        lines.append(f"{name} {_format(value)}")
+    return "\n".join(lines) + "\n"
+
+
+def snapshot() -> Dict[str, float]:
+    """Return the current value of every sample, keyed like in `render`.
+
+    Histogram buckets are left out, their `_sum` and `_count` are kept.
+    """
+    return {
+        name: value
+        for metric in _metrics
+        for name, value in metric.samples()
+        if "_bucket{" not in name
+    }
+
+
+def difference(before: Dict[str, float], after: Dict[str, float]) -> Dict[str, float]:
+    """Return what changed between two snapshots, leaving out unchanged samples."""
+    changes = {name: value - before.get(name, 0) for name, value in after.items()}
+    return {name: value for name, value in changes.items() if value}
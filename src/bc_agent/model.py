@@ -1,8 +1,10 @@
 """Models for the Database and API."""
 from datetime import datetime
-from typing import List, Optional
+from typing import List, NamedTuple, Optional
 
-from pydantic import BaseModel
+from pydantic import BaseModel, Field
+
+from .limits import BULK_LIMIT
 
 
 class Artist(BaseModel):
@@ -13,6 +15,39 @@ class Artist(BaseModel):
     last_checked: Optional[datetime] = None
 
 
+class ArtistRow(NamedTuple):
+    """An `Artist` read from the database, with the same fields but unvalidated.
+
+    Records of trusted rows skip pydantic, which dominates the time of
+    listing thousands of them. See `fastjson` for turning them into JSON.
+    """
+
+    nickname: str
+    id: int
+    last_checked: Optional[datetime]
+
+
+class ArtistBulk(BaseModel):
+    """Nicknames of artists to add at once."""
+
+    nicknames: List[str] = Field(..., max_items=BULK_LIMIT)
+
+
+class ArtistBulkDelete(BaseModel):
+    """Artists to delete at once, by id and/or by nickname."""
+
+    ids: List[int] = Field([], max_items=BULK_LIMIT)
+    nicknames: List[str] = Field([], max_items=BULK_LIMIT)
+
+
+class BulkResult(BaseModel):
+    """Outcome of one item of a bulk request."""
+
+    status: str
+    nickname: Optional[str] = None
+    id: Optional[int] = None
+
+
 class Release(BaseModel):
     """Normalized Release model (artist as foreign key)."""
 
@@ -32,6 +67,19 @@ class Track(BaseModel):
     link: str
     id: Optional[int] = None
     release_id: Optional[int] = None
+    duration_seconds: Optional[int] = None
+
+
+class TrackRow(NamedTuple):
+    """A `Track` read from the database, without validation."""
+
+    number: int
+    title: str
+    duration: str
+    link: str
+    id: int
+    release_id: int
+    duration_seconds: Optional[int] = None
 
 
 class ReleaseDenorm(BaseModel):
@@ -42,3 +90,77 @@ class ReleaseDenorm(BaseModel):
     link: str
     release_date: Optional[datetime] = None
     tracks: Optional[List[Track]]
+
+
+class ReleaseRow(NamedTuple):
+    """A `ReleaseDenorm` read from the database, without validation.
+
+    `tracks` is None unless they were asked for.
+    """
+
+    title: str
+    artist: str
+    link: str
+    release_date: Optional[datetime]
+    tracks: Optional[List[TrackRow]] = None
+
+
+class ReleasePage(BaseModel):
+    """One page of releases, `next_cursor` is None on the last page."""
+
+    releases: List[ReleaseDenorm]
+    next_cursor: Optional[str] = None
+
+
+class SearchHit(BaseModel):
+    """An artist, release or track matching a search, higher `score` is better."""
+
+    kind: str
+    id: int
+    title: str
+    artist: str
+    link: Optional[str] = None
+    score: float
+
+
+class SearchPage(BaseModel):
+    """One page of search results, `next_offset` is None on the last page."""
+
+    hits: List[SearchHit]
+    next_offset: Optional[int] = None
+
+
+class CatalogueStats(BaseModel):
+    """Counts and runtime of all releases.
+
+    The average only counts tracks with a known duration, None if there are
+    none.
+    """
+
+    releases: int
+    tracks: int
+    duration_seconds: int
+    average_track_seconds: Optional[float] = None
+
+
+class ArtistStats(BaseModel):
+    """Counts and runtime of the releases of an artist."""
+
+    artist_id: int
+    nickname: str
+    releases: int
+    tracks: int
+    duration_seconds: int
+    average_track_seconds: Optional[float] = None
+    first_release: Optional[datetime] = None
+    last_release: Optional[datetime] = None
+
+
+class ReleaseStats(BaseModel):
+    """Track count and runtime of a release."""
+
+    release_id: int
+    artist_id: int
+    tracks: int
+    duration_seconds: int
+    average_track_seconds: Optional[float] = None
@@ -124,40 +124,135 @@ I think we can start the implementation now.
 please provide me now with the code
 '''
 
+import base64
+import hashlib
+import json
 import logging
-import re
+import os
+from concurrent.futures import Executor, ThreadPoolExecutor, as_completed
 from datetime import datetime
-from typing import List
+from itertools import groupby
+from operator import itemgetter
+from typing import Any, Dict, Iterator, List, Optional, Tuple
 
 import requests
 from bs4 import BeautifulSoup
 
-from .db import sqlite_db
-from .model import ReleaseDenorm, Track
-
-logging.basicConfig(level=logging.INFO)
-
-DB_NAME = "bandcamp.db"
-
-
-def get_new_releases(artist_nickname: str) -> List[ReleaseDenorm]:
-    """Get new releases from bandcamp artist page."""
+from . import metrics
+
+from .cache import check_releases_generation, release_cache
+from .crawl import DEFAULT_CONCURRENCY, DEFAULT_PER_HOST, HostLimiter
+from .db import DB_NAME, IN_CHUNK, as_datetime, set_meta, sqlite_db
+from .fetch import Fetcher, get_fetcher
+from .metrics import (
+    ARTISTS_CHECKED,
+    ERRORS,
+    FETCH_BYTES,
+    FETCH_RESPONSES,
+    FETCH_SECONDS,
+    PARSE_SECONDS,
+)
+from .model import ReleaseDenorm, ReleaseRow, TrackRow
+from .parsing import DEFAULT_ENGINE, parse_release_page
+from .scheduler import due_artists
+from .writer import CrawlResult, ReleaseWriter, write_results
+
+# Key of the summary of the last `update_releases_db` run in the meta table.
+LAST_UPDATE = "last_update"
+# Where artist pages are downloaded from, benchmarks point this at a stub server.
+ARTIST_URL = "https://{nickname}.bandcamp.com"
+PAGE_SIZE = 500
+
+# `(release_date, id)` of the last release of a page
+PageKey = Tuple[str, int]
+
+
+def get_new_releases(
+    artist_nickname: str,
+    executor: Optional[Executor] = None,
+    fetcher: Optional[Fetcher] = None,
+    writer: Optional[ReleaseWriter] = None,
+) -> List[ReleaseDenorm]:
+    """Get new releases from bandcamp artist page.
+
+    If an `executor` is given, the release pages are downloaded in parallel on
+    it, otherwise one after another. With a `writer` the results are handed
+    to it for batched storage, otherwise they are written right away.
+    """
     with sqlite_db(DB_NAME) as conn:
         cursor = conn.cursor()
 
         # Check if the artist exists in the database
-        cursor.execute("SELECT id FROM artists WHERE nickname = ?", (artist_nickname,))
-        artist_id = cursor.fetchone()
-        if not artist_id:
-            # Add the artist to the database if it doesn't exist
+        cursor.execute(
+            "SELECT id, etag, last_modified, grid_hash FROM artists WHERE nickname = ?",
+            (artist_nickname,),
+        )
+        row = cursor.fetchone()
+        if not row:
+            # Add the artist to the database if it doesn't exist, another
+            # crawler may have added it in the meantime.
             cursor.execute(
-                "INSERT INTO artists (nickname, last_checked) VALUES (?, ?)",
+                """
+                INSERT INTO artists (nickname, last_checked) VALUES (?, ?)
+                ON CONFLICT (nickname) DO NOTHING
+                """,
                 (artist_nickname, datetime.now()),
             )
-            artist_id = cursor.lastrowid
             conn.commit()
+            cursor.execute(
+                "SELECT id FROM artists WHERE nickname = ?", (artist_nickname,)
+            )
+            artist_id = cursor.fetchone()[0]
+            etag = last_modified = grid_hash = None
         else:
-            artist_id = artist_id[0]
+            artist_id, etag, last_modified, grid_hash = row
+
+    artist_url = ARTIST_URL.format(nickname=artist_nickname)
+    fetcher = fetcher or get_fetcher()
+    checked_at = datetime.now()
+
+    # Only download the artist page if it changed since the last check
+    headers = {}
+    if etag:
+        headers["If-None-Match"] = etag
+    if last_modified:
+        headers["If-Modified-Since"] = last_modified
+    response = _fetch(fetcher, artist_url, "artist", headers=headers or None)
+    if response.status_code == 304:
+        logging.info(f"Artist page of {artist_nickname} not modified")
+        ARTISTS_CHECKED.inc(outcome="not_modified")
+        _store(
+            CrawlResult(artist_id, [], checked_at, etag, last_modified, grid_hash),
+            writer,
+        )
+        return []
+    etag = response.headers.get("ETag")
+    last_modified = response.headers.get("Last-Modified")
+
+    with PARSE_SECONDS.time(page="artist"):
+        try:
+            soup = BeautifulSoup(response.content, "html.parser")
+            release_urls = [
+                a["href"]
+                for a in soup.find("ol", {"class": "music-grid"}).find_all("a")
+            ]
+        except Exception:
+            ERRORS.inc(stage="parse")
+            raise
+    release_urls = [artist_url + link for link in release_urls]
+
+    new_grid_hash = grid_fingerprint(release_urls)
+    if new_grid_hash == grid_hash:
+        logging.info(f"Releases of artist {artist_nickname} unchanged")
+        ARTISTS_CHECKED.inc(outcome="unchanged")
+        _store(
+            CrawlResult(artist_id, [], checked_at, etag, last_modified, grid_hash),
+            writer,
+        )
+        return []
+
+    with sqlite_db(DB_NAME) as conn:
+        cursor = conn.cursor()
 
         # Get all release URLs and release dates for the artist from the database
         cursor.execute(
@@ -165,16 +260,7 @@ def get_new_releases(artist_nickname: str) -> List[ReleaseDenorm]:
         )
         existing_releases = {row[0]: row[1] for row in cursor.fetchall()}
 
-    artist_url = f"https://{artist_nickname}.bandcamp.com"
-    response = requests.get(artist_url)
-    response.raise_for_status()
-
-    soup = BeautifulSoup(response.content, "html.parser")
-    release_urls = [
-        a["href"] for a in soup.find("ol", {"class": "music-grid"}).find_all("a")
-    ]
-    release_urls = [artist_url + link for link in release_urls]
-
+    ARTISTS_CHECKED.inc(outcome="changed")
     # Find new release links that are not already in the database
     new_release_urls = set(release_urls) - set(existing_releases.keys())
 
@@ -184,84 +270,106 @@ def get_new_releases(artist_nickname: str) -> List[ReleaseDenorm]:
     )
 
     new_releases: List[ReleaseDenorm] = []
-    for release_url in new_release_urls:
-        try:
-            release = extract_title_metadata(release_url)
-            if release.link not in existing_releases:
-                new_releases.append(release)
-        except Exception as e:
-            logging.error(
-                f"Error extracting metadata for release at {release_url}: {e}",
-                exc_info=True,
-            )
-
-    # Save new releases to the database
-    with sqlite_db(DB_NAME) as conn:
-        cursor = conn.cursor()
-
-        for release in new_releases:
-            # Add release to the database
-            cursor.execute(
-                "INSERT INTO releases (artist_id, title, release_date, link) VALUES (?, ?, ?, ?)",
-                (artist_id, release.title, release.release_date, release.link),
-            )
-            release_id = cursor.lastrowid
-
-            # Add tracks to the database
-            for track in release.tracks:
-                cursor.execute(
-                    "INSERT INTO tracks (release_id, number, title, duration, link) VALUES (?, ?, ?, ?, ?)",
-                    (release_id, track.number, track.title, track.duration, track.link),
-                )
-
-        conn.commit()
-
+    failed = 0
+    for release_url, release in _extract_releases(new_release_urls, executor, fetcher):
+        if release is None:
+            failed += 1
+        elif release.link not in existing_releases:
+            new_releases.append(release)
+
+    if failed:
+        # Forget the validators so that the skipped releases are retried on
+        # the next run instead of being hidden behind a 304.
+        etag = last_modified = new_grid_hash = None
+
+    _store(
+        CrawlResult(
+            artist_id, new_releases, checked_at, etag, last_modified, new_grid_hash
+        ),
+        writer,
+    )
     return new_releases
 
 
-def extract_title_metadata(release_url: str) -> ReleaseDenorm:
-    """Extract title metadata from the bandcamp release page."""
-    logging.info(f"Extracting metadata from release at {release_url}")
-    response = requests.get(release_url)
-    response.raise_for_status()
+def grid_fingerprint(release_urls: List[str]) -> str:
+    """Hash the release links of an artist page, ignoring their order."""
+    return hashlib.sha256("\n".join(sorted(release_urls)).encode()).hexdigest()
 
-    soup = BeautifulSoup(response.content, "html.parser")
 
-    title = soup.find("h2", {"class": "trackTitle"}).text.strip()
-    artist = soup.find("h3").find("a").text.strip()
+def _store(result: CrawlResult, writer: Optional[ReleaseWriter] = None):
+    """Save the releases and page validators of an artist."""
+    if writer is not None:
+        writer.submit(result)
+        return
+    with sqlite_db(DB_NAME) as conn:
+        write_results(conn, [result])
 
-    # Extract the release date from the tralbumData div using regex
-    date_str = soup.find("div", {"class": "tralbumData"}).text.strip()
-    match = re.search(r"released (.+)", date_str)
-    release_date_str = match.group(1) if match else ""
 
-    # Parse the release date string into a datetime object
-    release_date = (
-        datetime.strptime(release_date_str, "%B %d, %Y") if release_date_str else None
-    )
+def _extract_releases(release_urls, executor=None, fetcher=None):
+    """Yield `(url, release)` pairs, with `release` set to None on failure.
 
-    tracks_table = soup.find("table", {"id": "track_table"})
-    tracks = []
-    for row in tracks_table.find_all("tr"):
+    A release that can not be downloaded or parsed is logged and skipped, it
+    never aborts the remaining releases of the artist.
+    """
+    if executor is None:
+        pending = ((url, None) for url in release_urls)
+    else:
+        futures = {
+            executor.submit(extract_title_metadata, url, fetcher): url
+            for url in release_urls
+        }
+        pending = ((futures[future], future) for future in as_completed(futures))
+
+    for release_url, future in pending:
         try:
-            number_str = row.find("div", {"class": "track_number"}).text.strip()
-            number = int("".join(filter(str.isdigit, number_str)))
-            title = row.find("span", {"class": "track-title"}).text.strip()
-            duration = row.find("span", {"class": "time"}).text.strip()
-            track_url = (
-                release_url
-                + row.find("a", {"href": lambda href: href and "/track/" in href})[
-                    "href"
-                ]
-            )
-            tracks.append(Track(number, title, duration, track_url))
+            if future is None:
+                release = extract_title_metadata(release_url, fetcher)
+            else:
+                release = future.result()
         except Exception as e:
             logging.error(
-                f"Error extracting metadata for track in release at {release_url}: {e}",
+                f"Error extracting metadata for release at {release_url}: {e}",
                 exc_info=True,
             )
+            release = None
+        yield release_url, release
 
-    return ReleaseDenorm(title, artist, release_url, release_date, tracks)
+
+def extract_title_metadata(
+    release_url: str,
+    fetcher: Optional[Fetcher] = None,
+    engine: str = DEFAULT_ENGINE,
+) -> ReleaseDenorm:
+    """Extract title metadata from the bandcamp release page.
+
+    See `parsing` for the available extraction engines. Both parse the track
+    durations into `duration_seconds`, None where the page shows none.
+    """
+    logging.info(f"Extracting metadata from release at {release_url}")
+    response = _fetch(fetcher or get_fetcher(), release_url, "release")
+    with PARSE_SECONDS.time(page="release"):
+        try:
+            return parse_release_page(response.content, release_url, engine)
+        except Exception:
+            ERRORS.inc(stage="parse")
+            raise
+
+
+def _fetch(
+    fetcher: Fetcher, url: str, page: str, headers: Optional[dict] = None
+) -> requests.Response:
+    """Download `url` and record its latency, size and status under `page`."""
+    try:
+        with FETCH_SECONDS.time(page=page):
+            response = fetcher.get(url, headers=headers)
+    except Exception as e:
+        ERRORS.inc(stage="fetch")
+        if isinstance(e, requests.HTTPError) and e.response is not None:
+            FETCH_RESPONSES.inc(page=page, status=e.response.status_code)
+        raise
+    FETCH_RESPONSES.inc(page=page, status=response.status_code)
+    FETCH_BYTES.inc(len(response.content), page=page)
+    return response
 
 
 def get_artist_nicknames_from_db():
@@ -280,48 +388,237 @@ def get_artist_nicknames_from_db():
         return artist_nicknames
 
 
-def update_releases_db():
+def update_releases_db(
+    concurrency: int = DEFAULT_CONCURRENCY,
+    per_host: int = DEFAULT_PER_HOST,
+    force: bool = False,
+) -> Dict[str, Any]:
     """
     Update the releases database for each artist nickname by fetching and adding new releases.
 
-    Log any errors that occur during the process.
+    Only artists that are due according to the `scheduler` are checked, unless
+    `force` is set.
+
+    With a `concurrency` above one, artist pages and release pages are
+    downloaded in parallel, with at most `concurrency` requests in flight in
+    total and at most `per_host` requests to the same artist subdomain.
+
+    Log any errors that occur during the process, artists whose results
+    could not be stored count as failed. Returns a summary of the run
+    with the changes of all `metrics`, which is also stored in the database
+    as `LAST_UPDATE`.
     """
-    for artist_nickname in get_artist_nicknames_from_db():
-        try:
-            get_new_releases(artist_nickname)
-        except Exception as e:
-            logging.error(
-                f"Error updating releases for artist {artist_nickname}: {e}",
-                exc_info=True,
+    started_at = datetime.now()
+    before = metrics.snapshot()
+    artist_nicknames = artists_to_check(force)
+    with ReleaseWriter(DB_NAME) as writer:
+        failed = update_artists(artist_nicknames, concurrency, per_host, writer)
+    failed += len(writer.failed_artists)
+    finished_at = datetime.now()
+
+    summary = {
+        "started_at": started_at.isoformat(),
+        "finished_at": finished_at.isoformat(),
+        "duration_seconds": (finished_at - started_at).total_seconds(),
+        "artists": len(artist_nicknames),
+        "failed_artists": failed,
+        "new_releases": writer.written,
+        "metrics": metrics.difference(before, metrics.snapshot()),
+    }
+    with sqlite_db(DB_NAME) as conn:
+        set_meta(conn, LAST_UPDATE, json.dumps(summary))
+    logging.info(
+        f"Checked {len(artist_nicknames)} artists ({failed} failed) and found "
+        f"{writer.written} new releases in {summary['duration_seconds']:.1f}s"
+    )
+    return summary
+
+
+def artists_to_check(force: bool = False) -> List[str]:
+    """Return the artists due for a check according to the `scheduler`, or all."""
+    if force:
+        return get_artist_nicknames_from_db()
+    artist_nicknames = due_artists(DB_NAME)
+    logging.info(f"{len(artist_nicknames)} artists are due for a check")
+    return artist_nicknames
+
+
+def update_artists(
+    artist_nicknames: List[str], concurrency: int, per_host: int, writer
+) -> int:
+    """Check all artists and return the number of failed checks."""
+    if concurrency <= 1:
+        with Fetcher() as fetcher:
+            return sum(
+                not update_artist(artist_nickname, fetcher=fetcher, writer=writer)
+                for artist_nickname in artist_nicknames
             )
 
+    fetcher = Fetcher(pool_size=concurrency, limiter=HostLimiter(concurrency, per_host))
+    # Artists and releases get separate pools: an artist task blocks until
+    # its release tasks are done, so sharing one pool could deadlock.
+    with ThreadPoolExecutor(
+        max_workers=concurrency, thread_name_prefix="bc-release"
+    ) as release_pool, ThreadPoolExecutor(
+        max_workers=concurrency, thread_name_prefix="bc-artist"
+    ) as artist_pool, fetcher:
+        futures = [
+            artist_pool.submit(update_artist, nickname, release_pool, fetcher, writer)
+            for nickname in artist_nicknames
+        ]
+        return sum(not future.result() for future in as_completed(futures))
+
+
+def update_artist(artist_nickname, executor=None, fetcher=None, writer=None) -> bool:
+    """Fetch new releases of one artist, logging instead of raising errors."""
+    try:
+        get_new_releases(artist_nickname, executor, fetcher, writer)
+    except Exception as e:
+        logging.error(
+            f"Error updating releases for artist {artist_nickname}: {e}",
+            exc_info=True,
+        )
+        return False
+    return True
 
-def get_releases_by_date(date: str, db_name: str) -> List[ReleaseDenorm]:
+
+def get_releases_by_date(
+    date: str, db_name: str, tracks: bool = False
+) -> List[ReleaseRow]:
     """Take in a date string in the format `YYYYMMDD` and a database filename as arguments.
 
     Then use a context manager to create a connection to the database and execute a SQL query to retrieve all releases with the
-    given date. The results are then converted into a list of `Release` objects
-    using the `pydantic` library and returned.
+    given date. The results are returned as a list of `ReleaseRow` records,
+    which have the fields of `ReleaseDenorm` but skip its validation. Their
+    `tracks` are read as well if `tracks` is set.
+    """
+    return [
+        release
+        for releases in iter_release_pages(date, db_name, tracks=tracks)
+        for release in releases
+    ]
+
+
+def get_releases_page(
+    date: str,
+    db_name: str,
+    after: Optional[PageKey] = None,
+    limit: int = PAGE_SIZE,
+    tracks: bool = False,
+) -> Tuple[List[ReleaseRow], Optional[PageKey]]:
+    """Return one page of the releases since `date`, newest first.
+
+    Pages are addressed by keyset: `after` is the `(release_date, id)` of the
+    last release of the previous page, which the `releases_release_date` index
+    turns into a seek instead of an OFFSET scan. The key of the next page is
+    returned along with the releases, it is None on the last page.
+
+    With `tracks`, the tracks of all releases of the page are read with one
+    more query, see `get_tracks`.
+
+    First pages are served from the `release_cache` until releases change.
+    Later pages are read from the database every time: walking back through
+    years of releases would otherwise push the pages everybody asks for out
+    of the cache, and pin every page of the walk in memory.
     """
+    cached = after is None
+    if cached:
+        check_releases_generation(db_name)
+        key = (os.path.abspath(db_name), date, limit, tracks)
+        page = release_cache.get(key)
+        if page is not None:
+            return page
+        generation = release_cache.invalidations
+
     formatted_date = datetime.strptime(date, "%Y%m%d")
+    query = """
+        SELECT r.title, a.nickname, r.link, r.release_date, r.id
+        FROM releases r INNER JOIN artists a ON r.artist_id=a.id
+        WHERE r.release_date >= ?
+    """
+    params: list = [formatted_date]
+    if after is not None:
+        query += " AND (r.release_date, r.id) < (?, ?)"
+        params.extend(after)
+    query += " ORDER BY r.release_date DESC, r.id DESC LIMIT ?"
+    params.append(limit)
+
     with sqlite_db(db_name) as conn:
-        cursor = conn.cursor()
-        cursor.execute(
-            """
-            SELECT r.title, a.nickname, r.link,r.release_date
-            FROM releases r INNER JOIN artists a ON r.artist_id=a.id
-            WHERE r.release_date >= ? ORDER BY r.release_date DESC
+        rows = conn.execute(query, params).fetchall()
+        by_release = get_tracks(conn, [row[4] for row in rows]) if tracks else {}
+
+    releases = [
+        ReleaseRow(
+            *row[:3],
+            as_datetime(row[3]),
+            by_release.get(row[4], []) if tracks else None,
+        )
+        for row in rows
+    ]
+    next_key = (rows[-1][3], rows[-1][4]) if len(rows) == limit else None
+    if cached:
+        weight = len(releases) + sum(len(by_release.get(row[4], ())) for row in rows)
+        release_cache.put(key, (releases, next_key), generation, max(weight, 1))
+    return releases, next_key
+
+
+def get_tracks(conn, release_ids: List[int]) -> Dict[int, List[TrackRow]]:
+    """Return the tracks of the releases by release id, ordered by number.
+
+    Reads the tracks of up to `IN_CHUNK` releases per query, which the
+    `tracks_release_id` index returns already grouped, so they are collected
+    in one pass over the rows instead of with a query per release.
+    """
+    by_release: Dict[int, List[TrackRow]] = {}
+    for start in range(0, len(release_ids), IN_CHUNK):
+        chunk = release_ids[start : start + IN_CHUNK]
+        rows = conn.execute(
+            f"""
+            SELECT number, title, duration, link, id, release_id, duration_seconds
+            FROM tracks
+            WHERE release_id IN ({','.join('?' * len(chunk))})
+            ORDER BY release_id, number
             """,
-            (formatted_date,),
+            chunk,
         )
-        results = cursor.fetchall()
-        releases = [
-            ReleaseDenorm(title=row[0], artist=row[1], link=row[2], release_date=row[3])
-            for row in results
-        ]
+        for release_id, group in groupby(rows, key=itemgetter(5)):
+            by_release[release_id] = [TrackRow(*row) for row in group]
+    return by_release
+
+
+def encode_cursor(key: PageKey) -> str:
+    """Turn the key of a page into an opaque cursor for API clients."""
+    return base64.urlsafe_b64encode(json.dumps(key).encode()).decode()
 
-        return releases
+
+def decode_cursor(cursor: str) -> PageKey:
+    """Inverse of `encode_cursor`, raises ValueError for malformed cursors."""
+    try:
+        release_date, release_id = json.loads(base64.urlsafe_b64decode(cursor))
+    except Exception as e:
+        raise ValueError(f"Invalid cursor {cursor!r}") from e
+    if not isinstance(release_date, str) or not isinstance(release_id, int):
+        raise ValueError(f"Invalid cursor {cursor!r}")
+    return release_date, release_id
+
+
+def iter_release_pages(
+    date: str, db_name: str, page_size: int = PAGE_SIZE, tracks: bool = False
+) -> Iterator[List[ReleaseRow]]:
+    """Yield all releases since `date` page by page.
+
+    No connection or cursor is held between pages, so the generator may be
+    resumed from a different thread.
+    """
+    after = None
+    while True:
+        releases, after = get_releases_page(date, db_name, after, page_size, tracks)
+        if releases:
+            yield releases
+        if after is None:
+            return
 
 
 if __name__ == "__main__":
+    logging.basicConfig(level=logging.INFO)
     update_releases_db()
@@ -0,0 +1,203 @@
+"""Extract release metadata from bandcamp release pages.
+
+Two engines produce the same `ReleaseDenorm`:
+
+* `full` builds the complete `BeautifulSoup` tree of the page, like the
+  original implementation did.
+* `fast` only builds the handful of nodes we read (the title `h2`, the `h3`
+  holding the artist, the `tralbumData` div and the `track_table`) and walks
+  every track row once instead of running one `find` per field.
+
+The fast engine is the default, it falls back to the full one whenever a page
+does not have the expected structure.
+"""
+import logging
+import re
+from datetime import datetime
+from typing import Optional, Union
+
+from bs4 import BeautifulSoup, SoupStrainer
+
+from .db import parse_duration
+from .model import ReleaseDenorm, Track
+
+FAST = "fast"
+FULL = "full"
+ENGINES = (FAST, FULL)
+DEFAULT_ENGINE = FAST
+
+
+def _has_class(value, name: str) -> bool:
+    if value is None:
+        return False
+    if isinstance(value, str):
+        value = value.split()
+    return name in value
+
+
+def _wanted_tag(name: str, attrs) -> bool:
+    """Whether a top level tag of a release page is needed for extraction."""
+    if name == "h3":
+        return True
+    if name not in ("h2", "div", "table"):
+        return False
+    if not isinstance(attrs, dict):
+        attrs = dict(attrs or ())
+    if name == "h2":
+        return _has_class(attrs.get("class"), "trackTitle")
+    if name == "div":
+        return _has_class(attrs.get("class"), "tralbumData")
+    return attrs.get("id") == "track_table"
+
+
+class _ReleaseStrainer(SoupStrainer):
+    """Only let the release page nodes we extract into the tree.
+
+    Once a tag is admitted its whole subtree is built, so the strainer only
+    decides on tags at the top level of the strained document.
+    """
+
+    text = None
+
+    def allow_tag_creation(self, nsprefix, name, attrs):
+        # beautifulsoup4 >= 4.13
+        return _wanted_tag(name, attrs)
+
+    def allow_string_creation(self, string):
+        return False
+
+    def search_tag(self, markup_name=None, markup_attrs={}):
+        # beautifulsoup4 < 4.13
+        return _wanted_tag(markup_name, markup_attrs)
+
+
+def _parse_release_date(date_str: str) -> Optional[datetime]:
+    match = re.search(r"released (.+)", date_str)
+    release_date_str = match.group(1) if match else ""
+    return (
+        datetime.strptime(release_date_str, "%B %d, %Y") if release_date_str else None
+    )
+
+
+def _parse_full(content: Union[str, bytes], release_url: str) -> ReleaseDenorm:
+    soup = BeautifulSoup(content, "html.parser")
+
+    title = soup.find("h2", {"class": "trackTitle"}).text.strip()
+    artist = soup.find("h3").find("a").text.strip()
+
+    # Extract the release date from the tralbumData div using regex
+    date_str = soup.find("div", {"class": "tralbumData"}).text.strip()
+    release_date = _parse_release_date(date_str)
+
+    tracks_table = soup.find("table", {"id": "track_table"})
+    tracks = []
+    for row in tracks_table.find_all("tr"):
+        try:
+            number_str = row.find("div", {"class": "track_number"}).text.strip()
+            number = int("".join(filter(str.isdigit, number_str)))
+            track_title = row.find("span", {"class": "track-title"}).text.strip()
+            duration = row.find("span", {"class": "time"}).text.strip()
+            track_url = (
+                release_url
+                + row.find("a", {"href": lambda href: href and "/track/" in href})[
+                    "href"
+                ]
+            )
+            tracks.append(
+                Track(
+                    number=number,
+                    title=track_title,
+                    duration=duration,
+                    duration_seconds=parse_duration(duration),
+                    link=track_url,
+                )
+            )
+        except Exception as e:
+            logging.error(
+                f"Error extracting metadata for track in release at {release_url}: {e}",
+                exc_info=True,
+            )
+
+    return ReleaseDenorm(
+        title=title,
+        artist=artist,
+        link=release_url,
+        release_date=release_date,
+        tracks=tracks,
+    )
+
+
+def _parse_track_row(row, release_url: str) -> Track:
+    """Collect all fields of a track row in a single walk over its nodes."""
+    number_div = title_span = time_span = track_link = None
+    for node in row.descendants:
+        name = getattr(node, "name", None)
+        if name == "div":
+            if number_div is None and _has_class(node.get("class"), "track_number"):
+                number_div = node
+        elif name == "span":
+            classes = node.get("class")
+            if title_span is None and _has_class(classes, "track-title"):
+                title_span = node
+            if time_span is None and _has_class(classes, "time"):
+                time_span = node
+        elif name == "a" and track_link is None:
+            href = node.get("href")
+            if href and "/track/" in href:
+                track_link = href
+
+    number = int("".join(filter(str.isdigit, number_div.text.strip())))
+    duration = time_span.text.strip()
+    return Track(
+        number=number,
+        title=title_span.text.strip(),
+        duration=duration,
+        duration_seconds=parse_duration(duration),
+        link=release_url + track_link,
+    )
+
+
+def _parse_fast(content: Union[str, bytes], release_url: str) -> ReleaseDenorm:
+    soup = BeautifulSoup(content, "html.parser", parse_only=_ReleaseStrainer())
+
+    # The strained tree is tiny, so repeating the full engine's lookups is
+    # cheap and guarantees that both engines pick the same nodes.
+    title = soup.find("h2", {"class": "trackTitle"}).text.strip()
+    artist = soup.find("h3").find("a").text.strip()
+    date_str = soup.find("div", {"class": "tralbumData"}).text.strip()
+    release_date = _parse_release_date(date_str)
+
+    tracks = []
+    for row in soup.find("table", {"id": "track_table"}).find_all("tr"):
+        try:
+            tracks.append(_parse_track_row(row, release_url))
+        except Exception as e:
+            logging.error(
+                f"Error extracting metadata for track in release at {release_url}: {e}",
+                exc_info=True,
+            )
+
+    return ReleaseDenorm(
+        title=title,
+        artist=artist,
+        link=release_url,
+        release_date=release_date,
+        tracks=tracks,
+    )
+
+
+def parse_release_page(
+    content: Union[str, bytes], release_url: str, engine: str = DEFAULT_ENGINE
+) -> ReleaseDenorm:
+    """Extract title, artist, release date and tracks from a release page."""
+    if engine not in ENGINES:
+        raise ValueError(f"Unknown extraction engine {engine!r}")
+    if engine == FAST:
+        try:
+            return _parse_fast(content, release_url)
+        except Exception as e:
+            logging.warning(
+                f"Fast extraction failed for {release_url} ({e!r}), "
+                "falling back to the full parser"
+            )
+    return _parse_full(content, release_url)
@@ -0,0 +1,100 @@
+"""Find out where an update spends its time.
+
+`profile_update` checks the same artists as `update_releases_db`, one after
+another and under cProfile, and breaks the time of every artist and release
+page down into network, parsing and database writes using the `metrics`.
+Results are written right away instead of being batched, so that each write
+is attributed to its artist.
+"""
+import cProfile
+import time
+from concurrent.futures import Executor, Future
+from typing import Dict, List, NamedTuple, Tuple
+
+from . import metrics
+from .fetch import Fetcher
+from .music_data import artists_to_check, update_artist
+
+
+class Timing(NamedTuple):
+    """Time spent on one artist or release page, in seconds."""
+
+    name: str
+    wall: float
+    network: float
+    parse: float
+    db: float
+    pages: int
+    tracks: int
+    ok: bool
+
+    @property
+    def other(self) -> float:
+        return max(self.wall - self.network - self.parse - self.db, 0.0)
+
+
+def _total(changes: Dict[str, float], prefix: str) -> float:
+    return sum(v for k, v in changes.items() if k.split("{")[0] == prefix)
+
+
+def _timing(name: str, wall: float, changes: Dict[str, float], ok: bool) -> Timing:
+    return Timing(
+        name=name,
+        wall=wall,
+        network=_total(changes, "bc_fetch_seconds_sum"),
+        parse=_total(changes, "bc_parse_seconds_sum"),
+        db=_total(changes, "bc_db_write_seconds_sum"),
+        pages=int(_total(changes, "bc_fetch_seconds_count")),
+        tracks=int(changes.get('bc_rows_written_total{table="tracks"}', 0)),
+        ok=ok,
+    )
+
+
+class _TimingExecutor(Executor):
+    """Run release page extractions inline and time each one."""
+
+    def __init__(self):
+        self.pages: List[Timing] = []
+
+    def submit(self, fn, *args, **kwargs):
+        future: Future = Future()
+        before = metrics.snapshot()
+        start = time.perf_counter()
+        try:
+            release = fn(*args, **kwargs)
+        except Exception as e:
+            future.set_exception(e)
+            tracks, ok = 0, False
+        else:
+            future.set_result(release)
+            tracks, ok = len(release.tracks or ()), True
+        changes = metrics.difference(before, metrics.snapshot())
+        timing = _timing(args[0], time.perf_counter() - start, changes, ok)
+        self.pages.append(timing._replace(tracks=tracks))
+        return future
+
+
+def profile_update(
+    output: str, force: bool = False
+) -> Tuple[List[Timing], List[Timing]]:
+    """Check all due artists under cProfile and dump the stats to `output`.
+
+    Returns the timings of all artists and of all release pages downloaded.
+    The `.prof` file can be loaded with `pstats`, snakeviz and the like.
+    """
+    profiler = cProfile.Profile()
+    executor = _TimingExecutor()
+    artists = []
+    with Fetcher() as fetcher:
+        for nickname in artists_to_check(force):
+            before = metrics.snapshot()
+            start = time.perf_counter()
+            profiler.enable()
+            try:
+                ok = update_artist(nickname, executor, fetcher)
+            finally:
+                profiler.disable()
+            changes = metrics.difference(before, metrics.snapshot())
+            artists.append(_timing(nickname, time.perf_counter() - start, changes, ok))
+    profiler.dump_stats(output)
+    return artists, executor.pages
@@ -0,0 +1,100 @@
+"""Decide which artists are due for a check.
+
+Every artist gets a check interval derived from its release history: artists
+that release every few weeks are checked often, artists that have been quiet
+for years only rarely. The interval is a fraction of the typical gap between
+releases (or of the time since the last release, if that is longer), clamped
+to `MIN_INTERVAL` and `MAX_INTERVAL`.
+"""
+import heapq
+from datetime import datetime, timedelta
+from itertools import groupby
+from statistics import median
+from typing import List, Optional, Sequence, Tuple
+
+from .db import as_datetime, sqlite_db
+
+MIN_INTERVAL = timedelta(hours=12)
+MAX_INTERVAL = timedelta(days=30)
+# Used for artists without enough releases to estimate a cadence.
+DEFAULT_INTERVAL = timedelta(days=3)
+# Check this many times per typical gap between two releases.
+CHECKS_PER_GAP = 4
+# Only the most recent releases count, artists change their pace.
+HISTORY = 10
+
+
+def check_interval(
+    release_dates: Sequence[datetime],
+    now: datetime,
+    min_interval: timedelta = MIN_INTERVAL,
+    max_interval: timedelta = MAX_INTERVAL,
+) -> timedelta:
+    """Return how long to wait between two checks of an artist."""
+    dates = sorted(release_dates)[-HISTORY:]
+    if len(dates) < 2:
+        interval = DEFAULT_INTERVAL
+    else:
+        typical_gap = median(b - a for a, b in zip(dates, dates[1:]))
+        interval = max(typical_gap, now - dates[-1]) / CHECKS_PER_GAP
+    return max(min_interval, min(interval, max_interval))
+
+
+def next_check(
+    last_checked: Optional[datetime],
+    release_dates: Sequence[datetime],
+    now: datetime,
+    min_interval: timedelta = MIN_INTERVAL,
+    max_interval: timedelta = MAX_INTERVAL,
+) -> datetime:
+    """Return when an artist is due next, artists never checked are due now."""
+    if last_checked is None:
+        return datetime.min
+    return last_checked + check_interval(release_dates, now, min_interval, max_interval)
+
+
+def schedule(
+    db_name: str,
+    now: Optional[datetime] = None,
+    min_interval: timedelta = MIN_INTERVAL,
+    max_interval: timedelta = MAX_INTERVAL,
+) -> List[Tuple[datetime, str]]:
+    """Return a heap of `(next_check, nickname)` for all artists."""
+    now = now or datetime.now()
+    with sqlite_db(db_name) as conn:
+        rows = conn.execute(
+            """
+            SELECT a.id, a.nickname, a.last_checked, r.release_date
+            FROM artists a LEFT JOIN releases r ON r.artist_id = a.id
+            ORDER BY a.id
+            """
+        ).fetchall()
+
+    heap = []
+    for _, artist_rows in groupby(rows, key=lambda row: row[0]):
+        artist_rows = list(artist_rows)
+        _, nickname, last_checked, _ = artist_rows[0]
+        release_dates = [
+            as_datetime(row[3]) for row in artist_rows if row[3] is not None
+        ]
+        due = next_check(
+            as_datetime(last_checked), release_dates, now, min_interval, max_interval
+        )
+        heap.append((due, nickname))
+    heapq.heapify(heap)
+    return heap
+
+
+def due_artists(
+    db_name: str,
+    now: Optional[datetime] = None,
+    min_interval: timedelta = MIN_INTERVAL,
+    max_interval: timedelta = MAX_INTERVAL,
+) -> List[str]:
+    """Return the nicknames of all artists due for a check, most overdue first."""
+    now = now or datetime.now()
+    heap = schedule(db_name, now, min_interval, max_interval)
+    due = []
+    while heap and heap[0][0] <= now:
+        due.append(heapq.heappop(heap)[1])
+    return due
@@ -0,0 +1,121 @@
+"""Full-text search over artist nicknames, release titles and track titles.
+
+The FTS5 indexes are created by the `_add_search` migration. Changes to
+artists and all updates and deletes are indexed by triggers, new releases and
+their tracks by `write_results` calling `index_releases`, so they are
+searchable as soon as they are committed. Results of all three kinds are
+ranked together by BM25.
+"""
+import re
+from typing import TYPE_CHECKING, List, Optional, Tuple
+
+from .db import SEARCH_INDEXES, sqlite_db
+
+if TYPE_CHECKING:
+    from .model import SearchHit
+
+KINDS = ("artist", "release", "track")
+SEARCH_LIMIT = 20
+
+# One SELECT per kind, `bm25()` is lower for better matches.
+_QUERIES = {
+    "artist": """
+        SELECT 'artist', a.id, a.nickname, a.nickname, NULL, bm25(artists_fts)
+        FROM artists_fts JOIN artists a ON a.id = artists_fts.rowid
+        WHERE artists_fts MATCH :query
+    """,
+    "release": """
+        SELECT 'release', r.id, r.title, a.nickname, r.link, bm25(releases_fts)
+        FROM releases_fts
+        JOIN releases r ON r.id = releases_fts.rowid
+        JOIN artists a ON a.id = r.artist_id
+        WHERE releases_fts MATCH :query
+    """,
+    "track": """
+        SELECT 'track', t.id, t.title, a.nickname, t.link, bm25(tracks_fts)
+        FROM tracks_fts
+        JOIN tracks t ON t.id = tracks_fts.rowid
+        JOIN releases r ON r.id = t.release_id
+        JOIN artists a ON a.id = r.artist_id
+        WHERE tracks_fts MATCH :query
+    """,
+}
+
+
+def fts_query(text: str) -> str:
+    """Turn user input into an FTS5 query matching all words as prefixes.
+
+    Operators and quotes in the input are not interpreted, "daft pun" finds
+    "Daft Punk".
+    """
+    words = re.findall(r"\w+", text)
+    if not words:
+        raise ValueError("Search for at least one word")
+    return " ".join(f'"{word}"*' for word in words)
+
+
+def search(
+    db_name: str,
+    text: str,
+    kinds: Optional[List[str]] = None,
+    limit: int = SEARCH_LIMIT,
+    offset: int = 0,
+) -> Tuple[List["SearchHit"], Optional[int]]:
+    """Return one page of matches for `text` and the offset of the next page.
+
+    `kinds` restricts the results to some of `KINDS`. Raises ValueError for
+    input without any words or unknown kinds.
+    """
+    # Imported here, the CLI loads this module without needing pydantic.
+    from .model import SearchHit
+
+    kinds = list(kinds or KINDS)
+    unknown = set(kinds) - set(KINDS)
+    if unknown:
+        raise ValueError(f"Unknown kinds {sorted(unknown)}, use {KINDS}")
+    query = " UNION ALL ".join(_QUERIES[kind] for kind in kinds)
+    query += " ORDER BY 6, 1, 2 LIMIT :limit OFFSET :offset"
+    params = {"query": fts_query(text), "limit": limit + 1, "offset": offset}
+    with sqlite_db(db_name) as conn:
+        rows = conn.execute(query, params).fetchall()
+
+    hits = [
+        SearchHit(
+            kind=kind, id=id, title=title or "", artist=artist, link=link, score=-score
+        )
+        for kind, id, title, artist, link, score in rows[:limit]
+    ]
+    return hits, offset + limit if len(rows) > limit else None
+
+
+def index_releases(cursor, first_id: int):
+    """Index the releases with ids from `first_id` on, and their tracks.
+
+    For releases inserted in the current transaction, with ids above all
+    previous releases.
+    """
+    cursor.execute(
+        "INSERT INTO releases_fts (rowid, title) "
+        "SELECT id, title FROM releases WHERE id >= ?",
+        (first_id,),
+    )
+    cursor.execute(
+        "INSERT INTO tracks_fts (rowid, title) "
+        "SELECT id, title FROM tracks WHERE release_id >= ?",
+        (first_id,),
+    )
+
+
+def rebuild_search_index(db_name: str):
+    """Index all artists, releases and tracks from scratch and optimize the indexes.
+
+    Only needed if the indexes got out of sync, e.g. after inserting releases
+    without `write_results`.
+    """
+    with sqlite_db(db_name) as conn:
+        for index, (table, column) in SEARCH_INDEXES.items():
+            conn.execute(f"DELETE FROM {index}")
+            conn.execute(
+                f"INSERT INTO {index} (rowid, {column}) SELECT id, {column} FROM {table}"
+            )
+            conn.execute(f"INSERT INTO {index} ({index}) VALUES ('optimize')")
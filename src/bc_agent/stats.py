@@ -0,0 +1,194 @@
+"""Counts and runtimes of the catalogue, per release, per artist and in total.
+
+The aggregates are kept in the `release_stats`, `artist_stats` and
+`catalogue_stats` tables instead of being computed over the tracks on every
+request. `add_stats` adds releases to them in the transaction that inserts
+the releases, like the search index and the feeds, `remove_stats` takes
+out the releases of deleted artists, and reading them is a primary key
+lookup. `rebuild_stats` computes them from scratch, which is
+only needed after changing releases or tracks outside of `write_results`.
+"""
+from typing import Iterable, Optional
+
+from .db import sqlite_db
+from .model import ArtistStats, CatalogueStats, ReleaseStats
+
+
+def _average(duration_seconds: int, timed_tracks: int) -> Optional[float]:
+    return duration_seconds / timed_tracks if timed_tracks else None
+
+
+def add_stats(cursor, first_id: int):
+    """Add the releases with ids from `first_id` on to the stats.
+
+    For releases inserted in the current transaction, with ids above all
+    previous releases.
+    """
+    cursor.execute(
+        """
+        INSERT INTO release_stats
+        SELECT r.id, r.artist_id, COUNT(t.id), COUNT(t.duration_seconds),
+               COALESCE(SUM(t.duration_seconds), 0)
+        FROM releases r LEFT JOIN tracks t ON t.release_id = r.id
+        WHERE r.id >= ?
+        GROUP BY r.id
+        """,
+        (first_id,),
+    )
+    cursor.execute(
+        """
+        INSERT INTO artist_stats
+        SELECT s.artist_id, COUNT(*), SUM(s.tracks), SUM(s.timed_tracks),
+               SUM(s.duration_seconds), MIN(r.release_date), MAX(r.release_date)
+        FROM release_stats s JOIN releases r ON r.id = s.release_id
+        WHERE s.release_id >= ?
+        GROUP BY s.artist_id
+        ON CONFLICT (artist_id) DO UPDATE SET
+            releases = releases + excluded.releases,
+            tracks = tracks + excluded.tracks,
+            timed_tracks = timed_tracks + excluded.timed_tracks,
+            duration_seconds = duration_seconds + excluded.duration_seconds,
+            first_release = COALESCE(
+                MIN(first_release, excluded.first_release),
+                first_release,
+                excluded.first_release
+            ),
+            last_release = COALESCE(
+                MAX(last_release, excluded.last_release),
+                last_release,
+                excluded.last_release
+            )
+        """,
+        (first_id,),
+    )
+    cursor.execute(
+        """
+        SELECT COUNT(*), COALESCE(SUM(tracks), 0), COALESCE(SUM(timed_tracks), 0),
+               COALESCE(SUM(duration_seconds), 0)
+        FROM release_stats WHERE release_id >= ?
+        """,
+        (first_id,),
+    )
+    cursor.execute(
+        """
+        UPDATE catalogue_stats SET
+            releases = releases + ?,
+            tracks = tracks + ?,
+            timed_tracks = timed_tracks + ?,
+            duration_seconds = duration_seconds + ?
+        WHERE id = 1
+        """,
+        cursor.fetchone(),
+    )
+
+
+def remove_stats(cursor, artist_ids: Iterable[int]):
+    """Take the releases of the given artists out of the stats.
+
+    For artists whose releases are deleted in the current transaction, call it
+    while `release_stats` still has them.
+    """
+    params = [(artist_id,) for artist_id in artist_ids]
+    cursor.executemany(
+        """
+        UPDATE catalogue_stats SET
+            releases = catalogue_stats.releases - s.releases,
+            tracks = catalogue_stats.tracks - s.tracks,
+            timed_tracks = catalogue_stats.timed_tracks - s.timed_tracks,
+            duration_seconds = catalogue_stats.duration_seconds - s.duration_seconds
+        FROM (
+            SELECT COUNT(*) AS releases, COALESCE(SUM(tracks), 0) AS tracks,
+                   COALESCE(SUM(timed_tracks), 0) AS timed_tracks,
+                   COALESCE(SUM(duration_seconds), 0) AS duration_seconds
+            FROM release_stats WHERE artist_id = ?
+        ) s
+        WHERE id = 1
+        """,
+        params,
+    )
+    cursor.executemany("DELETE FROM release_stats WHERE artist_id = ?", params)
+    cursor.executemany("DELETE FROM artist_stats WHERE artist_id = ?", params)
+
+
+def rebuild_stats(db_name: str):
+    """Compute the stats of all releases from scratch."""
+    with sqlite_db(db_name) as conn:
+        cursor = conn.cursor()
+        for table in ("release_stats", "artist_stats"):
+            cursor.execute(f"DELETE FROM {table}")
+        cursor.execute(
+            """
+            UPDATE catalogue_stats
+            SET releases = 0, tracks = 0, timed_tracks = 0, duration_seconds = 0
+            """
+        )
+        add_stats(cursor, 0)
+
+
+def get_catalogue_stats(db_name: str) -> CatalogueStats:
+    """Return the counts and runtime of all releases."""
+    with sqlite_db(db_name) as conn:
+        releases, tracks, timed, seconds = conn.execute(
+            """
+            SELECT releases, tracks, timed_tracks, duration_seconds
+            FROM catalogue_stats WHERE id = 1
+            """
+        ).fetchone()
+    return CatalogueStats(
+        releases=releases,
+        tracks=tracks,
+        duration_seconds=seconds,
+        average_track_seconds=_average(seconds, timed),
+    )
+
+
+def get_artist_stats(db_name: str, artist_id: int) -> Optional[ArtistStats]:
+    """Return the counts and runtime of the releases of an artist.
+
+    None if the artist does not exist, zeros if it has no releases yet.
+    """
+    with sqlite_db(db_name) as conn:
+        row = conn.execute(
+            """
+            SELECT a.id, a.nickname, s.releases, s.tracks, s.timed_tracks,
+                   s.duration_seconds, s.first_release, s.last_release
+            FROM artists a LEFT JOIN artist_stats s ON s.artist_id = a.id
+            WHERE a.id = ?
+            """,
+            (artist_id,),
+        ).fetchone()
+    if row is None:
+        return None
+    artist_id, nickname, releases, tracks, timed, seconds, first, last = row
+    return ArtistStats(
+        artist_id=artist_id,
+        nickname=nickname,
+        releases=releases or 0,
+        tracks=tracks or 0,
+        duration_seconds=seconds or 0,
+        average_track_seconds=_average(seconds, timed),
+        first_release=first,
+        last_release=last,
+    )
+
+
+def get_release_stats(db_name: str, release_id: int) -> Optional[ReleaseStats]:
+    """Return the track count and runtime of a release, None if it does not exist."""
+    with sqlite_db(db_name) as conn:
+        row = conn.execute(
+            """
+            SELECT release_id, artist_id, tracks, timed_tracks, duration_seconds
+            FROM release_stats WHERE release_id = ?
+            """,
+            (release_id,),
+        ).fetchone()
+    if row is None:
+        return None
+    release_id, artist_id, tracks, timed, seconds = row
+    return ReleaseStats(
+        release_id=release_id,
+        artist_id=artist_id,
+        tracks=tracks,
+        duration_seconds=seconds,
+        average_track_seconds=_average(seconds, timed),
+    )
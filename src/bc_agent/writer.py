@@ -0,0 +1,225 @@
+"""Batched persistence of crawl results."""
+import logging
+import queue
+import threading
+import time
+from datetime import datetime
+from typing import Iterable, List, NamedTuple, Optional, Set
+
+from .cache import invalidate_releases
+from .db import IN_CHUNK, sqlite_db
+from .feed import add_releases
+from .metrics import ERRORS, ROWS_WRITTEN, WRITE_SECONDS
+from .search import index_releases
+from .stats import add_stats
+from .model import ReleaseDenorm
+
+DEFAULT_FLUSH_SIZE = 200
+DEFAULT_FLUSH_INTERVAL = 2.0
+
+
+class CrawlResult(NamedTuple):
+    """Outcome of checking one artist page."""
+
+    artist_id: int
+    releases: List[ReleaseDenorm]
+    checked_at: datetime
+    etag: Optional[str] = None
+    last_modified: Optional[str] = None
+    grid_hash: Optional[str] = None
+
+
+def _existing_links(cursor, links: List[str]) -> set:
+    existing = set()
+    for start in range(0, len(links), IN_CHUNK):
+        chunk = links[start : start + IN_CHUNK]
+        cursor.execute(
+            f"SELECT link FROM releases WHERE link IN ({','.join('?' * len(chunk))})",
+            chunk,
+        )
+        existing.update(row[0] for row in cursor.fetchall())
+    return existing
+
+
+def write_results(conn, results: Iterable[CrawlResult]) -> List[ReleaseDenorm]:
+    """Store crawl results in a single transaction and return the new releases.
+
+    Release ids are assigned up front, which lets the tracks of all releases
+    go into one `executemany` as well. Releases whose link is already stored
+    are skipped together with their tracks. The new releases are added to the
+    search index, the stats and the stored feeds in the same transaction.
+    """
+    results = list(results)
+    with WRITE_SECONDS.time():
+        try:
+            inserted = _write_results(conn, results)
+        except Exception:
+            ERRORS.inc(stage="write")
+            raise
+    if inserted:
+        invalidate_releases()
+    return inserted
+
+
+def _write_results(conn, results: List[CrawlResult]) -> List[ReleaseDenorm]:
+    cursor = conn.cursor()
+    # Take the write lock before reading MAX(id), so that no other writer can
+    # hand out the same ids.
+    cursor.execute("BEGIN IMMEDIATE")
+    try:
+        links = [release.link for result in results for release in result.releases]
+        seen = _existing_links(cursor, links) if links else set()
+        cursor.execute("SELECT COALESCE(MAX(id), 0) FROM releases")
+        first_id = next_id = cursor.fetchone()[0] + 1
+
+        release_rows, track_rows, inserted = [], [], []
+        for result in results:
+            for release in result.releases:
+                if release.link in seen:
+                    continue
+                seen.add(release.link)
+                release_rows.append(
+                    (
+                        next_id,
+                        result.artist_id,
+                        release.title,
+                        release.release_date,
+                        release.link,
+                    )
+                )
+                track_rows.extend(
+                    (
+                        next_id,
+                        track.number,
+                        track.title,
+                        track.duration,
+                        track.duration_seconds,
+                        track.link,
+                    )
+                    for track in release.tracks or ()
+                )
+                inserted.append(release)
+                next_id += 1
+
+        cursor.executemany(
+            "INSERT INTO releases (id, artist_id, title, release_date, link) VALUES (?, ?, ?, ?, ?)",
+            release_rows,
+        )
+        cursor.executemany(
+            "INSERT INTO tracks (release_id, number, title, duration, duration_seconds, link) VALUES (?, ?, ?, ?, ?, ?)",
+            track_rows,
+        )
+        if release_rows:
+            index_releases(cursor, first_id)
+            add_stats(cursor, first_id)
+        add_releases(cursor, release_rows)
+        cursor.executemany(
+            """
+            UPDATE artists SET last_checked = ?, etag = ?, last_modified = ?, grid_hash = ?
+            WHERE id = ?
+            """,
+            [
+                (r.checked_at, r.etag, r.last_modified, r.grid_hash, r.artist_id)
+                for r in results
+            ],
+        )
+        conn.commit()
+    except Exception:
+        conn.rollback()
+        raise
+    ROWS_WRITTEN.inc(len(release_rows), table="releases")
+    ROWS_WRITTEN.inc(len(track_rows), table="tracks")
+    ROWS_WRITTEN.inc(len(results), table="artists")
+    return inserted
+
+
+class ReleaseWriter:
+    """Collect crawl results from any thread and store them from a single one.
+
+    Results are flushed in one transaction once `flush_size` releases are
+    pending or `flush_interval` seconds passed since the first pending result,
+    whichever comes first, and when the writer is closed. A batch that fails
+    to be written is logged, its artists are collected in `failed_artists`.
+    """
+
+    _CLOSE = object()
+
+    def __init__(
+        self,
+        db_name: str,
+        flush_size: int = DEFAULT_FLUSH_SIZE,
+        flush_interval: float = DEFAULT_FLUSH_INTERVAL,
+    ):
+        self.db_name = db_name
+        self.flush_size = flush_size
+        self.flush_interval = flush_interval
+        self.written = 0
+        # Ids of the artists whose results could not be stored.
+        self.failed_artists: Set[int] = set()
+        self._queue: "queue.Queue" = queue.Queue()
+        self._thread = threading.Thread(target=self._run, name="bc-writer", daemon=True)
+        self._thread.start()
+
+    def submit(self, result: CrawlResult):
+        """Queue `result` for writing."""
+        if not self._thread.is_alive():
+            raise RuntimeError("Writer is closed")
+        self._queue.put(result)
+
+    def close(self):
+        """Write all pending results and stop the writer thread."""
+        if self._thread.is_alive():
+            self._queue.put(self._CLOSE)
+            self._thread.join()
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, *exc_info):
+        self.close()
+
+    def _flush(self, batch: List[CrawlResult]):
+        if not batch:
+            return
+        try:
+            with sqlite_db(self.db_name) as conn:
+                inserted = write_results(conn, batch)
+        except Exception as e:
+            logging.error(
+                f"Error writing results of {len(batch)} artists: {e}", exc_info=True
+            )
+            self.failed_artists.update(result.artist_id for result in batch)
+            return
+        self.written += len(inserted)
+        logging.info(
+            f"Stored {len(inserted)} new releases of {len(batch)} checked artists"
+        )
+
+    def _run(self):
+        batch: List[CrawlResult] = []
+        pending = 0
+        deadline = None
+        while True:
+            timeout = None if deadline is None else max(deadline - time.monotonic(), 0)
+            try:
+                item = self._queue.get(timeout=timeout)
+            except queue.Empty:
+                item = None
+
+            if item is not None and item is not self._CLOSE:
+                batch.append(item)
+                pending += len(item.releases)
+                if deadline is None:
+                    deadline = time.monotonic() + self.flush_interval
+
+            if (
+                item is None
+                or item is self._CLOSE
+                or pending >= self.flush_size
+                or time.monotonic() >= deadline
+            ):
+                self._flush(batch)
+                batch, pending, deadline = [], 0, None
+
+            if item is self._CLOSE:
+                return
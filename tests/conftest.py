@@ -0,0 +1,99 @@
+import os
+import shutil
+import sqlite3
+import tempfile
+from datetime import datetime, timedelta
+from typing import Optional, Sequence, Union
+from unittest.mock import patch
+
+import pytest
+
+from bc_agent import music_data
+from bc_agent.db import close_connections, sqlite_db
+from bc_agent.model import ReleaseDenorm, Track
+from bc_agent.writer import CrawlResult, write_results
+
+NOW = datetime(2023, 3, 10)
+
+# The API opens "bandcamp.db" in the working directory and refuses to start
+# without it, run the tests in a scratch directory that has one.
+_workdir = tempfile.mkdtemp(prefix="bc_agent-tests-")
+sqlite3.connect(os.path.join(_workdir, "bandcamp.db")).close()
+_cwd = os.getcwd()
+os.chdir(_workdir)
+
+
+def pytest_unconfigure(config):
+    os.chdir(_cwd)
+    shutil.rmtree(_workdir, ignore_errors=True)
+
+
+@pytest.fixture
+def db_name(tmp_path):
+    """Path of an empty database, which the crawler also writes to.
+
+    Tests seed it themselves, usually with a fixture of their module.
+    """
+    name = str(tmp_path / "bandcamp.db")
+    with patch.object(music_data, "DB_NAME", name):
+        yield name
+    close_connections()
+
+
+@pytest.fixture
+def artists(db_name, request):
+    """Add the nicknames in `ARTISTS` of the test module, or "a" and "b".
+
+    They get the ids 1, 2, ... in order.
+    """
+    nicknames = getattr(request.module, "ARTISTS", ("a", "b"))
+    with sqlite_db(db_name) as conn:
+        conn.executemany(
+            "INSERT INTO artists (id, nickname) VALUES (?, ?)",
+            list(enumerate(nicknames, 1)),
+        )
+
+
+def release(
+    link: str,
+    tracks: Union[int, Sequence[str]] = 0,
+    durations: Sequence[Optional[int]] = (),
+    title: Optional[str] = None,
+    days: int = 0,
+) -> ReleaseDenorm:
+    """Build the release at `link`, released `days` after `NOW`.
+
+    `tracks` is the number of tracks or their titles, `durations` the lengths
+    of the first tracks in seconds, None for an unknown one. The release is
+    titled `link` unless `title` is given.
+    """
+    if isinstance(tracks, int):
+        count = max(tracks, len(durations))
+        tracks = [f"{link}-{n}" for n in range(1, count + 1)]
+    durations = list(durations) + [None] * (len(tracks) - len(durations))
+    return ReleaseDenorm(
+        title=link if title is None else title,
+        artist="artist",
+        link=link,
+        release_date=NOW + timedelta(days=days),
+        tracks=[
+            Track(
+                number=n,
+                title=track_title,
+                duration=_duration(seconds),
+                duration_seconds=seconds,
+                link=f"{link}/{n}",
+            )
+            for n, (track_title, seconds) in enumerate(zip(tracks, durations), 1)
+        ],
+    )
+
+
+def _duration(seconds: Optional[int]) -> str:
+    return "" if seconds is None else f"{seconds // 60:02}:{seconds % 60:02}"
+
+
+def write(db_name: str, *results: CrawlResult):
+    """Store `results` like the crawler does."""
+    with sqlite_db(db_name) as conn:
+        write_results(conn, results)
@@ -0,0 +1,26 @@
+import asyncio
+import threading
+
+import pytest
+
+from bc_agent.aio import DBExecutor
+
+
+def test_runs_on_database_threads():
+    executor = DBExecutor(workers=2)
+
+    async def main():
+        names = await asyncio.gather(
+            *(executor.run(lambda: threading.current_thread().name) for _ in range(5))
+        )
+        with pytest.raises(ZeroDivisionError):
+            await executor.run(lambda: 1 / 0)
+        return names
+
+    try:
+        names = asyncio.run(main())
+        # a second event loop gets its own queue slots
+        assert asyncio.run(executor.run(sum, [1, 2])) == 3
+    finally:
+        executor.shutdown()
+    assert all(name.startswith("bc-db") for name in names)
@@ -5,7 +5,7 @@ Now please write a pytest unit test which uses the requests library to test each
 Make sure to test the return codes as well as response contents.
 """
 from fastapi.testclient import TestClient
-from mypackage.api import app
+from bc_agent.api import app
 
 client = TestClient(app)
 
@@ -0,0 +1,69 @@
+import pytest
+
+from bc_agent.artists import (
+    create_artists,
+    delete_artists,
+    list_artists,
+    valid_nickname,
+)
+
+ARTISTS = ("bookashade",)
+
+
+@pytest.mark.parametrize(
+    "nickname, valid",
+    [("bookashade", True), ("the_band-2", True), ("", False), ("a b", False)],
+)
+def test_valid_nickname(nickname, valid):
+    assert valid_nickname(nickname) is valid
+
+
+@pytest.mark.usefixtures("artists")
+def test_create_artists(db_name):
+    results = create_artists(
+        db_name, ["new", "bookashade", "not valid", "new", "other"]
+    )
+
+    assert [r.status for r in results] == [
+        "created",
+        "exists",
+        "invalid",
+        "exists",
+        "created",
+    ]
+    assert results[1].id == 1
+    assert results[0].id == results[3].id
+    assert results[2].id is None
+    assert sorted(a.nickname for a in list_artists(db_name)) == [
+        "bookashade",
+        "new",
+        "other",
+    ]
+
+
+@pytest.mark.usefixtures("artists")
+def test_create_many_artists(db_name):
+    nicknames = [f"artist{i}" for i in range(1200)]
+    results = create_artists(db_name, nicknames)
+
+    assert all(r.status == "created" for r in results)
+    assert len({r.id for r in results}) == 1200
+    assert len(list_artists(db_name)) == 1201
+
+
+@pytest.mark.usefixtures("artists")
+def test_delete_artists(db_name):
+    create_artists(db_name, ["a", "b", "c"])
+    ids = {a.nickname: a.id for a in list_artists(db_name)}
+
+    results = delete_artists(db_name, ids=[ids["a"], 999], nicknames=["b", "a", "x"])
+
+    assert [(r.status, r.nickname) for r in results] == [
+        ("deleted", "a"),
+        ("not_found", None),
+        ("deleted", "b"),
+        ("not_found", "a"),
+        ("not_found", "x"),
+    ]
+    assert results[1].id == 999
+    assert sorted(a.nickname for a in list_artists(db_name)) == ["bookashade", "c"]
@@ -0,0 +1,85 @@
+import pytest
+import requests
+from click.testing import CliRunner
+from fastapi import FastAPI
+from fastapi.testclient import TestClient
+
+from bc_agent import backends
+from bc_agent.api import app
+from bc_agent.backends import BackendError, HTTPBackend, LocalBackend
+from bc_agent.cli import cli
+
+
+@pytest.fixture(params=["local", "http"])
+def backend(request):
+    if request.param == "local":
+        return LocalBackend()
+    return HTTPBackend("http://testserver", session=TestClient(app))
+
+
+def nicknames(backend):
+    return {artist["nickname"] for artist in backend.list_artists()}
+
+
+def test_artist_operations(backend):
+    created = backend.create_artist("backend_single")
+    assert created["nickname"] == "backend_single"
+    with pytest.raises(BackendError, match="already exists"):
+        backend.create_artist("backend_single")
+    with pytest.raises(BackendError):
+        backend.create_artist("not valid")
+    assert "backend_single" in nicknames(backend)
+
+    assert backend.delete_artist(created["id"]) is True
+    assert backend.delete_artist(created["id"]) is False
+    assert "backend_single" not in nicknames(backend)
+
+
+def test_bulk_operations(backend):
+    results = backend.create_artists(["backend_a", "backend_b", "a b"])
+    assert [r["status"] for r in results] == ["created", "created", "invalid"]
+    results = backend.delete_artists(nicknames=["backend_a", "backend_b", "gone"])
+    assert [r["status"] for r in results] == ["deleted", "deleted", "not_found"]
+
+
+def test_cli_uses_the_local_backend(tmp_path):
+    listing = tmp_path / "artists.txt"
+    listing.write_text("cli_a\ncli_b  # comment\n\ncli_a\n")
+    runner = CliRunner()
+
+    result = runner.invoke(cli, ["artist", "import", str(listing)])
+    assert result.exit_code == 0, result.output
+    assert result.output.splitlines()[-1] == "2 created, 1 exists"
+    assert "cli_b" in runner.invoke(cli, ["artist", "list-artists"]).output
+
+    result = runner.invoke(cli, ["artist", "delete", "--name", "cli_b"])
+    assert "deleted successfully" in result.output
+    result = runner.invoke(cli, ["artist", "bulk-delete", str(listing)])
+    assert result.output.splitlines()[-1] == "1 deleted, 2 not_found"
+
+
+def test_missing_api_is_an_error():
+    # e.g. a wrong --api-url prefix, where every route is a 404
+    backend = HTTPBackend("http://testserver", session=TestClient(FastAPI()))
+    with pytest.raises(BackendError, match="404"):
+        backend.list_artists()
+    with pytest.raises(BackendError, match="404"):
+        backend.create_artists(["backend_a"])
+    assert backend.delete_artist(1) is False
+
+
+def test_unreachable_api_is_an_error():
+    class Session:
+        def request(self, method, url, timeout, **kwargs):
+            assert timeout == backends.TIMEOUT
+            raise requests.ConnectTimeout("timed out")
+
+    backend = HTTPBackend("http://testserver", session=Session())
+    with pytest.raises(BackendError, match="Could not reach"):
+        backend.list_artists()
+
+    # nothing listens on the discard port
+    args = ["artist", "--backend", "http", "--api-url", "http://127.0.0.1:9"]
+    result = CliRunner().invoke(cli, args + ["list-artists"])
+    assert result.exit_code == 1
+    assert "Error listing artists" in result.output
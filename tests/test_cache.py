@@ -0,0 +1,121 @@
+from datetime import datetime
+from unittest.mock import patch
+
+import pytest
+from fastapi.testclient import TestClient
+
+from bc_agent import api, cache
+from bc_agent.cache import LRUCache, release_cache
+from bc_agent.db import sqlite_db
+from bc_agent.music_data import get_releases_page
+from bc_agent.writer import CrawlResult
+
+from conftest import NOW, release, write
+
+
+def test_lru_eviction_and_stats():
+    lru = LRUCache(maxsize=2)
+    lru.put("a", 1)
+    lru.put("b", 2)
+    assert lru.get("a") == 1
+    lru.put("c", 3)  # evicts b, a was used more recently
+
+    assert lru.get("b") is None
+    assert lru.get("c") == 3
+    assert lru.stats() == {
+        "size": 2,
+        "maxsize": 2,
+        "weight": 2,
+        "maxweight": None,
+        "hits": 2,
+        "misses": 1,
+        "evictions": 1,
+        "invalidations": 0,
+    }
+
+
+def test_eviction_by_weight():
+    lru = LRUCache(maxsize=10, maxweight=10)
+    lru.put("a", 1, weight=4)
+    lru.put("b", 2, weight=4)
+    lru.put("c", 3, weight=4)  # evicts a
+    assert lru.get("a") is None
+    assert lru.weight == 8
+
+    lru.put("heavy", 4, weight=11)  # heavier than the whole cache
+    assert lru.get("heavy") is None
+    assert lru.get("b") == 2
+
+
+def test_put_after_invalidation_is_dropped():
+    lru = LRUCache(maxsize=2)
+    generation = lru.invalidations
+    lru.clear()
+    lru.put("a", 1, generation)
+    assert lru.get("a") is None
+
+
+@pytest.mark.usefixtures("artists")
+def test_release_pages_are_cached_until_written(db_name):
+    assert get_releases_page("20230101", db_name) == ([], None)
+    hits = release_cache.hits
+    assert get_releases_page("20230101", db_name) == ([], None)
+    assert release_cache.hits == hits + 1
+
+    write(db_name, CrawlResult(1, [release("a")], datetime.now()))
+    releases, _ = get_releases_page("20230101", db_name)
+    assert [r.link for r in releases] == ["a"]
+
+
+@pytest.mark.usefixtures("artists")
+def test_writes_of_other_processes_invalidate(db_name, monkeypatch):
+    monkeypatch.setattr(cache, "RECHECK_INTERVAL", 0)
+    assert get_releases_page("20230101", db_name) == ([], None)
+
+    with sqlite_db(db_name) as conn:
+        # bypasses write_results and its invalidation, like another process
+        conn.execute(
+            "INSERT INTO releases (artist_id, title, release_date, link) VALUES (1, 'b', ?, 'b')",
+            (datetime(2023, 3, 10),),
+        )
+    releases, _ = get_releases_page("20230101", db_name)
+    assert [r.link for r in releases] == ["b"]
+
+
+@pytest.mark.usefixtures("artists")
+def test_paging_walk_keeps_first_page_cached(db_name, monkeypatch):
+    monkeypatch.setattr(release_cache, "maxsize", 2)
+    write(db_name, CrawlResult(1, [release(f"r{i}") for i in range(10)], NOW))
+    first, after = get_releases_page("20230101", db_name, limit=2)
+    while after is not None:
+        _, after = get_releases_page("20230101", db_name, after, limit=2)
+
+    hits = release_cache.hits
+    assert get_releases_page("20230101", db_name, limit=2)[0] == first
+    assert release_cache.hits == hits + 1
+    assert len(release_cache) == 1
+
+
+@pytest.mark.usefixtures("artists")
+def test_etag_is_not_newer_than_the_cached_page(db_name, monkeypatch):
+    monkeypatch.setattr(cache, "RECHECK_INTERVAL", 60)
+    client = TestClient(api.app)
+    params = {"since": "20230101"}
+    with patch.object(api, "DB_NAME", db_name):
+        response = client.get("/api/releases", params=params)
+        assert response.json()["releases"] == []
+
+        with sqlite_db(db_name) as conn:
+            # bypasses write_results and its invalidation, like another process
+            conn.execute(
+                "INSERT INTO releases (artist_id, title, release_date, link) VALUES (1, 'b', ?, 'b')",
+                (datetime(2023, 3, 10),),
+            )
+        response = client.get("/api/releases", params=params)
+        assert [r["link"] for r in response.json()["releases"]] == ["b"]
+
+        etag = response.headers["ETag"]
+        response = client.get(
+            "/api/releases", params=params, headers={"If-None-Match": etag}
+        )
+        assert response.status_code == 304
@@ -0,0 +1,116 @@
+import json
+import sqlite3
+import threading
+import time
+from concurrent.futures import ThreadPoolExecutor
+from pathlib import Path
+from unittest.mock import patch
+
+import pytest
+import requests
+
+from bc_agent import music_data, writer
+from bc_agent.crawl import HostLimiter
+from bc_agent.db import get_meta, sqlite_db
+
+ARTISTS = ["artist1", "artist2", "artist3"]
+RELEASE_PAGE = (
+    Path(__file__).parent / "fixtures" / "release_pages" / "album.html"
+).read_bytes()
+ARTIST_PAGE = b"""
+<html><body><ol class="music-grid">
+  <li><a href="/album/one">One</a></li>
+  <li><a href="/album/two">Two</a></li>
+</ol></body></html>
+"""
+
+
+def _max_parallel(limiter, urls):
+    lock = threading.Lock()
+    state = {"current": 0, "max": 0}
+
+    def request(url):
+        with limiter.slot(url):
+            with lock:
+                state["current"] += 1
+                state["max"] = max(state["max"], state["current"])
+            time.sleep(0.01)
+            with lock:
+                state["current"] -= 1
+
+    with ThreadPoolExecutor(max_workers=len(urls)) as pool:
+        list(pool.map(request, urls))
+    return state["max"]
+
+
+def test_global_limit():
+    limiter = HostLimiter(max_total=3, max_per_host=10)
+    urls = [f"https://artist{i}.bandcamp.com" for i in range(12)]
+    assert _max_parallel(limiter, urls) <= 3
+
+
+def test_per_host_limit():
+    limiter = HostLimiter(max_total=10, max_per_host=2)
+    urls = [f"https://artist.bandcamp.com/album/{i}" for i in range(12)]
+    assert _max_parallel(limiter, urls) <= 2
+
+
+def test_invalid_limits():
+    with pytest.raises(ValueError):
+        HostLimiter(max_total=0)
+
+
+class FakeFetcher:
+    """Serves every artist two albums, the second of `artist2` is gone."""
+
+    def __init__(self, pool_size, limiter):
+        self.limiter = limiter
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, *exc_info):
+        pass
+
+    def get(self, url, headers=None):
+        with self.limiter.slot(url):
+            response = requests.Response()
+            response.status_code = 200
+            if url == "https://artist2.bandcamp.com/album/two":
+                response.status_code = 404
+                raise requests.HTTPError(response=response)
+            response._content = RELEASE_PAGE if "/album/" in url else ARTIST_PAGE
+            return response
+
+
+@pytest.mark.usefixtures("artists")
+def test_concurrent_update_skips_failed_release(db_name):
+    with patch.object(music_data, "Fetcher", FakeFetcher):
+        summary = music_data.update_releases_db(concurrency=4, force=True)
+
+    assert summary["artists"] == 3
+    assert summary["failed_artists"] == 0
+    assert summary["new_releases"] == 5
+    with sqlite_db(db_name) as conn:
+        links = {row[0] for row in conn.execute("SELECT link FROM releases")}
+        tracks = conn.execute("SELECT COUNT(*) FROM tracks").fetchone()[0]
+        stored = json.loads(get_meta(conn, music_data.LAST_UPDATE))
+    assert links == {
+        f"https://{nickname}.bandcamp.com/album/{name}"
+        for nickname in ARTISTS
+        for name in ("one", "two")
+    } - {"https://artist2.bandcamp.com/album/two"}
+    assert tracks == 5 * 12
+    assert stored == summary
+
+
+@pytest.mark.usefixtures("artists")
+def test_unstored_results_count_as_failed(db_name):
+    error = sqlite3.OperationalError("database is locked")
+    with patch.object(music_data, "Fetcher", FakeFetcher), patch.object(
+        writer, "write_results", side_effect=error
+    ):
+        summary = music_data.update_releases_db(concurrency=4, force=True)
+
+    assert summary["failed_artists"] == 3
+    assert summary["new_releases"] == 0
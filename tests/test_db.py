@@ -0,0 +1,176 @@
+import sqlite3
+import threading
+
+import pytest
+
+from bc_agent import db
+from bc_agent.db import (
+    change_counter,
+    close_connections,
+    get_connection,
+    parse_duration,
+    schema_version,
+    sqlite_db,
+)
+
+
+def test_rejects_non_sqlite_files():
+    with pytest.raises(ValueError):
+        with sqlite_db("bandcamp.sqlite"):
+            pass
+
+
+def test_schema_is_migrated_once(db_name, monkeypatch):
+    calls = []
+    monkeypatch.setattr(db, "MIGRATIONS", db.MIGRATIONS + [calls.append])
+    for _ in range(3):
+        with sqlite_db(db_name) as conn:
+            conn.execute("SELECT id, nickname, etag FROM artists").fetchall()
+
+    assert len(calls) == 1
+    assert schema_version(conn) == len(db.MIGRATIONS)
+
+
+def test_connection_is_reused_per_thread(db_name):
+    with sqlite_db(db_name) as first:
+        pass
+    with sqlite_db(db_name) as second:
+        pass
+    assert first is second
+
+    other = []
+    thread = threading.Thread(target=lambda: other.append(get_connection(db_name)))
+    thread.start()
+    thread.join()
+    assert other[0] is not first
+
+
+def test_pragmas(db_name):
+    with sqlite_db(db_name) as conn:
+        assert conn.execute("PRAGMA journal_mode").fetchone()[0] == "wal"
+        assert conn.execute("PRAGMA synchronous").fetchone()[0] == 1  # NORMAL
+
+
+def test_rollback_on_error(db_name):
+    with pytest.raises(RuntimeError):
+        with sqlite_db(db_name) as conn:
+            conn.execute("INSERT INTO artists (nickname) VALUES ('artist')")
+            raise RuntimeError
+
+    with sqlite_db(db_name) as conn:
+        assert conn.execute("SELECT COUNT(*) FROM artists").fetchone()[0] == 0
+
+
+def test_closed_connections_are_replaced(db_name):
+    with sqlite_db(db_name) as conn:
+        pass
+    close_connections()
+    with sqlite_db(db_name) as new_conn:
+        assert new_conn is not conn
+        new_conn.execute("SELECT 1")
+
+
+def test_index_migration_merges_duplicates(db_name, monkeypatch):
+    migrations = db.MIGRATIONS
+    monkeypatch.setattr(db, "MIGRATIONS", migrations[:1])
+    with sqlite_db(db_name) as conn:
+        conn.executemany(
+            "INSERT INTO artists (id, nickname) VALUES (?, ?)",
+            [(1, "artist"), (2, "artist"), (3, "other")],
+        )
+        conn.executemany(
+            "INSERT INTO releases (id, artist_id, link) VALUES (?, ?, ?)",
+            [(1, 1, "a"), (2, 2, "a"), (3, 2, "b"), (4, 3, "c")],
+        )
+        conn.executemany(
+            "INSERT INTO tracks (release_id, number) VALUES (?, ?)",
+            [(1, 1), (2, 1), (3, 1)],
+        )
+    close_connections()
+    monkeypatch.setattr(db, "MIGRATIONS", migrations)
+
+    with sqlite_db(db_name) as conn:
+        assert conn.execute("SELECT id FROM artists ORDER BY id").fetchall() == [
+            (1,),
+            (3,),
+        ]
+        assert conn.execute(
+            "SELECT id, artist_id FROM releases ORDER BY id"
+        ).fetchall() == [(1, 1), (3, 1), (4, 3)]
+        assert conn.execute(
+            "SELECT release_id FROM tracks ORDER BY release_id"
+        ).fetchall() == [(1,), (3,)]
+
+        with pytest.raises(sqlite3.IntegrityError):
+            conn.execute("INSERT INTO artists (nickname) VALUES ('other')")
+        plan = conn.execute(
+            "EXPLAIN QUERY PLAN SELECT * FROM releases WHERE release_date >= ?",
+            ("2023-01-01",),
+        ).fetchall()
+        assert "releases_release_date" in plan[0][-1]
+
+
+def test_parse_duration():
+    assert parse_duration("04:40") == 280
+    assert parse_duration("1:02:03") == 3723
+    for value in (None, "", "4", "4:x0", "-1:30", "1:2:3:4"):
+        assert parse_duration(value) is None
+
+
+def test_duration_migration_backfills_seconds(db_name, monkeypatch):
+    migrations = db.MIGRATIONS
+    monkeypatch.setattr(
+        db, "MIGRATIONS", migrations[: migrations.index(db._add_duration_seconds)]
+    )
+    with sqlite_db(db_name) as conn:
+        conn.executemany(
+            "INSERT INTO tracks (release_id, number, duration) VALUES (1, ?, ?)",
+            [(1, "04:40"), (2, "1:00:01"), (3, None)],
+        )
+    close_connections()
+    monkeypatch.setattr(db, "MIGRATIONS", migrations)
+
+    with sqlite_db(db_name) as conn:
+        assert conn.execute(
+            "SELECT duration_seconds FROM tracks ORDER BY number"
+        ).fetchall() == [(280,), (3601,), (None,)]
+
+
+def test_orphaned_releases_are_dropped(db_name, monkeypatch):
+    migrations = db.MIGRATIONS
+    monkeypatch.setattr(db, "MIGRATIONS", migrations[: migrations.index(db._add_stats)])
+    with sqlite_db(db_name) as conn:
+        conn.execute("INSERT INTO artists (id, nickname) VALUES (1, 'artist')")
+        conn.execute("INSERT INTO artists (id, nickname) VALUES (2, 'gone')")
+        conn.executemany(
+            "INSERT INTO releases (id, artist_id, link) VALUES (?, ?, ?)",
+            [(1, 1, "a"), (2, 2, "b")],
+        )
+        conn.executemany(
+            "INSERT INTO tracks (release_id, number) VALUES (?, 1)", [(1,), (2,)]
+        )
+        # deleted the way older versions did, leaving its release behind
+        conn.execute("DELETE FROM artists WHERE id = 2")
+    close_connections()
+    monkeypatch.setattr(db, "MIGRATIONS", migrations)
+
+    with sqlite_db(db_name) as conn:
+        assert conn.execute("SELECT link FROM releases").fetchall() == [("a",)]
+        assert conn.execute("SELECT release_id FROM tracks").fetchall() == [(1,)]
+        assert conn.execute(
+            "SELECT releases, tracks FROM catalogue_stats"
+        ).fetchone() == (1, 1)
+
+
+def test_change_counter(db_name):
+    with sqlite_db(db_name) as conn:
+        start = change_counter(conn)
+        conn.execute("INSERT INTO artists (id, nickname) VALUES (1, 'artist')")
+        conn.execute("UPDATE artists SET last_checked = 1 WHERE id = 1")
+        assert change_counter(conn) == start
+
+        conn.execute("INSERT INTO releases (artist_id, link) VALUES (1, 'a')")
+        conn.execute("UPDATE artists SET nickname = 'renamed' WHERE id = 1")
+        conn.execute("DELETE FROM releases")
+        conn.execute("DELETE FROM artists")
+        assert change_counter(conn) == start + 4
@@ -0,0 +1,126 @@
+import csv
+import io
+import json
+from datetime import datetime, timedelta
+from unittest.mock import patch
+
+import pytest
+from fastapi.testclient import TestClient
+
+from bc_agent import api
+from bc_agent.db import sqlite_db
+from bc_agent.export import export, get_encoder
+
+START = datetime(2023, 1, 1)
+pytestmark = pytest.mark.usefixtures("catalogue")
+
+
+@pytest.fixture
+def catalogue(db_name):
+    with sqlite_db(db_name) as conn:
+        conn.execute(
+            "INSERT INTO artists (id, nickname, last_checked) VALUES (1, 'artist', ?)",
+            (START,),
+        )
+        conn.executemany(
+            "INSERT INTO releases (id, artist_id, title, release_date, link) VALUES (?, 1, ?, ?, ?)",
+            [
+                (i, f"release {i}", START + timedelta(days=i), f"link{i}")
+                for i in range(1, 6)
+            ],
+        )
+        conn.executemany(
+            "INSERT INTO tracks (release_id, number, title, duration, duration_seconds, link) VALUES (?, ?, ?, '3:00', 180, ?)",
+            [
+                (i, n, f"track {i}.{n}", f"link{i}.{n}")
+                for i in range(1, 6)
+                for n in (1, 2)
+            ],
+        )
+
+
+def ndjson(db_name, table, **kwargs):
+    out = io.BytesIO()
+    rows = export(db_name, table, "ndjson", out, **kwargs)
+    lines = [json.loads(line) for line in out.getvalue().splitlines()]
+    assert len(lines) == rows
+    return lines
+
+
+def test_export_ndjson(db_name):
+    [artist] = ndjson(db_name, "artists")
+    assert artist == {"id": 1, "nickname": "artist", "last_checked": str(START)}
+
+    tracks = ndjson(db_name, "tracks", size=3)
+    assert [t["title"] for t in tracks] == [
+        f"track {i}.{n}" for i in range(1, 6) for n in (1, 2)
+    ]
+    assert tracks[0] == {
+        "id": 1,
+        "release_id": 1,
+        "number": 1,
+        "title": "track 1.1",
+        "duration": "3:00",
+        "link": "link1.1",
+        "duration_seconds": 180,
+    }
+
+
+def test_export_csv(db_name):
+    out = io.BytesIO()
+    assert export(db_name, "releases", "csv", out, size=2) == 5
+    rows = list(csv.reader(io.StringIO(out.getvalue().decode())))
+    assert rows[0] == ["id", "artist_id", "title", "release_date", "link"]
+    assert [row[2] for row in rows[1:]] == [f"release {i}" for i in range(1, 6)]
+
+
+def test_incremental_exports(db_name):
+    releases = ndjson(db_name, "releases", since_id=3)
+    assert [r["id"] for r in releases] == [4, 5]
+    tracks = ndjson(db_name, "tracks", since_id=3, size=1)
+    assert [t["release_id"] for t in tracks] == [4, 4, 5, 5]
+
+    since = START + timedelta(days=4)
+    assert [r["id"] for r in ndjson(db_name, "releases", since=since)] == [4, 5]
+    assert len(ndjson(db_name, "tracks", since=since)) == 4
+    assert ndjson(db_name, "artists", since=since) == []
+    assert ndjson(db_name, "releases", since_id=5) == []
+
+
+def test_invalid_exports(db_name):
+    with pytest.raises(ValueError):
+        get_encoder("xml", "releases")
+    with pytest.raises(ValueError):
+        get_encoder("csv", "feeds")
+    with pytest.raises(ValueError):
+        export(db_name, "artists", "csv", io.BytesIO(), since_id=1)
+
+
+def test_export_parquet(db_name):
+    pq = pytest.importorskip("pyarrow.parquet")
+    out = io.BytesIO()
+    assert export(db_name, "releases", "parquet", out, size=2) == 5
+    table = pq.read_table(io.BytesIO(out.getvalue()))
+    assert table.column("title").to_pylist() == [f"release {i}" for i in range(1, 6)]
+    assert table.column("release_date").to_pylist()[0] == START + timedelta(days=1)
+
+
+def test_export_route(db_name):
+    client = TestClient(api.app)
+    with patch.object(api, "DB_NAME", db_name):
+        response = client.get("/export/tracks", params={"since_id": 4})
+        assert response.status_code == 200
+        assert response.headers["content-type"] == "application/x-ndjson"
+        lines = [json.loads(line) for line in response.text.splitlines()]
+        assert [t["title"] for t in lines] == ["track 5.1", "track 5.2"]
+
+        response = client.get("/export/artists", params={"format": "csv"})
+        assert response.text.splitlines() == [
+            "id,nickname,last_checked",
+            f"1,artist,{START}",
+        ]
+
+        assert client.get("/export/feeds").status_code == 404
+        assert client.get("/export/artists?format=xml").status_code == 422
+        assert client.get("/export/artists?since_id=1").status_code == 422
+        assert client.get("/export/releases?since=2023").status_code == 422
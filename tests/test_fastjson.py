@@ -0,0 +1,66 @@
+import json
+from datetime import datetime
+
+import pytest
+
+from bc_agent import fastjson
+from bc_agent.fastjson import FastJSONResponse, as_dicts, dumps
+from bc_agent.model import (
+    Artist,
+    ArtistRow,
+    ReleaseDenorm,
+    ReleaseRow,
+    Track,
+    TrackRow,
+)
+
+RELEASES = [
+    ReleaseRow("Lösung", "bookashade", "https://a/1", datetime(2023, 1, 5, 12, 30)),
+    ReleaseRow("second", "bookashade", "https://a/2", None),
+]
+ARTISTS = [
+    ArtistRow("bookashade", 1, datetime(2023, 1, 5, 12, 30, 15, 123456)),
+    ArtistRow("new", 2, None),
+]
+
+
+@pytest.fixture(params=["orjson", "json"])
+def encoder(request, monkeypatch):
+    if request.param == "json":
+        monkeypatch.setattr(fastjson, "orjson", None)
+    elif fastjson.orjson is None:
+        pytest.skip("orjson is not installed")
+
+
+def test_records_have_the_model_fields():
+    assert ArtistRow._fields == tuple(Artist.__fields__)
+    assert ReleaseRow._fields == tuple(ReleaseDenorm.__fields__)
+    assert TrackRow._fields == tuple(Track.__fields__)
+
+
+@pytest.mark.usefixtures("encoder")
+@pytest.mark.parametrize(
+    "model, records", [(ReleaseDenorm, RELEASES), (Artist, ARTISTS)]
+)
+def test_same_json_as_pydantic(model, records):
+    expected = [json.loads(model(**r._asdict()).json()) for r in records]
+    assert json.loads(dumps(as_dicts(records))) == expected
+
+
+@pytest.mark.usefixtures("encoder")
+def test_response():
+    response = FastJSONResponse({"releases": as_dicts(RELEASES[:1])})
+    assert response.media_type == "application/json"
+    assert json.loads(response.body)["releases"][0] == {
+        "title": "Lösung",
+        "artist": "bookashade",
+        "link": "https://a/1",
+        "release_date": "2023-01-05T12:30:00",
+        "tracks": None,
+    }
+
+
+@pytest.mark.usefixtures("encoder")
+def test_unsupported_type():
+    with pytest.raises(TypeError):
+        dumps({"value": object()})
@@ -0,0 +1,96 @@
+from xml.etree import ElementTree
+
+import pytest
+
+from bc_agent import feed
+from bc_agent.artists import delete_artist
+from bc_agent.db import sqlite_db
+from bc_agent.feed import FEED_SIZE, get_feed
+from bc_agent.writer import CrawlResult
+
+from conftest import NOW, release, write
+
+ARTISTS = ("bookashade", "other")
+pytestmark = pytest.mark.usefixtures("artists")
+
+
+def titles(body):
+    channel = ElementTree.fromstring(body).find("channel")
+    return [item.findtext("title") for item in channel.findall("item")]
+
+
+def test_feed_is_built_from_existing_releases(db_name):
+    with sqlite_db(db_name) as conn:
+        conn.execute(
+            "INSERT INTO releases (id, artist_id, title, release_date, link) "
+            "VALUES (1, 1, 'Old', ?, 'https://x/old')",
+            (NOW,),
+        )
+    with sqlite_db(db_name) as conn:
+        assert conn.execute("SELECT COUNT(*) FROM feeds").fetchone()[0] == 0
+        assert titles(get_feed(conn).body) == ["bookashade - Old"]
+        assert get_feed(conn, 2) is not None
+        assert get_feed(conn, 3) is None
+
+
+def test_new_releases_are_merged_in_order(db_name):
+    write(db_name, CrawlResult(1, [release("a", title="Title & a", days=-5)], NOW))
+    with sqlite_db(db_name) as conn:
+        first = get_feed(conn)
+
+    write(
+        db_name,
+        CrawlResult(1, [release("b", title="Title & b", days=-1)], NOW),
+        CrawlResult(2, [release("c", title="Title & c", days=-3)], NOW),
+    )
+    with sqlite_db(db_name) as conn:
+        second = get_feed(conn)
+        artist = get_feed(conn, 1)
+
+    assert titles(second.body) == [
+        "bookashade - Title & b",
+        "other - Title & c",
+        "bookashade - Title & a",
+    ]
+    assert titles(artist.body) == ["bookashade - Title & b", "bookashade - Title & a"]
+    assert second.etag != first.etag
+
+
+def test_feed_keeps_newest_releases(db_name):
+    write(
+        db_name,
+        CrawlResult(
+            1,
+            [release(str(i), title=f"Title & {i}", days=-i) for i in range(FEED_SIZE)],
+            NOW,
+        ),
+    )
+    with sqlite_db(db_name) as conn:
+        before = get_feed(conn)
+    # Too old to show up, the stored feed stays as it is.
+    write(
+        db_name, CrawlResult(1, [release("old", title="Title & old", days=-1000)], NOW)
+    )
+    with sqlite_db(db_name) as conn:
+        assert get_feed(conn) == before
+    write(db_name, CrawlResult(1, [release("new", title="Title & new", days=1)], NOW))
+    with sqlite_db(db_name) as conn:
+        items = titles(get_feed(conn).body)
+
+    assert len(items) == FEED_SIZE
+    assert items[0] == "bookashade - Title & new"
+    assert items[-1] == f"bookashade - Title & {FEED_SIZE - 2}"
+
+
+def test_deleting_an_artist_drops_its_feeds(db_name):
+    write(
+        db_name,
+        CrawlResult(1, [release("a", title="Title & a")], NOW),
+        CrawlResult(2, [release("b", title="Title & b")], NOW),
+    )
+    assert delete_artist(db_name, 1)
+
+    with sqlite_db(db_name) as conn:
+        names = {row[0] for row in conn.execute("SELECT name FROM feeds")}
+        assert names == {feed.feed_name(2)}
+        assert titles(get_feed(conn).body) == ["other - Title & b"]
@@ -0,0 +1,68 @@
+import io
+from unittest.mock import patch
+
+import pytest
+import requests
+
+from bc_agent.fetch import Fetcher, parse_retry_after
+
+
+def make_response(status, headers=None):
+    response = requests.Response()
+    response.status_code = status
+    response.headers.update(headers or {})
+    response.url = "https://artist.bandcamp.com"
+    response.raw = io.BytesIO(b"")
+    return response
+
+
+@pytest.fixture
+def sleep():
+    with patch("bc_agent.fetch.time.sleep") as mock:
+        yield mock
+
+
+def test_parse_retry_after():
+    assert parse_retry_after("120") == 120.0
+    assert parse_retry_after("Wed, 21 Oct 2015 07:28:00 GMT") == 0.0
+    assert parse_retry_after("soon") is None
+    assert parse_retry_after(None) is None
+
+
+def test_retries_honour_retry_after(sleep):
+    fetcher = Fetcher(max_retries=2)
+    responses = [make_response(429, {"Retry-After": "7"}), make_response(200)]
+    with patch.object(fetcher.session, "get", side_effect=responses) as get:
+        response = fetcher.get("https://artist.bandcamp.com")
+
+    assert response.status_code == 200
+    assert get.call_count == 2
+    sleep.assert_called_once_with(7.0)
+    assert get.call_args.kwargs["timeout"] == fetcher.timeout
+
+
+def test_gives_up_after_max_retries(sleep):
+    fetcher = Fetcher(max_retries=2, backoff_factor=1, max_backoff=3)
+    responses = [make_response(503) for _ in range(3)]
+    with patch.object(fetcher.session, "get", side_effect=responses):
+        with pytest.raises(requests.HTTPError):
+            fetcher.get("https://artist.bandcamp.com")
+
+    assert sleep.call_count == 2
+    assert all(call.args[0] <= 3 for call in sleep.call_args_list)
+
+
+def test_client_errors_are_not_retried(sleep):
+    fetcher = Fetcher()
+    with patch.object(fetcher.session, "get", return_value=make_response(404)):
+        with pytest.raises(requests.HTTPError):
+            fetcher.get("https://artist.bandcamp.com")
+
+    sleep.assert_not_called()
+
+
+def test_connection_errors_are_retried(sleep):
+    fetcher = Fetcher(max_retries=1)
+    side_effect = [requests.ConnectionError("reset"), make_response(200)]
+    with patch.object(fetcher.session, "get", side_effect=side_effect):
+        assert fetcher.get("https://artist.bandcamp.com").status_code == 200
@@ -0,0 +1,82 @@
+from unittest.mock import MagicMock, patch
+
+import requests
+
+from bc_agent import music_data
+from bc_agent.db import sqlite_db
+
+ARTIST_PAGE = b"""
+<html><body>
+<ol class="music-grid">
+  <li class="music-grid-item"><a href="/album/first">First</a></li>
+</ol>
+</body></html>
+"""
+
+
+def make_response(status, content=b"", headers=None):
+    response = requests.Response()
+    response.status_code = status
+    response._content = content
+    response.headers.update(headers or {})
+    return response
+
+
+def artist_state(db_name, nickname):
+    with sqlite_db(db_name) as conn:
+        return conn.execute(
+            "SELECT etag, last_modified, grid_hash, last_checked FROM artists WHERE nickname = ?",
+            (nickname,),
+        ).fetchone()
+
+
+def test_not_modified_page_is_skipped(db_name):
+    with sqlite_db(db_name) as conn:
+        conn.execute(
+            "INSERT INTO artists (nickname, etag, last_modified) VALUES (?, ?, ?)",
+            ("artist", '"abc"', "Wed, 21 Oct 2015 07:28:00 GMT"),
+        )
+    fetcher = MagicMock()
+    fetcher.get.return_value = make_response(304)
+
+    assert music_data.get_new_releases("artist", fetcher=fetcher) == []
+
+    headers = fetcher.get.call_args.kwargs["headers"]
+    assert headers["If-None-Match"] == '"abc"'
+    assert headers["If-Modified-Since"] == "Wed, 21 Oct 2015 07:28:00 GMT"
+    etag, last_modified, _, last_checked = artist_state(db_name, "artist")
+    assert etag == '"abc"'
+    assert last_checked is not None
+
+
+def test_unchanged_music_grid_is_not_extracted(db_name):
+    with sqlite_db(db_name) as conn:
+        conn.execute(
+            "INSERT INTO artists (nickname, grid_hash) VALUES (?, ?)",
+            (
+                "artist",
+                music_data.grid_fingerprint(
+                    ["https://artist.bandcamp.com/album/first"]
+                ),
+            ),
+        )
+    fetcher = MagicMock()
+    fetcher.get.return_value = make_response(200, ARTIST_PAGE, {"ETag": '"new"'})
+
+    with patch.object(music_data, "extract_title_metadata") as extract:
+        assert music_data.get_new_releases("artist", fetcher=fetcher) == []
+
+    extract.assert_not_called()
+    assert artist_state(db_name, "artist")[0] == '"new"'
+
+
+def test_failed_release_forgets_validators(db_name):
+    fetcher = MagicMock()
+    fetcher.get.return_value = make_response(200, ARTIST_PAGE, {"ETag": '"new"'})
+
+    with patch.object(music_data, "extract_title_metadata", side_effect=ValueError):
+        assert music_data.get_new_releases("artist", fetcher=fetcher) == []
+
+    etag, last_modified, grid_hash, last_checked = artist_state(db_name, "artist")
+    assert (etag, last_modified, grid_hash) == (None, None, None)
+    assert last_checked is not None
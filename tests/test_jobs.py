@@ -0,0 +1,136 @@
+import sqlite3
+import threading
+from unittest.mock import patch
+
+import pytest
+
+from bc_agent import jobs, music_data, writer
+from bc_agent.artists import delete_artist
+from bc_agent.db import close_connections
+from bc_agent.writer import CrawlResult
+
+from conftest import NOW
+
+ARTISTS = [f"artist{i}" for i in range(1, 26)]
+pytestmark = pytest.mark.usefixtures("artists")
+
+
+def test_claim_complete(db_name):
+    assert jobs.start_cycle(db_name, ARTISTS[:5] + ["unknown"]) == 5
+    # a cycle is running
+    assert jobs.start_cycle(db_name, ARTISTS) == 0
+
+    first = jobs.claim(db_name, "a", batch_size=3)
+    second = jobs.claim(db_name, "b", batch_size=3)
+    assert [job.nickname for job in first] == ARTISTS[:3]
+    assert [job.nickname for job in second] == ARTISTS[3:5]
+    assert jobs.claim(db_name, "c") == []
+
+    ids = [job.artist_id for job in first]
+    assert jobs.renew(db_name, "a", ids) == 3
+    # only the holder of the lease can complete the jobs
+    assert jobs.complete(db_name, "b", ids) == 0
+    assert jobs.complete(db_name, "a", ids) == 3
+    assert jobs.open_jobs(db_name) == 2
+
+    jobs.complete(db_name, "b", [job.artist_id for job in second])
+    assert jobs.open_jobs(db_name) == 0
+    assert jobs.start_cycle(db_name, ARTISTS[:2]) == 2
+    assert jobs.open_jobs(db_name) == 2
+
+
+def test_expired_and_released_leases(db_name):
+    jobs.start_cycle(db_name, ARTISTS[:4])
+    stopped = jobs.claim(db_name, "b", batch_size=2)
+    crashed = jobs.claim(db_name, "a", batch_size=2, lease=-1)
+    jobs.release(db_name, "b", [job.artist_id for job in stopped])
+
+    reclaimed = jobs.claim(db_name, "c")
+    assert reclaimed == stopped + crashed
+    # the crashed worker can no longer renew or complete
+    assert jobs.renew(db_name, "a", [job.artist_id for job in crashed]) == 0
+
+
+def test_jobs_are_given_up(db_name):
+    jobs.start_cycle(db_name, ARTISTS[:1])
+    for _ in range(jobs.MAX_ATTEMPTS):
+        assert len(jobs.claim(db_name, "a", lease=-1)) == 1
+    assert jobs.claim(db_name, "a") == []
+    assert jobs.open_jobs(db_name) == 0
+
+
+def test_last_attempt_keeps_the_cycle_open(db_name):
+    jobs.start_cycle(db_name, ARTISTS[:1])
+    for _ in range(jobs.MAX_ATTEMPTS - 1):
+        jobs.claim(db_name, "w1", lease=-1)
+    [job] = jobs.claim(db_name, "w2")
+
+    # w2 still holds the lease, nobody may start a cycle and check it again
+    assert jobs.open_jobs(db_name) == 1
+    assert jobs.start_cycle(db_name, ARTISTS[:1]) == 0
+    assert jobs.claim(db_name, "w3") == []
+    assert jobs.complete(db_name, "w2", [job.artist_id]) == 1
+    assert jobs.open_jobs(db_name) == 0
+
+
+def test_deleted_artists_leave_the_queue(db_name):
+    jobs.start_cycle(db_name, ARTISTS[:2])
+    [job] = jobs.claim(db_name, "a", batch_size=1)
+    delete_artist(db_name, job.artist_id)
+    assert jobs.open_jobs(db_name) == 1
+    assert [j.nickname for j in jobs.claim(db_name, "b")] == ARTISTS[1:2]
+
+
+def test_unstored_results_are_checked_again(db_name):
+    stored = []
+    writes = iter([sqlite3.OperationalError("database is locked")])
+
+    def update_artists(nicknames, concurrency, per_host, writer):
+        for nickname in nicknames:
+            writer.submit(CrawlResult(ARTISTS.index(nickname) + 1, [], NOW))
+        return 0
+
+    def write_results(conn, results):
+        error = next(writes, None)
+        if error is not None:
+            raise error
+        stored.extend(result.artist_id for result in results)
+        return []
+
+    with patch.object(music_data, "update_artists", update_artists), patch.object(
+        writer, "write_results", write_results
+    ):
+        summary = jobs.run_worker(worker="w", batch_size=5, force=True)
+
+    # the first batch failed to be written, was released and checked again
+    assert summary["failed_artists"] == 5
+    assert summary["artists"] == len(ARTISTS) + 5
+    assert sorted(stored) == list(range(1, len(ARTISTS) + 1))
+    assert jobs.open_jobs(db_name) == 0
+
+
+def test_workers_share_a_cycle(db_name):
+    checked = []
+    lock = threading.Lock()
+
+    def update_artists(nicknames, concurrency, per_host, writer):
+        with lock:
+            checked.extend(nicknames)
+        return 0
+
+    summaries = []
+
+    def work(name):
+        summaries.append(jobs.run_worker(worker=name, batch_size=3, force=True))
+        close_connections()
+
+    with patch.object(music_data, "update_artists", update_artists):
+        workers = [threading.Thread(target=work, args=(f"w{i}",)) for i in range(3)]
+        for thread in workers:
+            thread.start()
+        for thread in workers:
+            thread.join()
+
+    assert sorted(checked) == sorted(ARTISTS)
+    assert sum(summary["artists"] for summary in summaries) == len(ARTISTS)
+    assert jobs.open_jobs(db_name) == 0
@@ -0,0 +1,79 @@
+import pytest
+
+from bc_agent.metrics import (
+    Counter,
+    Histogram,
+    _metrics,
+    difference,
+    render_summary,
+    snapshot,
+)
+
+
+@pytest.fixture
+def registered():
+    count = len(_metrics)
+    yield
+    del _metrics[count:]
+
+
+def test_counter(registered):
+    counter = Counter("test_pages_total", "Pages.", ["page"])
+    counter.inc(page="artist")
+    counter.inc(2, page='a"b')
+
+    assert counter.render() == (
+        "# HELP test_pages_total Pages.\n"
+        "# TYPE test_pages_total counter\n"
+        'test_pages_total{page="a\\"b"} 2\n'
+        'test_pages_total{page="artist"} 1\n'
+    )
+    with pytest.raises(ValueError):
+        counter.inc(stage="fetch")
+
+
+def test_histogram(registered):
+    histogram = Histogram("test_seconds", "Time.", buckets=[0.1, 1])
+    histogram.observe(0.05)
+    histogram.observe(0.5)
+    histogram.observe(5)
+    with pytest.raises(RuntimeError):
+        with histogram.time():
+            raise RuntimeError
+
+    lines = histogram.render().splitlines()
+    assert lines[2:5] == [
+        'test_seconds_bucket{le="0.1"} 2',
+        'test_seconds_bucket{le="1"} 3',
+        'test_seconds_bucket{le="+Inf"} 4',
+    ]
+    assert lines[-1] == "test_seconds_count 4"
+
+
+def test_snapshot_difference(registered):
+    counter = Counter("test_rows_total", "Rows.")
+    histogram = Histogram("test_write_seconds", "Time.")
+    counter.inc()
+    before = snapshot()
+    counter.inc(3)
+    histogram.observe(0.25)
+
+    assert difference(before, snapshot()) == {
+        "test_rows_total": 3,
+        "test_write_seconds_sum": 0.25,
+        "test_write_seconds_count": 1,
+    }
+
+
+def test_render_summary():
+    summary = {
+        "finished_at": "2023-03-10T00:00:00",
+        "duration_seconds": 1.5,
+        "artists": 10,
+        "failed_artists": 1,
+        "new_releases": 3,
+    }
+    rendered = render_summary(summary)
+    assert "bc_last_update_duration_seconds 1.5\n" in rendered
+    assert "# TYPE bc_last_update_new_releases gauge\n" in rendered
+    assert "bc_last_update_failed_artists 1\n" in rendered
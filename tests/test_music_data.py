@@ -1,12 +1,12 @@
 import pytest
 from unittest.mock import MagicMock, patch
 
-from mypackage.music_data import get_artist_nicknames_from_db
+from bc_agent.music_data import get_artist_nicknames_from_db
 
 
 @pytest.fixture
 def mock_sqlite_db():
-    with patch("mypackage.music_data.sqlite_db") as mock:
+    with patch("bc_agent.music_data.sqlite_db") as mock:
         yield mock
 
 
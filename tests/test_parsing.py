@@ -0,0 +1,49 @@
+from datetime import datetime
+from pathlib import Path
+from unittest.mock import patch
+
+import pytest
+
+from bc_agent.parsing import FAST, FULL, parse_release_page
+
+FIXTURES = Path(__file__).parent / "fixtures" / "release_pages"
+RELEASE_URL = "https://bookashade.bandcamp.com/album/twisted-cadence"
+
+
+@pytest.mark.parametrize("fixture", sorted(FIXTURES.glob("*.html")), ids=str)
+def test_engines_are_identical(fixture):
+    content = fixture.read_bytes()
+    fast = parse_release_page(content, RELEASE_URL, FAST)
+    full = parse_release_page(content, RELEASE_URL, FULL)
+    assert fast == full
+    assert fast.tracks
+
+
+def test_single():
+    content = (FIXTURES / "single.html").read_bytes()
+    release = parse_release_page(content, RELEASE_URL)
+
+    assert release.title == "Twisted Cadence [Single]"
+    assert release.artist == "Booka Shade"
+    assert release.release_date == datetime(2023, 3, 10)
+    assert len(release.tracks) == 1
+    track = release.tracks[0]
+    assert (track.number, track.title, track.duration, track.duration_seconds) == (
+        1,
+        "Twisted Cadence",
+        "04:40",
+        280,
+    )
+    assert track.link == RELEASE_URL + "/track/twisted-cadence"
+
+
+def test_fast_engine_falls_back_to_full_parser():
+    content = (FIXTURES / "single.html").read_bytes()
+    with patch("bc_agent.parsing._parse_fast", side_effect=AttributeError):
+        release = parse_release_page(content, RELEASE_URL, FAST)
+    assert release == parse_release_page(content, RELEASE_URL, FULL)
+
+
+def test_unknown_engine():
+    with pytest.raises(ValueError):
+        parse_release_page("", RELEASE_URL, "regex")
@@ -0,0 +1,53 @@
+import pstats
+from pathlib import Path
+from unittest.mock import MagicMock, patch
+
+import pytest
+import requests
+
+from bc_agent import profiling
+
+RELEASE_PAGE = (
+    Path(__file__).parent / "fixtures" / "release_pages" / "album.html"
+).read_bytes()
+ARTIST_PAGE = b"""
+<html><body><ol class="music-grid">
+  <li><a href="/album/good">Good</a></li>
+  <li><a href="/album/broken">Broken</a></li>
+</ol></body></html>
+"""
+
+
+def fake_get(url, headers=None):
+    response = requests.Response()
+    response.status_code = 200
+    if url.endswith("/broken"):
+        response.status_code = 404
+        raise requests.HTTPError(response=response)
+    response._content = RELEASE_PAGE if "/album/" in url else ARTIST_PAGE
+    return response
+
+
+ARTISTS = ("artist",)
+pytestmark = pytest.mark.usefixtures("artists")
+
+
+def test_profile_update(db_name, tmp_path):
+    fetcher = MagicMock()
+    fetcher.__enter__.return_value = fetcher
+    fetcher.get.side_effect = fake_get
+    output = str(tmp_path / "update.prof")
+
+    with patch.object(profiling, "Fetcher", return_value=fetcher):
+        artists, pages = profiling.profile_update(output, force=True)
+
+    [artist] = artists
+    assert artist.name == "artist" and artist.ok
+    assert artist.pages == 3
+    assert artist.tracks == 12
+    assert 0 < artist.network + artist.parse + artist.db <= artist.wall
+    assert sorted((page.name.rsplit("/", 1)[1], page.ok) for page in pages) == [
+        ("broken", False),
+        ("good", True),
+    ]
+    assert pstats.Stats(output).total_calls > 0
@@ -0,0 +1,90 @@
+from datetime import datetime, timedelta
+
+import pytest
+
+from bc_agent.db import sqlite_db
+from bc_agent.music_data import (
+    decode_cursor,
+    encode_cursor,
+    get_releases_by_date,
+    get_releases_page,
+    iter_release_pages,
+)
+
+START = datetime(2023, 1, 1)
+
+
+@pytest.fixture
+def releases(db_name):
+    with sqlite_db(db_name) as conn:
+        conn.execute("INSERT INTO artists (id, nickname) VALUES (1, 'artist')")
+        # pairs of releases share a date to exercise the id tie breaker
+        conn.executemany(
+            "INSERT INTO releases (id, artist_id, title, release_date, link) VALUES (?, 1, ?, ?, ?)",
+            [
+                (i, f"release {i}", START + timedelta(days=i // 2), f"link{i}")
+                for i in range(1, 11)
+            ],
+        )
+
+
+@pytest.mark.usefixtures("releases")
+def test_keyset_pages(db_name):
+    releases, after = get_releases_page("20230101", db_name, limit=3)
+    assert [r.title for r in releases] == ["release 10", "release 9", "release 8"]
+    releases, after = get_releases_page("20230101", db_name, after, limit=3)
+    assert [r.title for r in releases] == ["release 7", "release 6", "release 5"]
+
+    pages = list(iter_release_pages("20230101", db_name, page_size=3))
+    assert [len(page) for page in pages] == [3, 3, 3, 1]
+    titles = [r.title for page in pages for r in page]
+    assert titles == [f"release {i}" for i in range(10, 0, -1)]
+
+
+@pytest.mark.usefixtures("releases")
+def test_get_releases_by_date(db_name):
+    releases = get_releases_by_date("20230104", db_name)
+    assert [r.title for r in releases] == [f"release {i}" for i in range(10, 5, -1)]
+    assert releases[0].artist == "artist"
+    assert releases[0].release_date == START + timedelta(days=5)
+
+
+def test_cursor_round_trip():
+    key = ("2023-01-05 00:00:00", 10)
+    assert decode_cursor(encode_cursor(key)) == key
+    with pytest.raises(ValueError):
+        decode_cursor("not a cursor")
+
+
+@pytest.mark.usefixtures("releases")
+def test_releases_with_tracks(db_name):
+    with sqlite_db(db_name) as conn:
+        # inserted out of order, releases 1 to 4 get i tracks each
+        conn.executemany(
+            "INSERT INTO tracks (release_id, number, title, duration, link) VALUES (?, ?, ?, '1:00', ?)",
+            [
+                (i, n, f"track {i}.{n}", f"link{i}.{n}")
+                for n in range(4, 0, -1)
+                for i in range(1, 5)
+                if n <= i
+            ],
+        )
+        statements = []
+        conn.set_trace_callback(statements.append)
+    try:
+        releases, _ = get_releases_page("20230101", db_name, limit=8, tracks=True)
+    finally:
+        with sqlite_db(db_name) as conn:
+            conn.set_trace_callback(None)
+
+    assert [len(r.tracks) for r in releases] == [0, 0, 0, 0, 0, 0, 4, 3]
+    assert [t.title for t in releases[-1].tracks] == [
+        "track 3.1",
+        "track 3.2",
+        "track 3.3",
+    ]
+    assert sum("FROM tracks" in statement for statement in statements) == 1
+
+    releases = get_releases_by_date("20230101", db_name, tracks=True)
+    assert [len(r.tracks) for r in releases[-4:]] == [4, 3, 2, 1]
+    assert get_releases_by_date("20230101", db_name)[-1].tracks is None
@@ -0,0 +1,54 @@
+from datetime import datetime, timedelta
+
+from bc_agent.db import sqlite_db
+from bc_agent.scheduler import (
+    DEFAULT_INTERVAL,
+    MAX_INTERVAL,
+    MIN_INTERVAL,
+    check_interval,
+    due_artists,
+)
+
+NOW = datetime(2023, 6, 1)
+
+
+def weekly(count, last=NOW):
+    return [last - timedelta(weeks=i) for i in range(count)]
+
+
+def test_frequent_releases_are_checked_often():
+    assert check_interval(weekly(10), NOW) == timedelta(weeks=1) / 4
+
+
+def test_quiet_artists_are_checked_rarely():
+    dates = weekly(10, last=NOW - timedelta(days=5 * 365))
+    assert check_interval(dates, NOW) == MAX_INTERVAL
+
+
+def test_bounds():
+    dates = [NOW - timedelta(hours=i) for i in range(10)]
+    assert check_interval(dates, NOW) == MIN_INTERVAL
+    assert check_interval([], NOW) == DEFAULT_INTERVAL
+
+
+def test_due_artists(db_name):
+    with sqlite_db(db_name) as conn:
+        conn.executemany(
+            "INSERT INTO artists (id, nickname, last_checked) VALUES (?, ?, ?)",
+            [
+                (1, "new", None),
+                (2, "weekly", NOW - timedelta(days=3)),
+                (3, "quiet", NOW - timedelta(days=3)),
+                (4, "overdue", NOW - timedelta(days=60)),
+            ],
+        )
+        conn.executemany(
+            "INSERT INTO releases (artist_id, release_date, link) VALUES (?, ?, ?)",
+            [(2, date, f"w{i}") for i, date in enumerate(weekly(10))]
+            + [
+                (3, date, f"q{i}")
+                for i, date in enumerate(weekly(10, NOW.replace(2015)))
+            ],
+        )
+
+    assert due_artists(db_name, NOW) == ["new", "overdue", "weekly"]
@@ -0,0 +1,52 @@
+import os
+import subprocess
+import sys
+from pathlib import Path
+
+import bc_agent
+
+# Cumulative import time of bc_agent.cli in microseconds, about 50ms on a
+# laptop, most of it click. Importing the crawler adds some 250ms.
+IMPORT_BUDGET_US = 150_000
+HEAVY_MODULES = [
+    "bc_agent.music_data",
+    "bc_agent.model",
+    "bs4",
+    "fastapi",
+    "pydantic",
+    "requests",
+    "tabulate",
+]
+
+
+def run_python(*args: str) -> subprocess.CompletedProcess:
+    src = str(Path(bc_agent.__file__).parent.parent)
+    env = dict(os.environ, PYTHONPATH=src)
+    return subprocess.run(
+        [sys.executable, *args], env=env, capture_output=True, text=True, check=True
+    )
+
+
+def cli_import_time() -> int:
+    stderr = run_python("-X", "importtime", "-c", "import bc_agent.cli").stderr
+    last = stderr.strip().splitlines()[-1]
+    assert last.endswith("| bc_agent.cli"), last
+    return int(last.split("|")[1])
+
+
+def test_cli_does_not_import_heavy_modules():
+    code = (
+        "import sys, bc_agent.cli\n"
+        f"print(','.join(m for m in {HEAVY_MODULES!r} if m in sys.modules))"
+    )
+    assert run_python("-c", code).stdout.strip() == ""
+
+
+def test_cli_import_time_budget():
+    # best of three, the first run may pay for cold file caches
+    best = min(cli_import_time() for _ in range(3))
+    assert best < IMPORT_BUDGET_US, f"importing bc_agent.cli took {best / 1000:.0f}ms"
+
+
+def test_cli_help():
+    assert "Just the CLI." in run_python("-m", "bc_agent.cli", "--help").stdout
@@ -0,0 +1,138 @@
+from datetime import timedelta
+from unittest.mock import patch
+
+import pytest
+from fastapi.testclient import TestClient
+
+from bc_agent import api, db
+from bc_agent.artists import create_artist, delete_artist, delete_artists
+from bc_agent.db import close_connections, sqlite_db
+from bc_agent.music_data import get_releases_by_date
+from bc_agent.search import search
+from bc_agent.stats import (
+    get_artist_stats,
+    get_catalogue_stats,
+    get_release_stats,
+    rebuild_stats,
+)
+from bc_agent.writer import CrawlResult
+
+from conftest import NOW, release, write
+
+pytestmark = pytest.mark.usefixtures("artists")
+
+
+def stats_of(db_name):
+    return (
+        get_catalogue_stats(db_name),
+        get_artist_stats(db_name, 1),
+        get_artist_stats(db_name, 2),
+        [get_release_stats(db_name, release_id) for release_id in (1, 2, 3)],
+    )
+
+
+def test_stats_follow_new_releases(db_name):
+    catalogue = get_catalogue_stats(db_name)
+    assert (catalogue.releases, catalogue.tracks, catalogue.duration_seconds) == (
+        0,
+        0,
+        0,
+    )
+    assert catalogue.average_track_seconds is None
+    assert get_artist_stats(db_name, 1).releases == 0
+
+    write(db_name, CrawlResult(1, [release("x", durations=[100, 200])], NOW))
+    write(
+        db_name,
+        CrawlResult(1, [release("y", durations=[300, None], days=-5)], NOW),
+        CrawlResult(2, [release("z")], NOW),
+    )
+
+    catalogue = get_catalogue_stats(db_name)
+    assert (catalogue.releases, catalogue.tracks, catalogue.duration_seconds) == (
+        3,
+        4,
+        600,
+    )
+    assert catalogue.average_track_seconds == 200
+
+    artist = get_artist_stats(db_name, 1)
+    assert (artist.nickname, artist.releases, artist.tracks) == ("a", 2, 4)
+    assert artist.duration_seconds == 600
+    assert artist.first_release == NOW - timedelta(days=5)
+    assert artist.last_release == NOW
+
+    x, y, z = [get_release_stats(db_name, release_id) for release_id in (1, 2, 3)]
+    assert (x.tracks, x.duration_seconds, x.average_track_seconds) == (2, 300, 150)
+    assert (y.tracks, y.duration_seconds, y.average_track_seconds) == (2, 300, 300)
+    assert (z.artist_id, z.tracks, z.average_track_seconds) == (2, 0, None)
+    assert get_release_stats(db_name, 4) is None
+
+    incremental = stats_of(db_name)
+    rebuild_stats(db_name)
+    assert stats_of(db_name) == incremental
+
+
+def test_deleted_artists_have_no_stats(db_name):
+    write(db_name, CrawlResult(1, [release("x", durations=[100])], NOW))
+    write(db_name, CrawlResult(2, [release("z", durations=[60, 30])], NOW))
+    delete_artist(db_name, 2)
+    assert get_artist_stats(db_name, 2) is None
+    assert get_release_stats(db_name, 2) is None
+    catalogue = get_catalogue_stats(db_name)
+    assert (catalogue.releases, catalogue.tracks, catalogue.duration_seconds) == (
+        1,
+        1,
+        100,
+    )
+
+
+def test_readded_artists_get_their_releases_back(db_name):
+    write(db_name, CrawlResult(2, [release("z", durations=[60])], NOW))
+    delete_artists(db_name, ids=[2])
+    assert search(db_name, "z")[0] == []
+
+    artist = create_artist(db_name, "b")
+    write(db_name, CrawlResult(artist.id, [release("z", durations=[60])], NOW))
+    [z] = get_releases_by_date("20230101", db_name)
+    assert (z.artist, z.link) == ("b", "z")
+    assert get_artist_stats(db_name, artist.id).releases == 1
+    assert get_catalogue_stats(db_name).releases == 1
+
+
+def test_stats_of_existing_releases(db_name, monkeypatch):
+    close_connections()
+    with sqlite_db(db_name) as conn:
+        for table in ("release_stats", "artist_stats", "catalogue_stats"):
+            conn.execute(f"DROP TABLE {table}")
+        conn.execute(f"PRAGMA user_version = {db.MIGRATIONS.index(db._add_stats)}")
+        conn.execute(
+            "INSERT INTO releases (id, artist_id, link, release_date) VALUES (1, 1, 'x', ?)",
+            (NOW,),
+        )
+        conn.executemany(
+            "INSERT INTO tracks (release_id, number, duration_seconds) VALUES (1, ?, ?)",
+            [(1, 60), (2, 90)],
+        )
+    close_connections()
+
+    assert get_release_stats(db_name, 1).duration_seconds == 150
+    assert get_artist_stats(db_name, 1).last_release == NOW
+    assert get_catalogue_stats(db_name).tracks == 2
+
+
+def test_stats_routes(db_name):
+    write(db_name, CrawlResult(1, [release("x", durations=[100, 200])], NOW))
+    client = TestClient(api.app)
+    with patch.object(api, "DB_NAME", db_name):
+        assert client.get("/stats").json() == {
+            "releases": 1,
+            "tracks": 2,
+            "duration_seconds": 300,
+            "average_track_seconds": 150.0,
+        }
+        response = client.get("/stats/artists/1")
+        assert response.json()["last_release"] == NOW.isoformat()
+        assert client.get("/stats/releases/1").json()["tracks"] == 2
+        assert client.get("/stats/artists/3").status_code == 404
+        assert client.get("/stats/releases/2").status_code == 404
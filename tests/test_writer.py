@@ -0,0 +1,44 @@
+import pytest
+
+from bc_agent.db import sqlite_db
+from bc_agent.writer import CrawlResult, ReleaseWriter, write_results
+
+from conftest import NOW, release
+
+pytestmark = pytest.mark.usefixtures("artists")
+
+
+def test_write_results(db_name):
+    results = [
+        CrawlResult(1, [release("x", 2), release("y", 3)], NOW, etag='"1"'),
+        CrawlResult(2, [release("z", 2), release("x", 2)], NOW, grid_hash="hash"),
+    ]
+    with sqlite_db(db_name) as conn:
+        inserted = write_results(conn, results)
+        assert [r.link for r in inserted] == ["x", "y", "z"]
+        rows = conn.execute(
+            """
+            SELECT r.link, r.artist_id, COUNT(t.id) FROM releases r
+            JOIN tracks t ON t.release_id = r.id GROUP BY r.id ORDER BY r.link
+            """
+        ).fetchall()
+        assert rows == [("x", 1, 2), ("y", 1, 3), ("z", 2, 2)]
+        assert conn.execute(
+            "SELECT id, etag, grid_hash FROM artists ORDER BY id"
+        ).fetchall() == [(1, '"1"', None), (2, None, "hash")]
+
+        # Stored releases are skipped on the next write
+        assert write_results(conn, [CrawlResult(1, [release("y", 2)], NOW)]) == []
+
+
+def test_writer_flushes_on_size_and_close(db_name):
+    with ReleaseWriter(db_name, flush_size=2, flush_interval=60) as writer:
+        writer.submit(CrawlResult(1, [release("x", 2), release("y", 2)], NOW))
+        writer.submit(CrawlResult(2, [release("z", 2)], NOW))
+    assert writer.written == 3
+
+    with sqlite_db(db_name) as conn:
+        assert conn.execute("SELECT COUNT(*) FROM tracks").fetchone()[0] == 6
+
+    with pytest.raises(RuntimeError):
+        writer.submit(CrawlResult(1, [], NOW))